@@ -0,0 +1,206 @@
+"""
+Tools for financial indicators and forecasting.
+
+Analytics module computes rolling indicators (KPI) and simple forecasts over the daily financial records of
+finance.Data objects. All the indicators are computed at once for every analysed key, the daily data being stored as a
+matrix with one row per key, so refreshing hundreds of indicators over years of data only costs a few numpy passes.
+
+The results are dictionaries indexed by Key enumeration values, reduced according to the finance data date base, so
+they can directly be plotted using finance.Plot.
+"""
+
+import finance
+from finance import Key
+from finance import Field
+from scipy.signal import lfilter
+from utilities import *
+
+
+class Data:
+    """
+    Data class represents daily financial records of some keys and provides indicators and forecasting features.
+
+    Attributes:
+        data (finance.Data): Financial records to analyse
+        keys (list): Keys to analyse, values of Key enumeration
+        values (numpy.ndarray): Absolute daily values with shape (keys, covered days)
+    """
+
+    keys = enum_value([[Key.flight, Key.sfs, Key.cka, Key.lap, Key.lpa]])[0]
+
+    def __init__(self, data, keys=None):
+        """
+        Constructs a Data object from financial records.
+
+        Parameters:
+            data (finance.Data): Financial records to analyse
+            keys (list): Keys to analyse, if None flight revenue, salaries, checks A and loans are analysed
+        """
+        self.data = data
+        self.keys = Data.keys if keys is None else keys
+        self.values = np.zeros((len(self.keys), data.base.covered))
+        for k in range(0, len(self.keys)):
+            try:
+                self.values[k] = np.abs(data.fields[self.keys[k]][Field.data.value])
+            except KeyError:
+                continue
+
+    def rolling(self, window=7, reduce=True):
+        """
+        Computes rolling averages.
+
+        The first window - 1 days are averaged over the available days.
+
+        Parameters:
+            window (int): Number of days to average
+            reduce (bool): If True the result is averaged over the periods of the date base
+
+        Returns:
+            Dictionary of rolling averages indexed by keys
+        """
+        cumsum = np.cumsum(self.values, axis=1)
+        y = cumsum.copy()
+        y[:, window:] -= cumsum[:, :-window]
+        y /= np.minimum(np.arange(1, self.data.base.covered + 1), window)
+        return self._indexed(y, reduce)
+
+    def smooth(self, alpha=0.3, reduce=True):
+        """
+        Computes exponential smoothing s[t] = alpha * y[t] + (1 - alpha) * s[t - 1].
+
+        Parameters:
+            alpha (float): Smoothing factor between 0 and 1, 1 means no smoothing
+            reduce (bool): If True the result is averaged over the periods of the date base
+
+        Returns:
+            Dictionary of smoothed data indexed by keys
+        """
+        return self._indexed(self._smooth(self.values, alpha), reduce)
+
+    def delta(self, lag=7, reduce=True):
+        """
+        Computes relative variation of rolling averages, eg. week-over-week deltas when lag=7.
+
+        Parameters:
+            lag (int): Number of days between compared values, also used as rolling window
+            reduce (bool): If True the result is averaged over the periods of the date base
+
+        Returns:
+            Dictionary of relative variations indexed by keys. Variations are 0 when not defined.
+        """
+        rolling = np.array(list(self.rolling(lag, reduce=False).values()))
+        y = np.zeros(rolling.shape)
+        np.divide(rolling[:, lag:] - rolling[:, :-lag], rolling[:, :-lag],
+                  out=y[:, lag:], where=rolling[:, :-lag] != 0.)
+        return self._indexed(y, reduce)
+
+    def seasonality(self, season=7):
+        """
+        Computes additive seasonal profile.
+
+        The profile is the average deviation from the centered rolling average for each day of the season.
+
+        Parameter:
+            season (int): Number of days of the season
+
+        Returns:
+            Array of seasonal deviations with shape (keys, season). Column k is the deviation of days t
+            such that t % season == k
+        """
+        trend = np.array(list(self.rolling(season, reduce=False).values()))
+        shift = season // 2
+        deviation = self.values[:, :-shift or None] - trend[:, shift:]
+        phase = np.arange(0, deviation.shape[1]) % season
+        count = np.bincount(phase, minlength=season)
+        profile = np.array([np.bincount(phase, row, minlength=season) for row in deviation]) / np.maximum(count, 1)
+        return profile - profile.mean(axis=1, keepdims=True)
+
+    def forecast(self, horizon=28, season=7, alpha=0.3):
+        """
+        Computes seasonal forecast of the keys.
+
+        The data is deseasonalized with the seasonal profile, then exponentially smoothed. The forecast is
+        the last smoothed level plus the mean trend over the last season, seasonal profile being added back.
+
+        Parameters:
+            horizon (int): Number of days to forecast
+            season (int): Number of days of the season
+            alpha (float): Smoothing factor used to compute level and trend
+
+        Returns:
+            dates: datetime64 array of forecast days
+            y: Dictionary of forecast daily values indexed by keys
+        """
+        covered = self.data.base.covered
+        profile = self.seasonality(season)
+        phase = np.arange(0, covered + horizon) % season
+
+        level = self._smooth(self.values - profile[:, phase[:covered]], alpha)
+        trend = (level[:, -1] - level[:, -min(season, covered - 1) - 1]) / min(season, covered - 1)
+
+        steps = np.arange(1, horizon + 1)
+        y = level[:, -1:] + trend[:, np.newaxis] * steps + profile[:, phase[covered:]]
+        dates = self.data.base.days[-1] + steps
+        return dates, self._indexed(np.maximum(y, 0.), reduce=False)
+
+    def _smooth(self, values, alpha):
+        initial = (1. - alpha) * values[:, :1]
+        y, _ = lfilter([alpha], [1., alpha - 1.], values, axis=1, zi=initial)
+        return y
+
+    def _indexed(self, y, reduce):
+        if reduce:
+            y = self.data.base.reduce(y, avg=True)
+        return dict(zip(self.keys, y))
+
+
+class Plot(finance.Plot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for every result that can be computed with Data objects. Figures are drawn
+    using finance plotting functions and rendered along with finance figures.
+    """
+
+    @staticmethod
+    def rolling(data, window=7):
+        """Plots rolling averages of the keys"""
+        x = Plot.date_ticks(data.data)
+        y = Plot.scale(data.rolling(window))
+        label = Plot.labels(data)
+        Plot.keys(x, y, "Date MM-DD", "Millions $", label,
+                  title="Rolling average {:d} days".format(window), date=data.data.base.end_date())
+
+    @staticmethod
+    def delta(data, lag=7):
+        """Plots relative variations of the keys"""
+        x = Plot.date_ticks(data.data)
+        y = Plot.scale(data.delta(lag), 1.e-2)
+        label = Plot.labels(data)
+        Plot.keys(x, y, "Date MM-DD", "Percent %", label,
+                  title="Delta {:d} days".format(lag), date=data.data.base.end_date())
+
+    @staticmethod
+    def forecast(data, horizon=28, season=7, history=56):
+        """Plots the last history days of the keys followed by their forecast over horizon days"""
+        dates, forecast = data.forecast(horizon, season)
+        history = min(history, data.data.base.covered)
+        days = np.concatenate([data.data.base.days[-history:], dates])
+        x = list(map(lambda t: t.strftime("%m-%d"), days.astype("datetime64[s]").astype(datetime)))
+
+        y, label = {}, {}
+        for k in range(0, len(data.keys)):
+            key = data.keys[k]
+            y[key] = np.concatenate([data.values[k, -history:], np.full(horizon, np.nan)])
+            y[key + ".forecast"] = np.concatenate([np.full(history - 1, np.nan),
+                                                   data.values[k, -1:], forecast[key]])
+            label[key] = data.data.fields.get(key, {Field.name.value: key})[Field.name.value]
+            label[key + ".forecast"] = label[key] + " forecast"
+
+        Plot.keys(x, Plot.scale(y), "Date MM-DD", "Millions $", label,
+                  title="Forecast {:d} days".format(horizon), date=data.data.base.end_date())
+
+    @staticmethod
+    def labels(data):
+        """Returns labels of the keys of given data"""
+        return {key: data.data.fields.get(key, {Field.name.value: key})[Field.name.value] for key in data.keys}
@@ -0,0 +1,392 @@
+"""
+Benchmark of the planning, scraping and finance hot paths.
+
+Benchmark module times the main entry points of the project over synthetic networks, fleets and financial histories
+of increasing sizes. For each entry point and size, the best time over a few runs and the peak of memory allocated
+during a run are measured. The scaling of each entry point is the slope of its time against its size in log-log scale.
+
+Results can be stored in a baseline file, so the next runs are compared to it and regressions are reported.
+
+Run the script from the project root, eg. to store a baseline and then compare a modified tree to it:
+```
+python benchmark.py --save
+python benchmark.py
+```
+"""
+
+from utilities import *
+from finance import Key
+from finance import Field
+from model import *
+
+import argparse
+import copy
+import csv
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+import finance
+import openflights
+import scheduling
+import scrap
+import synthetic
+import numpy as np
+
+
+class Synthetic:
+    """
+    Static adapter of synthetic.Generator for the benchmarks
+
+    Networks, fleets and financial histories are generated from the openflights airports and the scrapped lines and
+    planes, see synthetic module, so the benchmarks run on data distributed like the load and scaling tests. Every
+    generation is seeded so the benchmarks always run on the same data. Only the airports CSV file measuring the
+    openflights parser is written here, since it must be in openflights format rather than in scrap.JSON format.
+
+    Attributes:
+        generators (dict): Generators indexed by seed
+    """
+
+    generators = {}
+
+    @classmethod
+    def generator(cls, seed=0):
+        """Returns the generator of seed, built once from the scrapped data"""
+        try:
+            return cls.generators[seed]
+        except KeyError:
+            cls.generators[seed] = synthetic.Generator(seed, catalogue=dict(scrap.JSON.planes))
+            return cls.generators[seed]
+
+    @classmethod
+    def lines(cls, count, hubs=None, seed=0):
+        """
+        Generates count lines shared by hubs, a hub every 2000 lines if None. Returns lines dictionary indexed by hub
+        and destination
+        """
+        hubs = max(2, int(np.ceil(count / 2000.))) if hubs is None else hubs
+        return cls.generator(seed).lines(hubs, count)
+
+    @classmethod
+    def planes(cls, count, seed=0):
+        """Draws count plane models, at most the scrapped ones. Returns planes dictionary indexed by model"""
+        return cls.generator(seed).planes(count)
+
+    @classmethod
+    def planning(cls, lines, count, seed=0):
+        """Generates a planning of count planes, each plane flying a single line as much as it can"""
+        models = list(cls.planes(10, seed).values())
+        line_list = [(hub_iata, dst_iata, line) for hub_iata, hub in lines.items() for dst_iata, line in hub.items()]
+        planes, schedule = {}, {}
+        for k in range(0, count):
+            hub_iata, dst_iata, line = line_list[k % len(line_list)]
+            plane = copy.copy(models[k % len(models)])
+            plane.range = np.infty
+            plane.id = "{}-{}-{:d}".format(hub_iata, dst_iata, k + 1)
+            planes[plane.id] = plane
+            schedule[plane.id] = [[hub_iata + "-" + dst_iata] * plane.flights_per_day(line.distance, 1.)] * 7
+        return scheduling.Planning(lines, planes, schedule)
+
+    @classmethod
+    def history(cls, days, seed=0):
+        """Generates a finance.Data object containing days of daily financial records"""
+        records = cls.generator(seed).records(days)
+        data = finance.Data()
+        fields = {Key.__date__: datetime(2020, 1, 1).isoformat()}
+        for key in Key:
+            if key.value in records:
+                fields[key.value] = {Field.name.value: key.name, Field.data.value: records[key.value]}
+        data.fields = fields
+        data.base = DateBase(covered=days, date=datetime(2020, 1, 1))
+        data.base.set()
+        return data
+
+    @staticmethod
+    def airports_csv(filename, count, seed=0):
+        """Writes count airports to filename using openflights CSV format"""
+        random = np.random.RandomState(seed)
+        with open(filename, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            for k in range(0, count):
+                writer.writerow([k, "Airport {:d}".format(k), "City {:d}".format(k), "Country", "A{:d}".format(k),
+                                 "AAA{:d}".format(k), random.uniform(-90., 90.), random.uniform(-180., 180.), 100,
+                                 random.randint(-12, 12), "U", "Europe/Paris", "airport", "OurAirports"])
+
+
+class Benchmark:
+    """
+    Static interface of the benchmarks
+
+    Each benchmark is a static method named after the entry point it measures. Given a size, it prepares the data and
+    returns a function running the entry point once, so preparation is not measured. Temporary files are removed
+    once the function is released.
+
+    Attributes:
+        sizes (dict): Sizes of each benchmark, indexed by benchmark name
+        full_sizes (dict): Sizes of each benchmark including the largest ones
+        repeat (int): Maximum number of runs of each benchmark, the best time is kept
+        max_time (float): Benchmarks are run only once when a run exceeds max_time in seconds
+        threshold (float): Time ratio with baseline above which a regression is reported
+    """
+
+    BASELINE = "benchmark.json"
+
+    sizes = {
+        "profitability": [(10, 10), (10, 100), (100, 100), (100, 1000)],
+        "flat_match": [10, 50],
+        "openflights": [1000, 10000],
+        "scrap_json": [100, 1000],
+        "finance_flow": [365, 1825, 3650]
+    }
+
+    full_sizes = {
+        "profitability": [(10, 10), (10, 100), (100, 100), (100, 1000), (1000, 1000), (1000, 5000)],
+        "flat_match": [10, 50, 100, 1000],
+        "openflights": [1000, 10000, 100000],
+        "scrap_json": [100, 1000, 10000],
+        "finance_flow": [365, 1825, 3650, 18250]
+    }
+
+    repeat = 3
+    max_time = 1.
+    threshold = 1.25
+
+    @staticmethod
+    def profitability(size):
+        lines_count, planes_count = size
+        plan = Synthetic.planning(Synthetic.lines(lines_count), planes_count)
+
+        def run():
+            plan.clear()
+            plan.profitability()
+        return run
+
+    @staticmethod
+    def flat_match(size):
+        lines = Synthetic.lines(size)
+        planes = list(Synthetic.planes(3).values())
+        return lambda: scheduling.FlatPlanning.match(lines, planes)
+
+    @staticmethod
+    def openflights(size):
+        directory = tempfile.TemporaryDirectory()
+        Synthetic.airports_csv(os.path.join(directory.name, "airports.csv"), size)
+
+        def run():
+            root = openflights.OPENFLIGHTS_ROOT
+            openflights.OPENFLIGHTS_ROOT = directory.name + "/"
+            try:
+                openflights._read_airports()
+            finally:
+                openflights.OPENFLIGHTS_ROOT = root
+        return run
+
+    @staticmethod
+    def scrap_json(size):
+        directory = tempfile.TemporaryDirectory()
+        saved = (dict(scrap.JSON.planes), dict(scrap.JSON.airports), dict(scrap.JSON.lines))
+        lines = Synthetic.lines(size)
+        scrap.JSON.planes.clear()
+        scrap.JSON.planes.update(Synthetic.planes(100))
+        scrap.JSON.airports.clear()
+        scrap.JSON.airports.update({line.hub.iata: line.hub for hub in lines.values() for line in hub.values()})
+        scrap.JSON.airports.update({line.dst.iata: line.dst for hub in lines.values() for line in hub.values()})
+        scrap.JSON.lines.clear()
+        scrap.JSON.lines.update(lines)
+        scrap.JSON.write(directory.name + "/")
+
+        def run():
+            try:
+                scrap.JSON.read(directory.name + "/")
+            finally:
+                for attribute, values in zip([scrap.JSON.planes, scrap.JSON.airports, scrap.JSON.lines], saved):
+                    attribute.clear()
+                    attribute.update(values)
+        run()
+        return run
+
+    @staticmethod
+    def finance_flow(size):
+        data = Synthetic.history(size)
+
+        def run():
+            data.invalidate()
+            data.flow()
+        return run
+
+    @classmethod
+    def measure(cls, run):
+        """
+        Measures a benchmark
+
+        Parameters:
+            run (function): Function running the entry point once
+
+        Returns:
+            Dictionary with best "time" in seconds and "peak" of allocated memory in bytes
+        """
+        times = []
+        while len(times) < cls.repeat and (len(times) == 0 or times[-1] < cls.max_time):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"time": min(times), "peak": peak}
+
+    @classmethod
+    def run(cls, names=None, full=False, verbose=True):
+        """
+        Runs benchmarks over their sizes
+
+        Parameters:
+            names (list): Names of the benchmarks to run, if None all the benchmarks are run
+            full (bool): If True, the largest sizes are also run
+            verbose (bool): If True, prints each result as soon as it is measured
+
+        Returns:
+            results: Dictionary of measures indexed by benchmark name and size label eg. "100x1000". Each measure also
+            contains the "size" of the benchmark, ie. the product of its dimensions
+        """
+        sizes = cls.full_sizes if full else cls.sizes
+        results = {}
+        for name in (sizes.keys() if names is None else names):
+            results[name] = {}
+            for size in sizes[name]:
+                dims = size if isinstance(size, tuple) else (size,)
+                label = "x".join(map(str, dims))
+                results[name][label] = cls.measure(getattr(cls, name)(size))
+                results[name][label]["size"] = int(np.prod(dims))
+                if verbose:
+                    measure = results[name][label]
+                    print("{:<16}{:>12}{:>12.2f} ms{:>10.1f} MB".format(name, label, 1.e3 * measure["time"],
+                                                                          measure["peak"] / 1.e6))
+        return results
+
+    @staticmethod
+    def scaling(results):
+        """
+        Computes scaling exponents of the benchmarks
+
+        Returns:
+            Dictionary of exponents indexed by benchmark name, eg. 1 means the time is linear with the size
+        """
+        exponents = {}
+        for name, measures in results.items():
+            sizes = np.array([measure["size"] for measure in measures.values()], dtype=float)
+            times = np.array([measure["time"] for measure in measures.values()], dtype=float)
+            if len(np.unique(sizes)) < 2:
+                continue
+            exponents[name] = np.polyfit(np.log(sizes), np.log(np.maximum(times, 1.e-9)), 1)[0]
+        return exponents
+
+    @classmethod
+    def compare(cls, results, baseline):
+        """
+        Compares results to a baseline
+
+        Returns:
+            ratios: Dictionary of time ratios indexed by benchmark name and size label, only measures found in the
+            baseline are compared
+            regressions: List of (name, label, ratio) of measures slower than the baseline by more than threshold
+        """
+        ratios = {}
+        regressions = []
+        for name, measures in results.items():
+            ratios[name] = {}
+            for label, measure in measures.items():
+                try:
+                    ratios[name][label] = measure["time"] / baseline[name][label]["time"]
+                except (KeyError, ZeroDivisionError):
+                    continue
+                if ratios[name][label] > cls.threshold:
+                    regressions.append((name, label, ratios[name][label]))
+        return ratios, regressions
+
+    @classmethod
+    def save(cls, results, filename=None):
+        """Writes results to the baseline file along with the date of the run"""
+        with open(cls.BASELINE if filename is None else filename, "w") as json_file:
+            json.dump({"date": datetime.now().isoformat(), "results": results}, json_file, indent=4)
+
+    @classmethod
+    def load(cls, filename=None):
+        """Reads results from the baseline file. Returns None if there is no baseline"""
+        try:
+            with open(cls.BASELINE if filename is None else filename, "r") as json_file:
+                return json.load(json_file)["results"]
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def report(cls, results, baseline=None):
+        """Prints scaling exponents and comparison with baseline. Returns the list of regressions"""
+        print("\nScaling exponents")
+        for name, exponent in cls.scaling(results).items():
+            print("{:<16}{:>12.2f}".format(name, exponent))
+
+        if baseline is None:
+            return []
+
+        ratios, regressions = cls.compare(results, baseline)
+        print("\nTime ratio with baseline")
+        for name, measures in ratios.items():
+            for label, ratio in measures.items():
+                flag = " REGRESSION" if ratio > cls.threshold else ""
+                print("{:<16}{:>12}{:>12.2f}{}".format(name, label, ratio, flag))
+        return regressions
+
+
+class Plot(GenericPlot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for benchmark results.
+    """
+
+    RENDER_ROOT = GenericPlot.RENDER_ROOT + "benchmark/"
+
+    @classmethod
+    def scaling(cls, results, baseline=None):
+        """Plots time against size of each benchmark in log-log scale, along with baseline if given"""
+        curves = {}
+        for name, measures in results.items():
+            curves[name] = [[measure["size"] for measure in measures.values()],
+                            [measure["time"] for measure in measures.values()]]
+            if baseline is not None and name in baseline:
+                curves[name + " (baseline)"] = [[measure["size"] for measure in baseline[name].values()],
+                                                [measure["time"] for measure in baseline[name].values()]]
+
+        cls.batch(_draw_scaling, [((curves,), {"xl": "Size", "yl": "Time (s)", "title": "Benchmark scaling"})])
+
+
+def _draw_scaling(fig, curves):
+    ax = fig.gca()
+    for name, (sizes, times) in curves.items():
+        ax.loglog(sizes, times, "--o" if name.endswith("(baseline)") else "-o", label=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks planning, scraping and finance hot paths")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all if none")
+    parser.add_argument("--full", action="store_true", help="Also run the largest sizes")
+    parser.add_argument("--save", action="store_true", help="Store the results as baseline")
+    parser.add_argument("--plot", action="store_true", help="Plot scaling curves")
+    args = parser.parse_args()
+
+    bench_results = Benchmark.run(args.names or None, args.full)
+    bench_baseline = Benchmark.load()
+    bench_regressions = Benchmark.report(bench_results, bench_baseline)
+
+    if args.plot:
+        Plot.scaling(bench_results, bench_baseline)
+
+    if args.save:
+        Benchmark.save(bench_results)
+
+    if len(bench_regressions) > 0:
+        sys.exit(1)
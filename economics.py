@@ -0,0 +1,300 @@
+"""
+Tools for unit economics of a network and a catalogue of planes.
+
+Flight time, flights per day, fuel, revenue and tax of a flight only depend on the line and the plane model flying it.
+Economics module computes theses quantities once for every line of a network and every model of a catalogue as arrays
+indexed by line and model, so plannings, matching and purchase planning read them instead of computing them again for
+each plane and each line.
+
+The economic conditions, fuel price, loan terms, fill curve and taxes, are gathered in an immutable Context given to
+plannings and tables instead of module globals, so several scenarios can be evaluated side by side.
+
+Tables are identified by a hash of the lines, the models, the context, the fill ratio and the additional time. They
+are kept in memory and can be persisted on demand in scrap/economics/, a persisted table being built again when its
+hash does not match anymore.
+
+Eg:
+```python
+table = Table.load(Context(fuel_price=0.4), filename="network.npz")
+table.flights[table.line_index[("HYD", "ISB")], table.model_index["737-700"]]
+```
+"""
+
+from collections import namedtuple
+from model import *
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+# scrap is imported only when scrapped data is used, importing it loads scrap/json/
+ECONOMICS_PATH = "scrap/economics/"
+
+liters_barrel = 159.0  # L/barrel
+petrol_price = 53.53 / liters_barrel  # $/L
+
+
+class Context(namedtuple("Context", ["fuel_price", "loan_rate", "loan_period", "fill", "taxes"])):
+    """
+    Context class represents the economic conditions a planning is evaluated in
+
+    Contexts are immutable and hashable. Planning indicators are cached per context, so several contexts can be
+    evaluated side by side on the same planning, in threads or processes, without changing any global value.
+
+    The fill curve gives the fill ratio of a line by its distance. It is made of (distance in km, fill ratio) points,
+    linearly interpolated and held constant outside of the points. Without fill curve, the fill ratio of the planning is
+    used for every line.
+
+    Attributes:
+        fuel_price (float): Fuel price in $/L
+        loan_rate (float): Loan rate applied when purchasing planes, lines and hubs
+        loan_period (int): Duration of repayment in weeks
+        fill (tuple): Fill curve, tuple of (distance, fill ratio) couples sorted by distance, None without fill curve
+        taxes (tuple): Taxes in $ per flight replacing the taxes of lines, tuple of ((hub, destination), tax) couples
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, fuel_price=petrol_price, loan_rate=0.01, loan_period=30, fill=None, taxes=None):
+        """
+        Constructs a Context
+
+        Parameters:
+            fuel_price (float): Fuel price in $/L
+            loan_rate (float): Loan rate applied when purchasing planes, lines and hubs
+            loan_period (int): Duration of repayment in weeks
+            fill (float/dict): Fill ratio of every line, or fill curve as fill ratios indexed by distance in km. If
+            None, the fill ratio of the planning is used
+            taxes (dict): Taxes in $ per flight indexed by (hub, destination) IATA couple, replacing the taxes of lines
+        """
+        if fill is not None:
+            points = [(0., fill)] if np.isscalar(fill) else (fill.items() if isinstance(fill, dict) else fill)
+            fill = tuple(sorted((float(distance), float(ratio)) for distance, ratio in points))
+
+        taxes = {} if taxes is None else taxes
+        taxes = tuple(sorted((tuple(line), float(tax)) for line, tax in dict(taxes).items()))
+        return super().__new__(cls, float(fuel_price), float(loan_rate), loan_period, fill, taxes)
+
+    def fills(self, distance, default):
+        """Computes the fill ratio at distance in km, a float or an array. Returns default without fill curve"""
+        if self.fill is None:
+            return np.full(np.shape(distance), default) if np.ndim(distance) > 0 else default
+
+        points = np.array(self.fill)
+        ratio = np.interp(distance, points[:, 0], points[:, 1])
+        return ratio if np.ndim(distance) > 0 else float(ratio)
+
+    def line_fills(self, lines, default):
+        """Computes the fill ratio of lines indexed by hub and destination. Returns a dictionary with same indices"""
+        return {hub_iata: {dst_iata: self.fills(line.distance, default) for dst_iata, line in hub.items()}
+                for hub_iata, hub in lines.items()}
+
+    def line_taxes(self, lines):
+        """Computes the tax of lines indexed by hub and destination. Returns a dictionary with the same indices"""
+        taxes = dict(self.taxes)
+        return {hub_iata: {dst_iata: taxes.get((hub_iata, dst_iata), line.tax) for dst_iata, line in hub.items()}
+                for hub_iata, hub in lines.items()}
+
+
+class Table:
+    """
+    Table class represents the unit economics of a network and a catalogue
+
+    Quantities are given for a round trip of a plane, ie. a flight in a schedule. Quantities of models out of range of
+    a line are computed anyway, use in_range to filter them. Arrays with a market axis are ordered as model.Market.
+    Tables are shared by every reader so their arrays are read-only.
+
+    Attributes:
+        lines (list): (hub, destination) IATA couples, gives the order of the line axis
+        models (list): Plane models, gives the order of the model axis
+        line_index (dict): Index of the lines indexed by (hub, destination) IATA couple
+        model_index (dict): Index of the models indexed by model
+        digest (str): Hash of the data the table is computed from
+        fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+        add_time (float): additional time in hours for each flight
+        context (Context): Economic conditions of the table
+        distance (numpy.ndarray): Distance of the lines in km with shape (lines,)
+        fills (numpy.ndarray): Fill ratio of the lines, from the fill curve of the context, with shape (lines,)
+        tax (numpy.ndarray): Tax of the lines in $ per flight, including the context overrides, with shape (lines,)
+        acq (numpy.ndarray): Acquisition price of the new lines in $ with shape (lines,), 0 for acquired lines
+        demand (numpy.ndarray): Daily demand of the lines with shape (lines, markets)
+        ticket_price (numpy.ndarray): Ticket price of the lines in $ with shape (lines, markets)
+        pax (numpy.ndarray): Seats of the models with shape (models, markets)
+        price (numpy.ndarray): Price of the models in $ with shape (models,)
+        in_range (numpy.ndarray): True when the line is within range of the model with shape (lines, models)
+        flight_time (numpy.ndarray): One way flight time in hours, including add_time, with shape (lines, models)
+        flights (numpy.ndarray): Flights per day with shape (lines, models)
+        fuel_per_pax (numpy.ndarray): Fuel consumed by a passenger in L with shape (lines, models)
+        fuel (numpy.ndarray): Fuel consumed by a flight in L with shape (lines, models)
+        seats (numpy.ndarray): Seats filled by a flight with shape (lines, models, markets)
+        revenue (numpy.ndarray): Turnover of a flight in $ with shape (lines, models, markets)
+        cost (numpy.ndarray): Fuel and tax cost of a flight in $ with shape (lines, models)
+        tables (dict): Tables in memory indexed by hash
+        memory (int): Maximum number of tables in memory, the oldest tables are removed first
+        persist (bool): If false, tables are never written in scrap/economics/
+    """
+
+    ARRAYS = ["distance", "fills", "tax", "acq", "demand", "ticket_price", "pax", "price", "in_range", "flight_time",
+              "flights", "fuel_per_pax", "fuel", "seats", "revenue", "cost"]
+    tables = {}
+    memory = 256
+    persist = True
+
+    def __init__(self, context, lines, planes, fill=0.86, add_time=1.):
+        """
+        Computes the table of lines and planes
+
+        Parameters:
+            context (Context): Economic conditions of the table
+            lines (dict): Lines indexed by hub and destination
+            planes (dict): Planes models indexed by model
+            fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+            add_time (float): additional time in hours for each flight
+        """
+        self._init_axes([(hub_iata, dst_iata) for hub_iata, hub in lines.items() for dst_iata in hub.keys()],
+                        list(planes.keys()))
+        self.digest = Table.hash(context, lines, planes, fill, add_time)
+        self.fill = fill
+        self.add_time = add_time
+        self.context = context
+
+        taxes = context.line_taxes(lines)
+        lines = [lines[hub_iata][dst_iata] for hub_iata, dst_iata in self.lines]
+        planes = [planes[name] for name in self.models]
+        markets = [m.name for m in Market]
+
+        self.distance = np.array([line.distance for line in lines], dtype=float)
+        self.fills = context.fills(self.distance, fill)
+        self.tax = np.array([taxes[hub_iata][dst_iata] for hub_iata, dst_iata in self.lines], dtype=float)
+        self.acq = np.array([line.hub.price + line.dst.price if line.new else 0. for line in lines], dtype=float)
+        self.demand = np.array([[line.demand[m] for m in markets] for line in lines], dtype=float)
+        self.demand = self.demand.reshape(len(lines), len(markets))
+        self.ticket_price = np.array([[line.ticket_price[m] for m in markets] for line in lines], dtype=float)
+        self.ticket_price = self.ticket_price.reshape(len(lines), len(markets))
+        self.pax = np.array([[plane.pax[m] for m in markets] for plane in planes], dtype=float)
+        self.pax = self.pax.reshape(len(planes), len(markets))
+        self.price = np.array([plane.price for plane in planes], dtype=float)
+
+        speed = np.array([plane.speed for plane in planes], dtype=float)
+        cons = np.array([plane.cons for plane in planes], dtype=float)
+        plane_range = np.array([plane.range for plane in planes], dtype=float)
+
+        self.in_range = plane_range[np.newaxis, :] > self.distance[:, np.newaxis]
+        self.flight_time = self.distance[:, np.newaxis] / speed[np.newaxis, :] + add_time
+        self.flights = np.floor(24. / (2 * self.flight_time))
+        self.fuel_per_pax = 0.01 * self.distance[:, np.newaxis] * cons[np.newaxis, :]
+        self.seats = 2 * self.fills[:, np.newaxis, np.newaxis] * self.pax[np.newaxis, :, :]
+        self.fuel = self.seats.sum(axis=2) * self.fuel_per_pax
+        self.revenue = self.seats * self.ticket_price[:, np.newaxis, :]
+        self.cost = self.fuel * context.fuel_price + self.tax[:, np.newaxis]
+        self._freeze()
+
+    @classmethod
+    def load(cls, context=None, lines=None, planes=None, fill=0.86, add_time=1., filename=None):
+        """
+        Loads the table of lines and planes
+
+        The table is taken from memory when already computed, else it is read from filename when its hash matches,
+        else it is computed and written to filename.
+
+        Parameters:
+            context (Context): Economic conditions of the table, if None the default context is used
+            lines (dict): Lines indexed by hub and destination, if None scrapped lines are used
+            planes (dict): Planes models indexed by model, if None scrapped planes are used
+            fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+            add_time (float): additional time in hours for each flight
+            filename (str): Name of the file in scrap/economics/, if None the table is only kept in memory
+
+        Returns:
+            Table of lines and planes
+        """
+        if lines is None or planes is None:
+            import scrap
+            lines = scrap.JSON.lines if lines is None else lines
+            planes = scrap.JSON.planes if planes is None else planes
+        context = Context() if context is None else context
+
+        digest = cls.hash(context, lines, planes, fill, add_time)
+        try:
+            return cls.tables[digest]
+        except KeyError:
+            pass
+
+        table = None if filename is None else cls._read(ECONOMICS_PATH + filename, digest, context, fill, add_time)
+        if table is None:
+            table = Table(context, lines, planes, fill, add_time)
+            if filename is not None and cls.persist:
+                table._write(ECONOMICS_PATH + filename)
+
+        if len(cls.tables) >= cls.memory:
+            del cls.tables[next(iter(cls.tables))]
+        cls.tables[digest] = table
+        return table
+
+    @staticmethod
+    def hash(context, lines, planes, fill=0.86, add_time=1.):
+        """Returns an hexadecimal hash of the data a table is computed from. See load function for parameters"""
+        content = {
+            "lines": [dict(line.__dict__(), hub_price=line.hub.price, dst_price=line.dst.price)
+                      for hub in lines.values() for line in hub.values()],
+            "planes": [dict({k: v for k, v in vars(plane).items() if k != "id"}, model=name)
+                       for name, plane in planes.items()],
+            "parameters": [list(context), fill, add_time]
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def rows(self, lines):
+        """Returns the indices of (hub, destination) IATA couples lines as an array"""
+        return np.array([self.line_index[line] for line in lines], dtype=int)
+
+    def cols(self, models):
+        """Returns the indices of models as an array"""
+        return np.array([self.model_index[name] for name in models], dtype=int)
+
+    def _freeze(self):
+        for name in Table.ARRAYS:
+            getattr(self, name).flags.writeable = False
+
+    def _init_axes(self, lines, models):
+        self.lines = lines
+        self.models = models
+        self.line_index = {lines[k]: k for k in range(0, len(lines))}
+        self.model_index = {models[k]: k for k in range(0, len(models))}
+
+    @classmethod
+    def _read(cls, filename, digest, context, fill, add_time):
+        # Table stored in filename, None if there is no readable file or if it was computed from other data. The
+        # parameters are the ones of the digest so they are not read back
+        try:
+            with np.load(filename, allow_pickle=False) as data:
+                if str(data["digest"]) != digest:
+                    return None
+
+                table = cls.__new__(cls)
+                table._init_axes([tuple(line) for line in data["lines"].tolist()], data["models"].tolist())
+                table.digest = digest
+                table.context, table.fill, table.add_time = context, fill, add_time
+                for name in Table.ARRAYS:
+                    setattr(table, name, data[name])
+                table._freeze()
+                return table
+        except (IOError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def _write(self, filename):
+        # The table is written to a temporary file then renamed, so readers never see a partially written table
+        directory = os.path.dirname(filename)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {name: getattr(self, name) for name in Table.ARRAYS}
+        descriptor, path = tempfile.mkstemp(suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(descriptor, "wb") as table_file:
+                np.savez(table_file, digest=self.digest, lines=np.array(self.lines, dtype=str).reshape(-1, 2),
+                         models=np.array(self.models, dtype=str), **arrays)
+            os.replace(path, filename)
+        except BaseException:
+            os.remove(path)
+            raise
@@ -8,10 +8,15 @@ In order to provide a long term analysis (month, year) a local record of financi
 maintained each time you load new financial data. The file used for this purpose is main.json located at exports/ .
 Each to you load new financial data, theses new data are merged with main.json so it contains all the financial data
 from the first export you have loaded.
+
+Each time a JSON file is written, its data are also packed in a directory with the same name located at exports/ . It
+contains an index of the data and one .npy array per key. Theses arrays are memory-mapped when reading the JSON file
+so loading a date window only reads the bytes of the window whatever the length of the history.
 """
 
 import csv
 import json
+import os
 from enum import Enum
 from utilities import *
 from matplotlib.colors import rgb2hex
@@ -68,6 +73,9 @@ class Data:
     They are always stored as daily data but indicators can be obtained as average data over any period (weekly, month,
     63 days, ...) starting and ending at any time.
 
+    Indicators are computed as numpy arrays and cached until fields or base are changed, so plotting several
+    figures from the same data only computes each indicator once. The cached arrays are read-only.
+
 
     Attributes:
         filename (str): Name of the file to load. Precise relative path from exports directory in project root.
@@ -76,9 +84,13 @@ class Data:
         fields (dict): Dictionary of financial reports fields. Indexed by Key enumeration. Each value of this
         dictionary is a dictionary index by Field enumeration. The value at "data" key is an array representing
         daily cash flow for "verbose" key for the covered period
+        window (tuple): Start and end dates of the data to read, None means from the start or up to the end
+        windowed (bool): True if only a window of the file has been read. Windowed data can't be written
+        lap (float): Loan automatic payments summed over the whole file, None to sum them over the fields
     """
 
     EXPORTS_ROOT = "exports/"
+    STORE_INDEX = "index.json"
 
     keys = enum_value([
         [Key.flight, Key.cka, Key.rch, Key.lap],
@@ -94,7 +106,9 @@ class Data:
         Constructs a Data object with given filename and date base.
 
         Starts by reading the file at filename and than
-        instantiates a date base coherent with loaded data and given parameters.
+        instantiates a date base coherent with loaded data and given parameters. When reading a JSON file, only the
+        days between start and end are loaded and the date base covers the loaded days. When reading a CSV file, every
+        day is loaded and start and end bound the date base.
 
         Parameters:
             filename (str): Relative path to file to read
@@ -104,11 +118,34 @@ class Data:
             end (datetime): Ending date for indicators computing
         """
         self.filename = filename
+        self.window = (start, end)
+        self.windowed = False
+        self._cache = {}
         self.base = DateBase()
         self.fields = {}
         if filename is not None:
             self.read()
-            self.base.set(period, offset, start, end)
+            windowed = self.filename.split(".")[1] == "json"
+            self.base.set(period, offset, *((None, None) if windowed else self.window))
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields):
+        self._fields = fields
+        self.lap = None
+        self.invalidate()
+
+    @property
+    def base(self):
+        return self._base
+
+    @base.setter
+    def base(self, base):
+        self._base = base
+        self.invalidate()
 
     def __str__(self):
         return json.dumps(self.__dict__, indent=4)
@@ -123,6 +160,7 @@ class Data:
         else:
             self.filename = self.filename.replace(".json", ".csv")
 
+    @profiled()
     def read(self):
         """
         Reads file located at exports/filename where filename is the current filename of the object.
@@ -140,12 +178,14 @@ class Data:
 
         self.base.set()
 
+    @profiled()
     def write(self):
         """
         Writes file located at exports/filename where filename is the current filename of the object.
 
         If the file already exists than existing data and self data are merged (see merge function).
         """
+        assert not self.windowed
         ext = self.filename.split(".")[1]
         if ext == "json":
             self._write_json()
@@ -153,8 +193,38 @@ class Data:
             print("File format .{} not handled for writing", ext)
             raise NotImplementedError
 
+    def pack(self):
+        """
+        Packs data located in JSON file at exports/filename as memory-mappable arrays.
+
+        The arrays are written to exports/<filename without extension>/ along with an index file containing the end
+        date, the number of days covered, the loan automatic payments summed over the whole file and the verbose name
+        of each key.
+        """
+        store_path = self._store_path()
+        os.makedirs(store_path, exist_ok=True)
+        index = {
+            Key.__date__: self.base.date.isoformat(),
+            "covered": self.base.covered,
+            "lap": self._lap(),
+            "keys": {}
+        }
+        for key, field in self.fields.items():
+            if key == Key.__date__:
+                continue
+            index["keys"][key] = field[Field.name.value]
+            np.save(store_path + key + ".npy", np.asarray(field[Field.data.value], dtype=float))
+
+        with open(store_path + Data.STORE_INDEX, "w") as index_file:
+            json.dump(index, index_file, indent=4)
+
+    def invalidate(self):
+        """Clears cached indicators. Must be called when fields are modified in place"""
+        self._cache = {}
+
     def copy(self, data):
         self.fields = data.fields
+        self.lap = data.lap
         self.base = DateBase(covered=data.base.covered, date=data.base.date)
 
     def update(self):
@@ -209,10 +279,13 @@ class Data:
                 self.fields[key][Field.data.value] = list(np.concatenate([old_sub, new_sub]))
 
             self.base.reset(covered=data.base.covered + add_day + delta.days)
+            self.lap = None
+            self.invalidate()
 
         else:
             self.copy(data)
 
+    @profiled()
     def raw(self):
         """
         Indexes raw accounting data in $ reduced according to the current date base.
@@ -221,37 +294,22 @@ class Data:
              Dictionary of raw financial data sorted by Key enumeration. Each key stores an array representing
              an expense or an income over the period described by the current date base
         """
-        y = {}
-        for k in range(0, len(Data.keys)):
-            for key in Data.keys[k]:
-                y[key] = list(map(lambda t: abs(t), self.fields[key][Field.data.value]))
-
-        return self.reduce(y)
+        return dict(self._cached("raw", self._raw))
 
+    @profiled()
     def rel(self):
         """
         Indexes relative accounting data in % reduced according to the current date base.
 
+        Periods without revenue are masked, relative values are 0 for every key except flight which is 1.
+
         Returns:
              Dictionary of relative financial data sorted by Key enumeration. Each key stores an array representing
              an expense or an income over the period described by the current date base
         """
-        data = self.raw()
-        y = {}
-        for k in range(0, len(Data.keys)):
-            for key in Data.keys[k]:
-                if key == Key.__date__:
-                    continue
-                y[key] = data[key].copy()
-                for t in range(0, self.base.range):
-                    revenue = float(data[Key.flight.value][t])
-                    if revenue == 0.:
-                        y[key][t] = 0 if key != Key.flight.value else 1
-                        continue
-                    y[key][t] /= revenue
-
-        return y
+        return dict(self._cached("rel", self._rel))
 
+    @profiled()
     def flow(self):
         """
         Computes structural profit in $, total benefits and total costs.
@@ -262,30 +320,9 @@ class Data:
             Dictionary with profits, total benefits and total costs indexed respectively as "flow", "gain" and "loss"
             over the period described by the current date base
         """
-        excluded_keys = enum_value([[Key.plane,
-                                     Key.lap,
-                                     Key.cka,
-                                     Key.line,
-                                     Key.debit,
-                                     Key.credit,
-                                     Key.lpa]])[0]
-
-        y = {"flow": [0] * self.base.covered, "gain": [0] * self.base.covered, "loss": [0] * self.base.covered}
-        for t in range(0, self.base.covered):
-            y["flow"][t] = sum(self.fields[Key.lap.value][Field.data.value]) / 7.
-            y["loss"][t] = y["flow"][t]
-            for key, field in self.fields.items():
-                if key == Key.__date__ or key in excluded_keys:
-                    continue
-                field_data = float((field[Field.data.value][t]))
-                y["flow"][t] += field_data
-                if field_data > 0:
-                    y["gain"][t] += field_data
-                else:
-                    y["loss"][t] -= field_data
-
-        return self.reduce(y)
+        return dict(self._cached("flow", self._flow))
 
+    @profiled()
     def pie(self, thd=0.):
         """
         Creates pie representing expenses and incomes of current data set.
@@ -299,26 +336,7 @@ class Data:
         Returns:
             Dictionary with averages values of remaining Keys after filter
         """
-        excluded_keys = enum_value([[Key.debit, Key.credit]])[0]
-
-        # Filtering keys
-        raw = self.raw()
-        for key, field in self.fields.items():
-            if key == Key.__date__ or key in excluded_keys:
-                continue
-            if abs(sum(field[Field.data.value])) / self.base.range < thd * self.base.period:
-                excluded_keys.append(key)
-
-        for key in excluded_keys:
-            try:
-                del raw[key]
-            except KeyError:
-                continue
-
-        # Averaging values
-        keys = list(filter(lambda x: True if x not in excluded_keys else False, list(raw.keys())))
-        values = np.array(list(raw.values())).mean(axis=1)
-        return dict(zip(keys, values))
+        return dict(self._cached("pie", self._pie, thd))
 
     def reduce(self, y):
         """
@@ -330,17 +348,79 @@ class Data:
         Returns:
             y_reduced: Dictionary of y average values over the period described by current date base
         """
-        y_reduced = {}
-        for key, val in y.items():
-            y_reduced[key] = [0] * self.base.range
-            for t in range(0, self.base.range * self.base.period):
-                try:
-                    shift = self.base.offset * self.base.period + self.base.start
-                    y_reduced[key][int(t / self.base.period)] += y[key][t + shift]
-                except IndexError:
-                    continue
+        return {key: self.base.reduce(val) for key, val in y.items()}
+
+    def _cached(self, name, compute, *args):
+        key = (name, self.base.version) + args
+        try:
+            return self._cache[key]
+        except KeyError:
+            self._cache[key] = compute(*args)
+            return self._cache[key]
+
+    def _matrix(self, keys):
+        matrix = np.zeros((len(keys), self.base.covered))
+        for k in range(0, len(keys)):
+            matrix[k] = self.fields[keys[k]][Field.data.value]
+        return matrix
+
+    def _raw(self):
+        keys = list(dict.fromkeys(np.concatenate(Data.keys)))
+        y = self.base.reduce(np.abs(self._matrix(keys)))
+        y.flags.writeable = False
+        return dict(zip(keys, y))
+
+    def _rel(self):
+        raw = self.raw()
+        keys = list(raw.keys())
+        revenue = raw[Key.flight.value]
+        y = np.zeros((len(keys), self.base.range))
+        np.divide(np.array(list(raw.values())), revenue, out=y, where=revenue != 0.)
+        y[keys.index(Key.flight.value), revenue == 0.] = 1.
+        y.flags.writeable = False
+        return dict(zip(keys, y))
+
+    def _flow(self):
+        excluded_keys = enum_value([[Key.plane,
+                                     Key.lap,
+                                     Key.cka,
+                                     Key.line,
+                                     Key.debit,
+                                     Key.credit,
+                                     Key.lpa]])[0]
+
+        keys = [key for key in self.fields.keys() if key != Key.__date__ and key not in excluded_keys]
+        values = self._matrix(keys)
+        # The loan payments are taken over the whole file even when only a window of days is read
+        loan = self._lap() / 7.
 
-        return y_reduced
+        y = np.array([loan + values.sum(axis=0),
+                      np.where(values > 0, values, 0.).sum(axis=0),
+                      loan - np.where(values < 0, values, 0.).sum(axis=0)])
+        y = self.base.reduce(y)
+        y.flags.writeable = False
+        return dict(zip(["flow", "gain", "loss"], y))
+
+    def _lap(self):
+        if self.lap is not None:
+            return self.lap
+        return float(np.sum(self.fields[Key.lap.value][Field.data.value]))
+
+    def _pie(self, thd):
+        excluded_keys = enum_value([[Key.debit, Key.credit]])[0]
+
+        # Filtering keys
+        raw = self.raw()
+        for key, field in self.fields.items():
+            if key == Key.__date__ or key in excluded_keys:
+                continue
+            if abs(sum(field[Field.data.value])) / self.base.range < thd * self.base.lengths().mean():
+                excluded_keys.append(key)
+
+        # Averaging values
+        keys = list(filter(lambda x: True if x not in excluded_keys else False, list(raw.keys())))
+        values = np.array([raw[key] for key in keys]).mean(axis=1)
+        return dict(zip(keys, values))
 
     def _read_csv(self):
         with open(Data.EXPORTS_ROOT + self.filename, "r") as csv_export:
@@ -383,18 +463,66 @@ class Data:
             data = Data(filename=self.filename)
             self.merge(data)
             with open(Data.EXPORTS_ROOT + self.filename, "w") as json_file:
-                json.dump(self.fields, json_file, indent=4)
+                json.dump(self.fields, json_file, indent=4, default=list)
 
         except FileNotFoundError:
             with open(Data.EXPORTS_ROOT + self.filename, "w") as json_file:
-                json.dump(self.fields, json_file, indent=4)
+                json.dump(self.fields, json_file, indent=4, default=list)
+
+        self.pack()
 
     def _read_json(self):
         json_filename = self.filename.replace(".csv", ".json")
+        try:
+            store_time = os.path.getmtime(self._store_path() + Data.STORE_INDEX)
+            if store_time >= os.path.getmtime(Data.EXPORTS_ROOT + json_filename):
+                self._read_store()
+                return
+        except FileNotFoundError:
+            pass
+
         with open(Data.EXPORTS_ROOT + json_filename, "r") as json_file:
             self.fields = json.load(json_file)
             self.base.reset(date=datetime.fromisoformat(self.fields[Key.__date__]),
                             covered=len(self.fields[Key.flight.value][Field.data.value]))
+        self.pack()
+
+        # The whole file is packed before keeping the window
+        fields = self.fields
+        names = {key: field[Field.name.value] for key, field in fields.items() if key != Key.__date__}
+        self._read_window(fields[Key.__date__], self.base.covered, names,
+                          lambda key: np.asarray(fields[key][Field.data.value], dtype=float), self._lap())
+
+    def _read_store(self):
+        store_path = self._store_path()
+        with open(store_path + Data.STORE_INDEX, "r") as index_file:
+            index = json.load(index_file)
+
+        # Stores packed before the loan payments were indexed
+        try:
+            lap = index["lap"]
+        except KeyError:
+            lap = float(np.sum(np.load(store_path + Key.lap.value + ".npy", mmap_mode="r")))
+
+        self._read_window(index[Key.__date__], index["covered"], index["keys"],
+                          lambda key: np.load(store_path + key + ".npy", mmap_mode="r"), lap)
+
+    def _read_window(self, date, covered, names, load, lap):
+        # Keeps the days of the window, load(key) gives the data of key over the whole file. The date base of the whole
+        # file gives the window bounds and lap is the sum of the loan automatic payments over the whole file
+        base = DateBase(covered=covered, date=datetime.fromisoformat(date), start=self.window[0], end=self.window[1])
+
+        fields = {Key.__date__: (base.raw_start + timedelta(days=base.end)).isoformat()}
+        for key, name in names.items():
+            fields[key] = {Field.name.value: name, Field.data.value: np.array(load(key)[base.start:base.end + 1])}
+
+        self.windowed = base.start > 0 or base.end < base.covered - 1
+        self.fields = fields
+        self.lap = lap
+        self.base.reset(date=datetime.fromisoformat(fields[Key.__date__]), covered=base.end - base.start + 1)
+
+    def _store_path(self):
+        return Data.EXPORTS_ROOT + self.filename.split(".")[0] + "/"
 
 
 class Plot(GenericPlot):
@@ -428,11 +556,14 @@ class Plot(GenericPlot):
         y = Plot.scale(data.raw())
         label = {key: data.fields[key][Field.name.value] for key in list(y.keys())}
 
+        jobs = []
         k = 0
         for keys in Data.keys:
-            Plot.keys(x, {key: y[key] for key in keys}, "Date MM-DD", "Millions $", label,
-                      title="Raw Accounting {:d}".format(k + 1), date=data.base.end_date(), average=average)
+            jobs.append(Plot.keys_job(x, {key: y[key] for key in keys}, "Date MM-DD", "Millions $", label,
+                                      title="Raw Accounting {:d}".format(k + 1), date=data.base.end_date(),
+                                      average=average))
             k += 1
+        Plot.batch(_draw_keys, jobs)
 
     @staticmethod
     def rel(data, average=False):
@@ -441,11 +572,14 @@ class Plot(GenericPlot):
         y = Plot.scale(data.rel(), 1.e-2)
         label = {key: data.fields[key][Field.name.value] for key in list(y.keys())}
 
+        jobs = []
         k = 0
         for keys in Data.keys:
-            Plot.keys(x, {key: y[key] for key in keys}, "Date MM-DD", "Percent %", label,
-                      title="Relative Accounting {:d}".format(k + 1), date=data.base.end_date(), average=average)
+            jobs.append(Plot.keys_job(x, {key: y[key] for key in keys}, "Date MM-DD", "Percent %", label,
+                                      title="Relative Accounting {:d}".format(k + 1), date=data.base.end_date(),
+                                      average=average))
             k += 1
+        Plot.batch(_draw_keys, jobs)
 
     @staticmethod
     def flow(data, average=False):
@@ -460,19 +594,10 @@ class Plot(GenericPlot):
     def pie(data):
         """Plots pie with expenses and incomes"""
         y = data.pie(thd=3.e5)
-        size = 0.3
-        fig, ax = plt.subplots()
-        colors = plt.get_cmap("Set3")(np.arange(len(y)))
+        labels = [data.fields[key][Field.name.value] for key in list(y.keys())]
         title = "repartition from " + data.base.start_date().strftime("%m-%d-%y")
-        ax.pie(list(y.values()),
-               radius=1,
-               wedgeprops=dict(width=size, edgecolor="w"),
-               colors=colors,
-               labels=[data.fields[key][Field.name.value] for key in list(y.keys())],
-               autopct="%1.1f%%"
-               )
-        ax.set(aspect="equal")
-        Plot.render(title=title, date=data.base.end_date(), legend=False)
+        Plot.batch(_draw_pie, [((list(y.values()), labels), {"title": title, "date": data.base.end_date(),
+                                                              "legend": False})])
 
     @staticmethod
     def keys(x, y, xl, yl, label, title=None, date=None, average=False):
@@ -489,13 +614,36 @@ class Plot(GenericPlot):
             date (datetime): Date of the plot. Used for file naming
             average (bool): If True plots an horizontal scattered bar representing average of the values of the field
         """
-        plot_keys = list(y.keys())
-        n = len(x)
-        colors = plt.get_cmap("Dark2")(np.arange(len(plot_keys)))
-        for k in range(0, len(plot_keys)):
-            plt.plot(x, y[plot_keys[k]], label=label[plot_keys[k]], color=rgb2hex(colors[k][:3]))
-            if average is True:
-                y_avg = [sum(y[plot_keys[k]]) / len(y[plot_keys[k]])] * n
-                plt.plot(x, y_avg, "--", label=None, color=rgb2hex(colors[k][:3]))
-
-        Plot.render(xl, yl, title, date=date, legend=True)
+        Plot.batch(_draw_keys, [Plot.keys_job(x, y, xl, yl, label, title, date, average)])
+
+    @staticmethod
+    def keys_job(x, y, xl, yl, label, title=None, date=None, average=False):
+        """Returns the rendering job of a financial keys plot. See keys function for parameters"""
+        label = {key: label[key] for key in y.keys()}
+        return (x, y, label, average), {"xl": xl, "yl": yl, "title": title, "date": date, "legend": True}
+
+
+def _draw_keys(fig, x, y, label, average):
+    ax = fig.gca()
+    plot_keys = list(y.keys())
+    n = len(x)
+    colors = plt.get_cmap("Dark2")(np.arange(len(plot_keys)))
+    for k in range(0, len(plot_keys)):
+        ax.plot(x, y[plot_keys[k]], label=label[plot_keys[k]], color=rgb2hex(colors[k][:3]))
+        if average is True:
+            y_avg = [sum(y[plot_keys[k]]) / len(y[plot_keys[k]])] * n
+            ax.plot(x, y_avg, "--", label=None, color=rgb2hex(colors[k][:3]))
+
+
+def _draw_pie(fig, values, labels):
+    size = 0.3
+    ax = fig.gca()
+    colors = plt.get_cmap("Set3")(np.arange(len(values)))
+    ax.pie(values,
+           radius=1,
+           wedgeprops=dict(width=size, edgecolor="w"),
+           colors=colors,
+           labels=labels,
+           autopct="%1.1f%%"
+           )
+    ax.set(aspect="equal")
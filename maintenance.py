@@ -0,0 +1,244 @@
+"""
+Tools for maintenance aware scheduling.
+
+Planes wear while flying, at wear_rate percent per hour, and must be grounded for checks that finance records as
+aircraft.checkA and aircraft.checkD. Maintenance module projects the wear of the fleet of a planning day after day,
+inserts the checks before the wear limits are exceeded and assigns spare airframes to fly the schedule of grounded
+planes, so the plannings of each week of the horizon stay feasible.
+
+Checks are scheduled by a single greedy pass over the whole fleet in time order. When no spare is free for a check, the
+check is repaired by advancing it up to slack days to a date where a spare is free, since checks can be done early but
+never late.
+"""
+
+from utilities import GenericPlot
+from model import *
+
+import heapq
+import scheduling
+import numpy as np
+
+
+class Maintenance:
+    """
+    Maintenance class represents the fleet of a planning, its wear and its spare airframes
+
+    A check A is due when the wear accumulated since the last check reaches checks["A"]["wear"] and repairs up to
+    checks["A"]["repair"] percents of it. A check D is due when the wear reaches checks["D"]["wear"] and repairs all
+    the wear. A grounded plane does not fly during checks[check]["days"] days.
+
+    A spare airframe covering a grounded plane flies its daily schedule, within its range and as long as the flights fit
+    in a day. Among the free spares, the one covering the most seats is chosen. Spares are assumed to be maintained
+    while idle.
+
+    Attributes:
+        plan (Planning): Planning of the fleet
+        spares (dict): Spare airframes indexed by plane id, including the planes of the planning without schedule
+        wear (numpy.ndarray): Initial wear of the fleet planes in %
+        since (numpy.ndarray): Initial wear of the fleet planes since their last check in %
+        plane_ids (list): Plane ids of the fleet, gives the order of the arrays
+        daily (numpy.ndarray): Wear in % of each fleet plane each week day with shape (planes, 7)
+        seats (numpy.ndarray): Seats offered by each fleet plane each week day with shape (planes, 7)
+        checks (dict): Wear thresholds, repaired wear in % and duration in days of the checks indexed by check
+        slack (int): Maximum number of days a check can be advanced when no spare is free
+    """
+
+    checks = {"A": {"wear": 10., "repair": 8., "days": 1}, "D": {"wear": 60., "repair": 100., "days": 4}}
+    slack = 3
+
+    def __init__(self, plan, spares=None, wear=None, since=None):
+        """
+        Constructs a Maintenance object from a planning.
+
+        Parameters:
+            plan (Planning): Planning of the fleet
+            spares (list): Spare planes, identified as "SPARE-1", "SPARE-2", ...
+            wear (dict): Initial wear of the planes in %, indexed by plane id. Missing planes are new
+            since (dict): Initial wear of the planes since their last check in %, indexed by plane id. Missing planes
+            have just been checked
+        """
+        wear = {} if wear is None else wear
+        since = {} if since is None else since
+
+        self.plan = plan
+        self.plane_ids = [plane_id for plane_id in plan.planes.keys() if plane_id in plan.schedule]
+        self.spares = {plane_id: plane for plane_id, plane in plan.planes.items() if plane_id not in plan.schedule}
+        self.spares.update(Plane.id_with("SPARE", list(spares or [])))
+        self.wear = np.array([wear.get(plane_id, 0.) for plane_id in self.plane_ids], dtype=float)
+        self.since = np.array([since.get(plane_id, 0.) for plane_id in self.plane_ids], dtype=float)
+
+        self.daily = np.zeros((len(self.plane_ids), 7))
+        self.seats = np.zeros((len(self.plane_ids), 7))
+        for k in range(0, len(self.plane_ids)):
+            plane = plan.planes[self.plane_ids[k]]
+            for day in range(0, 7):
+                for line_key in plan.schedule[self.plane_ids[k]][day]:
+                    self.daily[k, day] += plane.wear_rate * self._duration(plane, line_key)
+                    self.seats[k, day] += 2 * sum(plane.pax.values())
+
+        self._covers = {}
+
+    def run(self, weeks=4):
+        """
+        Schedules the checks of the fleet over weeks
+
+        Returns:
+            Dictionary indexed by "checks" list of (plane id, check, start day, spare id or None) tuples sorted by start
+            day, "wear" wear in % of each fleet plane at the beginning of each day with shape (planes, days + 1), "loss"
+            seats lost each day because of uncovered checks and "repaired" number of advanced checks
+        """
+        days = 7 * weeks
+        cumulated = np.zeros((len(self.plane_ids), days + 1))
+        cumulated[:, 1:] = np.cumsum(self.daily[:, np.arange(0, days) % 7], axis=1)
+        busy = np.zeros((len(self.spares), days), dtype=bool)
+        spare_ids = list(self.spares.keys())
+
+        heap = []
+        for k in range(0, len(self.plane_ids)):
+            self._push(heap, cumulated, k, 0, self.wear[k], self.since[k])
+
+        checks = []
+        grounded = [[] for _ in range(0, len(self.plane_ids))]
+        loss = np.zeros(days)
+        repaired = 0
+        while len(heap) > 0:
+            start, k, check, wear, since, earliest = heapq.heappop(heap)
+            duration = self.checks[check]["days"]
+            spare = self._spare(k, start, duration, busy)
+            for advance in range(1, self.slack + 1):
+                if spare is not None or start - advance < earliest:
+                    break
+
+                spare = self._spare(k, start - advance, duration, busy)
+                if spare is not None:
+                    flown = cumulated[k, start] - cumulated[k, start - advance]
+                    start, wear, since = start - advance, wear - flown, since - flown
+                    repaired += 1
+
+            end = start + duration
+            if spare is not None:
+                busy[spare, start:end] = True
+            else:
+                loss[start:end] += self.seats[k, np.arange(start, min(end, days)) % 7]
+
+            # Check A repairs the wear since the last check, check D the total wear
+            wear -= min(wear if check == "D" else since, self.checks[check]["repair"])
+            checks.append((self.plane_ids[k], check, start, None if spare is None else spare_ids[spare]))
+            grounded[k].append((start, end, wear))
+            if end < days:
+                self._push(heap, cumulated, k, end, wear, 0.)
+
+        return {
+            "checks": sorted(checks, key=lambda x: x[2]),
+            "wear": self._trajectories(cumulated, grounded),
+            "loss": loss,
+            "repaired": repaired
+        }
+
+    def plannings(self, result):
+        """
+        Generates the planning of each week with grounded planes and spares flying their schedule
+
+        Parameters:
+            result (dict): Result returned by run
+
+        Returns:
+            List of plannings of each week of the horizon
+        """
+        weeks = len(result["loss"]) // 7
+        schedules = []
+        for _ in range(0, weeks):
+            schedule = {plane_id: [list(day) for day in self.plan.schedule[plane_id]] for plane_id in self.plane_ids}
+            schedule.update({spare_id: [[] for _ in range(0, 7)] for spare_id in self.spares.keys()})
+            schedules.append(schedule)
+
+        indices = {self.plane_ids[k]: k for k in range(0, len(self.plane_ids))}
+        for plane_id, check, start, spare_id in result["checks"]:
+            for day in range(start, min(start + self.checks[check]["days"], 7 * weeks)):
+                schedule = schedules[day // 7]
+                schedule[plane_id][day % 7] = []
+                if spare_id is not None:
+                    schedule[spare_id][day % 7] = list(self._cover(spare_id, indices[plane_id], day % 7))
+
+        planes = dict(self.plan.planes, **self.spares)
+        return [scheduling.Planning(self.plan.lines, planes, schedule, self.plan.fill, self.plan.add_time,
+                                    self.plan.context) for schedule in schedules]
+
+    def _duration(self, plane, line_key):
+        hub_iata, dst_iata = line_key.split("-")
+        return 2 * plane.flight_time(self.plan.lines[hub_iata][dst_iata].distance, self.plan.add_time)
+
+    def _cover(self, spare_id, k, day):
+        # Flights of the schedule of a fleet plane a spare can fly in a day
+        try:
+            return self._covers[(spare_id, k, day)]
+        except KeyError:
+            spare = self.spares[spare_id]
+            flights, hours = [], 0.
+            for line_key in self.plan.schedule[self.plane_ids[k]][day]:
+                hub_iata, dst_iata = line_key.split("-")
+                duration = self._duration(spare, line_key)
+                if spare.range > self.plan.lines[hub_iata][dst_iata].distance and hours + duration <= 24.:
+                    flights.append(line_key)
+                    hours += duration
+            self._covers[(spare_id, k, day)] = tuple(flights)
+            return self._covers[(spare_id, k, day)]
+
+    def _spare(self, k, start, duration, busy):
+        # Index of the free spare covering the most seats of a check, None if no free spare covers any seat
+        end = start + duration
+        free = np.nonzero(~busy[:, start:end].any(axis=1))[0]
+        spare_ids = list(self.spares.keys())
+        best, best_seats = None, 0.
+        for spare in free:
+            plane = self.spares[spare_ids[spare]]
+            seats = sum(2 * sum(plane.pax.values()) * len(self._cover(spare_ids[spare], k, day % 7))
+                        for day in range(start, end))
+            if seats > best_seats:
+                best, best_seats = spare, seats
+        return best
+
+    def _push(self, heap, cumulated, k, start, wear, since):
+        # Pushes the next check of a plane, due the day before flying would exceed a threshold
+        margins = {"D": self.checks["D"]["wear"] - wear, "A": self.checks["A"]["wear"] - since}
+        due = {check: np.searchsorted(cumulated[k], cumulated[k, start] + max(margin, 0.), side="right") - 1
+               for check, margin in margins.items()}
+        check = "D" if due["D"] <= due["A"] else "A"
+        if due[check] < cumulated.shape[1] - 1:
+            flown = cumulated[k, due[check]] - cumulated[k, start]
+            heapq.heappush(heap, (int(due[check]), k, check, wear + flown, since + flown, start))
+
+    def _trajectories(self, cumulated, grounded):
+        # Wear grows while flying, is held while grounded and drops at the end of each check
+        days = cumulated.shape[1] - 1
+        wear = np.zeros(cumulated.shape)
+        for k in range(0, len(grounded)):
+            flying, value = 0, self.wear[k]
+            for start, end, repaired in grounded[k] + [(days, days + 1, 0.)]:
+                wear[k, flying:start + 1] = value + cumulated[k, flying:start + 1] - cumulated[k, flying]
+                wear[k, start + 1:end] = wear[k, start]
+                flying, value = end, repaired
+        return wear
+
+
+class Plot(GenericPlot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for every result that can be computed with Maintenance objects.
+    """
+
+    RENDER_ROOT = GenericPlot.RENDER_ROOT + "maintenance/"
+
+    @classmethod
+    def wear(cls, maintenance, result, plane_ids=None, title="Wear projection"):
+        """Plots the projected wear of plane_ids, all the fleet planes if None"""
+        plane_ids = maintenance.plane_ids if plane_ids is None else plane_ids
+        wear = [result["wear"][maintenance.plane_ids.index(plane_id)] for plane_id in plane_ids]
+        cls.batch(_draw_wear, [((wear, plane_ids), {"xl": "Day", "yl": "Wear (%)", "title": title})])
+
+
+def _draw_wear(fig, wear, plane_ids):
+    ax = fig.gca()
+    for k in range(0, len(wear)):
+        ax.plot(np.arange(0, len(wear[k])), wear[k], label=plane_ids[k])
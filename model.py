@@ -217,6 +217,10 @@ class Line:
             "tax": self.tax
         }
 
+    def __reduce__(self):
+        # __dict__ is not the attributes dictionary so lines are pickled from their constructor arguments
+        return Line, (self.hub, self.dst, self.demand, self.ticket_price, self.distance, self.new, self.tax)
+
     @classmethod
     def from_dict(cls, line, hub, dst):
         return Line(hub=hub,
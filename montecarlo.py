@@ -0,0 +1,213 @@
+"""
+Tools for evaluation of plannings under uncertainty.
+
+Planning indicators are computed with point values of the lines demand, the fill ratio and the fuel price. Monte Carlo
+module samples theses values over thousands of scenarios and evaluates the profits and profitability of a planning in
+every scenario at once, so purchase decisions can be made knowing the risk taken.
+
+In a scenario, the passengers of a line are capped by the sampled demand and shared among the planes of the line
+proportionally to their seats. When the demand is not exceeded, indicators of a scenario are the Planning ones.
+"""
+
+from model import *
+
+import numpy as np
+
+
+class MonteCarlo:
+    """
+    MonteCarlo class represents a planning evaluated over random scenarios
+
+    Demand of each line and fuel price are sampled from log-normal distributions with mean the point value, fill ratio
+    is sampled from a normal distribution with mean the planning fill ratio, clipped between 0 and 1. The fuel price,
+    the fill curve, the taxes and the loan rate are the ones of the planning context, with a fill curve each line is
+    shifted by the sampled deviation of the fill ratio. Samples are drawn once at construction so every indicator is
+    computed on the same scenarios.
+
+    The planning is represented by (line, plane) pairs where the plane flies the line. Indicators are computed as
+    arrays with shape (scenarios, pairs, markets) and summed over the lines.
+
+    Attributes:
+        plan (Planning): Planning to evaluate
+        scenarios (int): Number of scenarios
+        demand_cv (float): Coefficient of variation of the demand of each line
+        fill_std (float): Standard deviation of the fill ratio
+        fuel_cv (float): Coefficient of variation of the fuel price
+        samples (dict): Sampled values indexed by "demand" demand factor with shape (scenarios, lines), "fill" fill
+        ratio and "fuel_price" fuel price in $/L with shape (scenarios,)
+    """
+
+    def __init__(self, plan, scenarios=1000, demand_cv=0.15, fill_std=0.05, fuel_cv=0.2, seed=None):
+        """
+        Constructs a MonteCarlo object and samples the scenarios
+
+        Parameters:
+            plan (Planning): Planning to evaluate
+            scenarios (int): Number of scenarios
+            demand_cv (float): Coefficient of variation of the demand of each line
+            fill_std (float): Standard deviation of the fill ratio
+            fuel_cv (float): Coefficient of variation of the fuel price
+            seed (int): Seed of the random generator. Plannings of the same lines evaluated with the same seed share
+            the same scenarios
+        """
+        self.plan = plan
+        self.scenarios = scenarios
+        self.demand_cv = demand_cv
+        self.fill_std = fill_std
+        self.fuel_cv = fuel_cv
+
+        self._lines = [(hub_iata, dst_iata) for hub_iata, lines in plan.lines.items() for dst_iata in lines.keys()]
+        self._init_pairs()
+
+        random = np.random.RandomState(seed)
+        self.samples = {
+            "demand": MonteCarlo.lognormal(random, 1., demand_cv, (scenarios, len(self._lines))),
+            "fill": np.clip(random.normal(plan.fill, fill_std, scenarios), 0., 1.),
+            "fuel_price": MonteCarlo.lognormal(random, plan.context.fuel_price, fuel_cv, scenarios)
+        }
+
+    @staticmethod
+    def lognormal(random, mean, cv, size):
+        """Samples a log-normal distribution with given mean and coefficient of variation"""
+        sigma = np.sqrt(np.log(1. + cv ** 2))
+        return mean * random.lognormal(-sigma ** 2 / 2, sigma, size)
+
+    def pax(self):
+        """
+        Computes PAX of each scenario
+
+        Returns:
+            Array of weekly PAX with shape (scenarios, pairs, markets)
+        """
+        fill = np.clip(self.samples["fill"][:, np.newaxis, np.newaxis] + self._fill_shift, 0., 1.)
+        offered = fill * self._line_seats
+        demand = 7 * self._demand * self.samples["demand"][:, :, np.newaxis]
+
+        ratio = np.ones(offered.shape)
+        np.divide(demand, offered, out=ratio, where=offered > demand)
+        return fill[:, self._pair_line] * self._seats * ratio[:, self._pair_line]
+
+    def profits(self):
+        """
+        Computes weekly operational profits of each scenario in $
+
+        Returns:
+            Array of profits with shape (scenarios, pairs, markets)
+        """
+        pax = self.pax()
+        fuel = pax.sum(axis=2) * self._fuel_per_pax
+        costs = (fuel * self.samples["fuel_price"][:, np.newaxis] + self._tax)[:, :, np.newaxis] * self._pax_ratio
+        return self._ticket_price * pax - costs
+
+    def profitability(self, loan_rate=None):
+        """
+        Computes profitability of each scenario, see Planning.profitability
+
+        Parameters:
+            loan_rate (float): Loan rate applied when purchasing lines and hubs, if None the one of the planning context
+
+        Returns:
+            Array of profitability with shape (scenarios, pairs, markets)
+        """
+        loan_rate = self.plan.context.loan_rate if loan_rate is None else loan_rate
+        cost = self._pax_ratio * (self._plane_price * (self._wear_ratio + loan_rate) + self._line_price)
+        percent = np.zeros((self.scenarios,) + cost.shape)
+        np.divide(4 * self.profits(), cost, out=percent, where=cost != 0.)
+        return percent
+
+    def by_lines(self, data):
+        """
+        Sums data over planes and markets of each line
+
+        Parameters:
+            data (numpy.ndarray): Array with shape (scenarios, pairs, markets) generated by the methods above
+
+        Returns:
+            Array with shape (scenarios, lines). Lines are ordered as in planning lines dictionary
+        """
+        return self._line_sum(data.sum(axis=2))
+
+    def total(self, data):
+        """Sums data over lines, planes and markets. Returns an array with one value per scenario"""
+        return data.sum(axis=(1, 2))
+
+    def percentiles(self, data, q=(5, 50, 95)):
+        """
+        Computes percentiles of data by line
+
+        Parameters:
+            data (numpy.ndarray): Array with shape (scenarios, pairs, markets) generated by the methods above
+            q (tuple): Percentiles to compute, between 0 and 100
+
+        Returns:
+            percentiles: Dictionary of percentiles indexed by hub, line and percentile
+        """
+        values = np.percentile(self.by_lines(data), q, axis=0)
+        percentiles = {}
+        for i in range(0, len(self._lines)):
+            hub_iata, dst_iata = self._lines[i]
+            percentiles.setdefault(hub_iata, {})[dst_iata] = dict(zip(q, values[:, i]))
+
+        return percentiles
+
+    def score(self, key="profits", q=None):
+        """
+        Scores the planning over the scenarios
+
+        Parameters:
+            key (str): Indicator to score, "profits" or "profitability"
+            q (float): Percentile of the total indicator between 0 and 100, if None the mean is returned
+
+        Returns:
+            Expected value or percentile of the total indicator over the scenarios
+        """
+        total = self.total(getattr(self, key)())
+        return total.mean() if q is None else np.percentile(total, q)
+
+    def _init_pairs(self):
+        plan = self.plan
+        markets = [m.name for m in Market]
+        flights = plan.flights()
+        price_by_lines = plan.price_by_lines()
+        hours = plan.flight_time()
+
+        # Pairs of (line index, plane id, weekly flights, weekly flight time, price of the model fleet of the line)
+        pairs = []
+        for i in range(0, len(self._lines)):
+            hub_iata, dst_iata = self._lines[i]
+            for plane_id, count in flights[hub_iata][dst_iata].items():
+                if count > 0:
+                    line_price = price_by_lines[hub_iata][dst_iata][plan.planes[plane_id].name]
+                    pairs.append((i, plane_id, count, hours[hub_iata][dst_iata][plane_id], line_price))
+
+        lines = [plan.lines[hub_iata][dst_iata] for hub_iata, dst_iata in self._lines]
+        pair_lines = [lines[pair[0]] for pair in pairs]
+        planes = [plan.planes[pair[1]] for pair in pairs]
+        pax = np.array([[plane.pax[m] for m in markets] for plane in planes], dtype=float).reshape(-1, len(markets))
+        count = np.array([pair[2] for pair in pairs], dtype=float)
+
+        self._pair_line = np.array([pair[0] for pair in pairs], dtype=int)
+        self._assign = np.zeros((len(self._lines), len(pairs)))
+        self._assign[self._pair_line, np.arange(0, len(pairs))] = 1.
+        self._seats = 2 * pax * count[:, np.newaxis]
+        self._line_seats = self._assign @ self._seats
+        self._pax_ratio = np.zeros(pax.shape)
+        np.divide(pax, pax.sum(axis=1, keepdims=True), out=self._pax_ratio, where=pax.sum(axis=1, keepdims=True) > 0)
+        self._demand = np.array([[line.demand[m] for m in markets] for line in lines], dtype=float)
+        self._ticket_price = np.array([[line.ticket_price[m] for m in markets] for line in pair_lines], dtype=float)
+        table = plan.economics()
+        rows = table.rows([self._lines[pair[0]] for pair in pairs])
+        self._fuel_per_pax = table.fuel_per_pax[rows, table.cols([plane.name for plane in planes])]
+        taxes = plan.context.line_taxes(plan.lines)
+        taxes = np.array([taxes[hub_iata][dst_iata] for hub_iata, dst_iata in self._lines], dtype=float)
+        self._tax = taxes[self._pair_line] * count
+        distance = np.array([line.distance for line in lines], dtype=float)
+        self._fill_shift = (plan.context.fills(distance, plan.fill) - plan.fill)[:, np.newaxis]
+        self._plane_price = np.array([plane.price for plane in planes], dtype=float)[:, np.newaxis]
+        wear_rate = np.array([plane.wear_rate for plane in planes], dtype=float)
+        self._wear_ratio = (wear_rate * np.array([pair[3] for pair in pairs], dtype=float) / 100.)[:, np.newaxis]
+        self._line_price = np.array([pair[4] for pair in pairs], dtype=float)[:, np.newaxis]
+
+    def _line_sum(self, data):
+        # Sums data of the pairs of each line, pairs being the axis 1
+        return np.moveaxis(np.tensordot(self._assign, data, axes=(1, 1)), 0, 1)
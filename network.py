@@ -0,0 +1,218 @@
+"""
+Tools for connecting passengers flows through hubs.
+
+Plannings evaluate each line as an isolated hub to destination pair. Network module represents the lines of a planning
+as an airport graph, so passengers travelling between two airports that are not directly linked can connect through
+one or several hubs. Origin-destination (O-D) demands are routed on shortest paths of the graph and assigned to the
+seats remaining once the demand of the lines themselves is served.
+
+Demands are daily numbers of passengers in both directions, as Line.demand.
+"""
+
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from model import *
+
+import numpy as np
+
+
+class Network:
+    """
+    Network class represents the airports graph of a planning and its O-D demands
+
+    The graph is undirected, each line of the planning being an edge weighted by its distance. The capacity of an
+    edge is the daily number of seats offered by the planning on the line, the fill ratio taken in account. Lines
+    linking the same airports in both directions are parallel edges and connecting passengers take the one with the
+    most seats remaining.
+
+    When no O-D demand is given, the demand between two airports that are not directly linked is estimated as
+    transfer * sqrt(Da * Db) where Da and Db are the total demands of the lines deserving the airports.
+
+    Attributes:
+        plan (Planning): Planning to analyse
+        airports (list): IATA codes of the airports, gives the order of the graph nodes
+        edges (list): (hub, destination) IATA couples of the lines, gives the order of the edges
+        distance (numpy.ndarray): Distance of each edge in km
+        capacity (numpy.ndarray): Daily seats of each edge
+        direct (numpy.ndarray): Daily demand of each line, all markets summed
+        od (list): (origin, destination) IATA couples of the O-D demands
+        demand (numpy.ndarray): Daily demand of each O-D couple
+    """
+
+    def __init__(self, plan, od=None, transfer=0.05, day=0):
+        """
+        Constructs a Network object from a planning.
+
+        Parameters:
+            plan (Planning): Planning to analyse
+            od (dict): Daily O-D demands indexed by origin and destination IATA eg. {"BLR": {"DEL": 120}}. If None,
+            demands are estimated between every couple of airports that are not directly linked
+            transfer (float): Share of the demands of the lines that connects to other airports, used to estimate O-D
+            demands
+            day (int): Week day used to compute capacities
+        """
+        self.plan = plan
+        self.edges = [(hub_iata, dst_iata) for hub_iata, lines in plan.lines.items() for dst_iata in lines.keys()]
+        self.airports = list(dict.fromkeys([iata for edge in self.edges for iata in edge]))
+        self._index = {self.airports[k]: k for k in range(0, len(self.airports))}
+        # Edges linking each couple of airports, both directions of a couple can be served by distinct lines
+        self._edge_index = {}
+        for k in range(0, len(self.edges)):
+            i, j = self._index[self.edges[k][0]], self._index[self.edges[k][1]]
+            self._edge_index.setdefault((i, j), []).append(k)
+            self._edge_index.setdefault((j, i), []).append(k)
+
+        lines = [plan.lines[hub_iata][dst_iata] for hub_iata, dst_iata in self.edges]
+        pax = plan.by_lines(plan.pax(day))
+        self.distance = np.array([line.distance for line in lines], dtype=float)
+        self.capacity = np.array([pax[hub_iata][dst_iata] for hub_iata, dst_iata in self.edges], dtype=float)
+        self.direct = np.array([sum(line.demand.values()) for line in lines], dtype=float)
+
+        if od is None:
+            self.od, self.demand = self.estimate(transfer)
+        else:
+            self.od = [(origin, dst) for origin, dsts in od.items() for dst in dsts.keys()]
+            self.demand = np.array([od[origin][dst] for origin, dst in self.od], dtype=float)
+
+    def estimate(self, transfer=0.05):
+        """
+        Estimates O-D demands between airports that are not directly linked
+
+        Parameters:
+            transfer (float): Share of the demands of the lines that connects to other airports
+
+        Returns:
+            od: List of (origin, destination) IATA couples
+            demand: Array of daily demand of each couple
+        """
+        served = np.zeros(len(self.airports))
+        for k in range(0, len(self.edges)):
+            for iata in self.edges[k]:
+                served[self._index[iata]] += self.direct[k]
+
+        linked = np.eye(len(self.airports), dtype=bool)
+        for i, j in self._edge_index.keys():
+            linked[i, j] = True
+
+        origins, dsts = np.nonzero(np.triu(~linked))
+        od = [(self.airports[i], self.airports[j]) for i, j in zip(origins, dsts)]
+        return od, transfer * np.sqrt(served[origins] * served[dsts])
+
+    def graph(self, mask=None):
+        """
+        Builds the sparse adjacency matrix of the airports graph
+
+        Parameters:
+            mask (numpy.ndarray): Boolean array selecting the edges to keep, if None all the edges are kept
+
+        Returns:
+            Sparse matrix of distances between airports
+        """
+        mask = np.ones(len(self.edges), dtype=bool) if mask is None else mask
+        rows = np.array([self._index[hub_iata] for hub_iata, _ in self.edges], dtype=int)[mask]
+        cols = np.array([self._index[dst_iata] for _, dst_iata in self.edges], dtype=int)[mask]
+        shape = (len(self.airports), len(self.airports))
+        return csr_matrix((self.distance[mask], (rows, cols)), shape=shape)
+
+    def assign(self, iterations=4):
+        """
+        Assigns O-D demands to the seats remaining on the lines
+
+        The seats of each line first serve the demand of the line itself. The O-D demands are then assigned
+        incrementally: at each iteration, shortest paths are computed over the lines that still have seats and a share
+        of the remaining demand of each O-D couple is assigned to its path, up to the seats remaining on the path.
+
+        Parameters:
+            iterations (int): Number of assignment iterations
+
+        Returns:
+            Dictionary indexed by "flow" daily connecting passengers of each edge, "served" daily passengers of each O-D
+            couple, "residual" daily seats remaining on each edge and "paths" list of the IATA shortest paths of the O-D
+            couples over the lines offering seats, None if unreachable
+        """
+        residual = np.maximum(self.capacity - self.direct, 0.)
+        flow = np.zeros(len(self.edges))
+        served = np.zeros(len(self.od))
+        remaining = self.demand.copy()
+        paths = [None] * len(self.od)
+
+        origins = list(dict.fromkeys([origin for origin, _ in self.od]))
+        rows = {origins[k]: k for k in range(0, len(origins))}
+        order = np.argsort(-self.demand, kind="stable")
+        indices = [self._index[origin] for origin in origins]
+
+        if len(origins) > 0:
+            _, predecessors = dijkstra(self.graph(self.capacity > 0), directed=False, indices=indices,
+                                       return_predecessors=True)
+            for k in range(0, len(self.od)):
+                origin, dst = self.od[k]
+                nodes = self._path(predecessors[rows[origin]], self._index[origin], self._index[dst])
+                paths[k] = None if nodes is None else [self.airports[node] for node in nodes]
+
+        for iteration in range(0, iterations):
+            if not (remaining > 0).any() or len(origins) == 0:
+                break
+
+            _, predecessors = dijkstra(self.graph(residual > 0), directed=False, indices=indices,
+                                       return_predecessors=True)
+            share = remaining / (iterations - iteration)
+            for k in order:
+                if remaining[k] <= 0:
+                    continue
+
+                origin, dst = self.od[k]
+                nodes = self._path(predecessors[rows[origin]], self._index[origin], self._index[dst])
+                if nodes is None:
+                    continue
+
+                # Each hop uses the line between its airports with the most seats remaining
+                edges = [max(self._edge_index[(nodes[n], nodes[n + 1])], key=lambda e: residual[e])
+                         for n in range(0, len(nodes) - 1)]
+                amount = min(share[k], residual[edges].min())
+                residual[edges] -= amount
+                flow[edges] += amount
+                remaining[k] -= amount
+                served[k] += amount
+
+        return {"flow": flow, "served": served, "residual": residual, "paths": paths}
+
+    def by_lines(self, values):
+        """
+        Indexes edge values by lines
+
+        Parameters:
+            values (numpy.ndarray): Array of values of each edge eg. flow returned by assign
+
+        Returns:
+            Dictionary of values indexed by hub and destination
+        """
+        new_data = {}
+        for k in range(0, len(self.edges)):
+            hub_iata, dst_iata = self.edges[k]
+            new_data.setdefault(hub_iata, {})[dst_iata] = values[k]
+
+        return new_data
+
+    def load(self, flow):
+        """
+        Computes load factor of each line, ie. direct and connecting passengers over seats
+
+        Parameters:
+            flow (numpy.ndarray): Daily connecting passengers of each edge, returned by assign
+
+        Returns:
+            Array of load factor of each edge, 0 when the line offers no seat
+        """
+        load = np.zeros(len(self.edges))
+        np.divide(np.minimum(self.direct, self.capacity) + flow, self.capacity, out=load, where=self.capacity > 0)
+        return load
+
+    @staticmethod
+    def _path(predecessors, origin, dst):
+        if origin == dst or predecessors[dst] < 0:
+            return None
+
+        nodes = [dst]
+        while nodes[-1] != origin:
+            nodes.append(predecessors[nodes[-1]])
+        return nodes[::-1]
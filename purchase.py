@@ -2,11 +2,18 @@
 Tools for purchase strategy analysis.
 
 Purchase module offers many features to compare Planning objects. It allows to visualize financial results of different
-fleets and plannings over a set of lines and hubs.
+fleets and plannings over a set of lines and hubs. It also provides a planner which selects the lines and planes to
+purchase with a given capital.
 """
 
 from utilities import GenericPlot
+from model import *
 
+import copy
+import economics
+import heapq
+import montecarlo
+import scheduling
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
@@ -28,22 +35,387 @@ class Data:
 
     def sorted(self):
         """Returns sorted plannings by profitability. Returns a list of plans sorted by decreasing profitability"""
-        plan_profitability = []
-        for plan in self.plannings:
-            plan_profitability.append(0)
-            plan_profitability[-1] += sum(plan.by_hubs(plan.profitability()).values())
+        return sorted(self.plannings, key=lambda plan: sum(plan.by_hubs(plan.profitability()).values()), reverse=True)
+
+    def sorted_by_scenarios(self, key="profits", q=None, scenarios=1000, seed=0, **uncertainty):
+        """
+        Sorts plannings by their score over random scenarios of demand, fill ratio and fuel price
+
+        Every planning is evaluated over the same scenarios, see montecarlo.MonteCarlo.
+
+        Parameters:
+            key (str): Indicator to score, "profits" or "profitability"
+            q (float): Percentile of the indicator to score between 0 and 100, if None the expected value is scored.
+            eg. q=5 sorts plannings by the indicator value that is exceeded in 95% of the scenarios
+            scenarios (int): Number of scenarios
+            seed (int): Seed of the random generator
+            uncertainty: Keyword arguments passed to MonteCarlo eg. demand_cv=0.2
+
+        Returns:
+            List of plans sorted by decreasing score
+        """
+        scores = [montecarlo.MonteCarlo(plan, scenarios, seed=seed, **uncertainty).score(key, q)
+                  for plan in self.plannings]
+        return [self.plannings[k] for k in np.argsort(-np.array(scores), kind="stable")]
+
+    @staticmethod
+    def summary(plan):
+        """
+        Computes summary metrics of a planning
+
+        Returns:
+            Dictionary with total "profitability", total weekly "profits" in $, total "margin" and initial "cost" in $
+            which is the sum of lines acquisition and planes prices
+        """
+        return {
+            "profitability": sum(plan.by_hubs(plan.profitability()).values()),
+            "profits": sum(plan.by_hubs(plan.profits()).values()),
+            "margin": sum(plan.by_hubs(plan.margin()).values()),
+            "cost": plan.total_acq_cost() + plan.total_planes_cost()
+        }
+
+    @staticmethod
+    def rank(plans, k=10, key="profitability"):
+        """
+        Ranks a stream of plannings and keeps only the best ones
+
+        The plannings are consumed one by one and scored using their summary metrics. Only the k best plannings are
+        kept in a heap so memory stays bounded whatever the number of plannings generated.
+
+        Parameters:
+            plans (iterable): Plannings to rank, eg. a generator of candidate plannings
+            k (int): Number of plannings to keep, the ranking is empty when k <= 0
+            key (str): Summary metric used as score, see summary function
+
+        Returns:
+            ranking: List of the summary metrics of the k best plannings sorted by decreasing score. The planning is
+            stored in each summary at "plan" key
+        """
+        if k <= 0:
+            return []
+
+        heap = []
+        count = 0
+        for plan in plans:
+            summary = Data.summary(plan)
+            summary["plan"] = plan
+            item = (summary[key], count, summary)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+            count += 1
+
+        return [summary for _, _, summary in sorted(heap, key=lambda x: (-x[0], x[1]))]
 
-        zip_to_sort = zip(plan_profitability, self.plannings)
-        sorted_plans = [x for _, x in sorted(zip_to_sort, reverse=True)]
-        return sorted_plans
+    @classmethod
+    def top(cls, plans, k=10, key="profitability"):
+        """Returns a Data object containing the k best plannings of a stream of plannings. See rank function"""
+        return cls([summary["plan"] for summary in cls.rank(plans, k, key)])
+
+    def pareto(self):
+        """
+        Computes the Pareto-optimal plannings
+
+        A planning is Pareto-optimal when no other planning has a greater or equal weekly profit and margin for a lower
+        or equal initial cost, one of them being strictly better.
+
+        Returns:
+            frontier: List of the summary metrics of Pareto-optimal plannings sorted by increasing cost. The planning
+            is stored in each summary at "plan" key
+            summaries: List of the summary metrics of all the plannings
+        """
+        summaries = []
+        for plan in self.plannings:
+            summary = Data.summary(plan)
+            summary["plan"] = plan
+            summaries.append(summary)
+
+        points = np.array([[x["profits"], x["cost"], x["margin"]] for x in summaries]).reshape(-1, 3)
+        return [summaries[k] for k in Data.skyline(points)], summaries
+
+    @staticmethod
+    def skyline(points):
+        """
+        Computes the skyline of points maximizing first and third coordinates and minimizing the second one
+
+        Points are swept by increasing second coordinate. A point is kept when no point kept before has greater or
+        equal first and third coordinates, which is checked with a Fenwick tree of the maximal third coordinate indexed
+        by decreasing first coordinate. The skyline is computed in O(n log n). Only the first of identical points is
+        kept.
+
+        Parameters:
+            points (numpy.ndarray): Array with shape (n, 3) eg. profits, cost and margin of plannings
+
+        Returns:
+            List of the indices of the skyline points sorted by increasing second coordinate
+        """
+        order = np.lexsort((-points[:, 2], -points[:, 0], points[:, 1]))
+        values = np.unique(points[:, 0])
+        ranks = (len(values) - np.searchsorted(values, points[:, 0])).tolist()
+        tree = [-np.inf] * (len(values) + 1)
+        skyline = []
+        for k in order:
+            z = points[k, 2]
+
+            # Maximal third coordinate of the kept points with a greater or equal first coordinate
+            i, best = ranks[k], -np.inf
+            while i > 0:
+                best = max(best, tree[i])
+                i -= i & -i
+            if best >= z:
+                continue
+
+            i = ranks[k]
+            while i < len(tree):
+                tree[i] = max(tree[i], z)
+                i += i & -i
+            skyline.append(k)
+
+        return skyline
+
+    def lines(self):
+        """Returns the list of (hub, destination) IATA couples of the plannings. Gives the lines order of matrices"""
+        lines = []
+        for hub_iata, hub_lines in self.plannings[0].lines.items():
+            for dst_iata in hub_lines.keys():
+                lines.append((hub_iata, dst_iata))
+
+        return lines
 
     def heatmap(self):
-        """Returns a list profitability over the week for each planning. Profitability is indexed by hubs and lines"""
-        plan_profitability = []
-        for plan in self.plannings:
-            plan_profitability.append(plan.by_lines(plan.profitability()))
+        """
+        Computes profitability over the week of each line for each planning
+
+        Returns:
+            values: Matrix of profitability with shape (lines, plannings). Lines are ordered as given by lines function
+        """
+        lines = self.lines()
+        values = np.zeros((len(lines), len(self.plannings)))
+        for j in range(0, len(self.plannings)):
+            profitability = self.plannings[j].profitability()
+            for i in range(0, len(lines)):
+                hub_iata, dst_iata = lines[i]
+                values[i, j] = sum(map(lambda x: sum(x.values()), profitability[hub_iata][dst_iata].values()))
+
+        return values
+
 
-        return plan_profitability
+class Planner:
+    """
+    Planner class selects lines and planes to purchase with a given capital
+
+    Every line can be deserved by a dedicated fleet of a single plane model, as done in flat plannings. For each line
+    and model, the weekly profit and price of a plane are computed at once for the whole network and catalogue
+    using arrays, the lines acquisition price being added for new lines. A purchase option is then a number of
+    planes of a model on a line, up to the number of planes that matches the line demand.
+
+    The portfolios of options maximizing the weekly profit within the budget are searched using a branch and bound
+    over the lines. Lines are explored by decreasing profit/cost ratio and options by decreasing bound. Branches are
+    bounded by the linear relaxation of the remaining lines, computed from the upper concave hull of each line options.
+
+    Attributes:
+        budget (float): Capital available for purchases in $
+        lines (dict): Candidate lines, indexed by hub and destination. Lines with new flag are purchased
+        planes (dict): Catalogue of plane models, indexed by model
+        fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+        add_time (float): additional time in hours for each flight
+        target (model.Market): Market to target to size the fleets
+        options (list): Purchase options of each line, list of (cost, profit, model, count) tuples sorted by
+        increasing cost. Only options with strictly increasing profit are kept
+        context (economics.Context): Economic conditions of the purchases
+        table (str): Name of the file persisting the unit economics table of the lines and models, see economics.Table.
+        If None the table is only kept in memory
+    """
+
+    table = None
+
+    def __init__(self, budget, lines, planes, fill=0.86, add_time=1., target=Market.eco, context=None):
+        self.budget = budget
+        self.lines = lines
+        self.planes = planes
+        self.fill = fill
+        self.add_time = add_time
+        self.target = target
+        self.context = economics.Context() if context is None else context
+
+        self._lines = [(hub_iata, dst_iata) for hub_iata, hub in lines.items() for dst_iata in hub.keys()]
+        self._models = list(planes.keys())
+        self.options = self._options()
+
+    def scores(self):
+        """
+        Computes purchase scores of each line and plane model
+
+        Returns:
+            Dictionary of arrays with shape (lines, models) indexed by "profit" weekly profit of a plane in $,
+            "price" price of a plane in $, "count" number of planes matching the demand, "acq" line acquisition
+            price in $, "flights" daily flights of a plane, "time" flight time in hours and "seats" daily seats of a
+            plane in the target market. Lines and models are ordered as in lines and planes dictionaries
+        """
+        table = economics.Table.load(self.context, self.lines, self.planes, self.fill, self.add_time, self.table)
+        rows, cols = table.rows(self._lines), table.cols(self._models)
+        flights = table.flights[np.ix_(rows, cols)]
+        flight_time = table.flight_time[np.ix_(rows, cols)]
+
+        # Weekly profit of a plane by line and model
+        profit = 7 * flights * (table.revenue[np.ix_(rows, cols)].sum(axis=2) - table.cost[np.ix_(rows, cols)])
+
+        target = [m.name for m in Market].index(self.target.name)
+        seats = 2 * table.pax[np.newaxis, cols, target] * flights
+        count = np.zeros(seats.shape)
+        np.divide(table.demand[rows, target:target + 1], seats, out=count, where=seats > 0)
+        count = np.round(count)
+        count[~table.in_range[np.ix_(rows, cols)] | (flights == 0)] = 0
+
+        return {
+            "profit": profit,
+            "price": np.broadcast_to(table.price[cols], profit.shape),
+            "count": count.astype(int),
+            "acq": np.broadcast_to(table.acq[rows, np.newaxis], profit.shape),
+            "flights": flights,
+            "time": flight_time,
+            "seats": seats
+        }
+
+    def portfolios(self, count=10, max_nodes=200000):
+        """
+        Searches best purchase portfolios
+
+        Parameters:
+            count (int): Number of portfolios to return
+            max_nodes (int): Maximum number of explored nodes. When reached, the best portfolios found are returned
+
+        Returns:
+            portfolios: List of portfolios sorted by decreasing weekly profit. Each portfolio is a dictionary
+            with weekly "profit" in $, purchase "cost" in $ and "purchases" a dictionary of (model, count) indexed by
+            (hub, destination) lines
+        """
+        order = [k for k in range(0, len(self.options)) if len(self.options[k]) > 0]
+        hulls = [self._hull(self.options[k]) for k in order]
+        # Lines whose cheapest hull segment is free come first
+        ratio = np.array([np.inf if hull[0][0] <= 0 else hull[0][1] / hull[0][0] for hull in hulls])
+        order = [order[k] for k in np.argsort(-ratio, kind="stable")]
+        hulls = [hulls[k] for k in np.argsort(-ratio, kind="stable")]
+        bounds = self._bounds(hulls)
+
+        def bound(i, budget):
+            cum_cost, cum_profit, slope = bounds[i]
+            j = np.searchsorted(cum_cost, budget, side="right") - 1
+            if j >= len(slope):
+                return cum_profit[-1]
+            return cum_profit[j] + (budget - cum_cost[j]) * slope[j]
+
+        # Depth first search with an explicit stack, chosen options are stored as linked (parent, choice) tuples
+        best = []
+        nodes = 0
+        stack = [(0, self.budget, 0., None)]
+        while len(stack) > 0:
+            i, budget, profit, chosen = stack.pop()
+            nodes += 1
+            if len(best) == count and profit + bound(i, budget) <= best[0][0]:
+                continue
+
+            if i == len(order) or nodes > max_nodes:
+                choice = []
+                while chosen is not None:
+                    chosen, item = chosen
+                    choice.append(item)
+                item = (profit, nodes, choice[::-1])
+                if len(best) < count:
+                    heapq.heappush(best, item)
+                elif profit > best[0][0]:
+                    heapq.heapreplace(best, item)
+                continue
+
+            children = [(option[1] + bound(i + 1, budget - option[0]), option)
+                        for option in self.options[order[i]] if option[0] <= budget]
+            children.append((bound(i + 1, budget), None))
+            # Pushed by increasing bound so that the most promising child is explored first
+            for _, option in sorted(children, key=lambda x: -x[0])[::-1]:
+                if option is None:
+                    stack.append((i + 1, budget, profit, chosen))
+                else:
+                    stack.append((i + 1, budget - option[0], profit + option[1], (chosen, (order[i], option))))
+
+        portfolios = []
+        for profit, _, choice in sorted(best, key=lambda x: -x[0]):
+            portfolios.append({
+                "profit": profit,
+                "cost": sum(option[0] for _, option in choice),
+                "purchases": {self._lines[k]: (option[2], option[3]) for k, option in choice}
+            })
+
+        return portfolios
+
+    def planning(self, portfolio):
+        """Generates the flat planning of a portfolio returned by portfolios function"""
+        lines = {}
+        planes = {}
+        for (hub_iata, dst_iata), (name, count) in portfolio["purchases"].items():
+            lines.setdefault(hub_iata, {})[dst_iata] = self.lines[hub_iata][dst_iata]
+            planes_list = [copy.copy(self.planes[name]) for _ in range(0, count)]
+            planes.update(Plane.id_with(hub_iata + "-" + dst_iata, planes_list))
+
+        return scheduling.FlatPlanning(lines, planes, self.fill, self.add_time, self.target, self.context)
+
+    @staticmethod
+    def _hull(options):
+        # Segments of the upper concave hull of (cost, profit) options starting from no purchase
+        points = [(0., 0.)]
+        for cost, profit, _, _ in options:
+            while len(points) > 1:
+                (c0, p0), (c1, p1) = points[-2], points[-1]
+                if (p1 - p0) * (cost - c0) <= (profit - p0) * (c1 - c0):
+                    points.pop()
+                else:
+                    break
+            points.append((cost, profit))
+
+        return [(points[k + 1][0] - points[k][0], points[k + 1][1] - points[k][1]) for k in range(0, len(points) - 1)]
+
+    @staticmethod
+    def _bounds(hulls):
+        # Linear relaxation of the remaining lines from each line: hull segments sorted by decreasing slope
+        bounds = [None] * (len(hulls) + 1)
+        segments = np.zeros((0, 2))
+        for i in range(len(hulls), -1, -1):
+            if i < len(hulls):
+                segments = np.concatenate([segments, np.array(hulls[i], dtype=float)])
+                segments = segments[np.argsort(-Planner._slopes(segments), kind="stable")]
+            cum_cost = np.concatenate([[0.], np.cumsum(segments[:, 0])])
+            cum_profit = np.concatenate([[0.], np.cumsum(segments[:, 1])])
+            bounds[i] = (cum_cost, cum_profit, Planner._slopes(segments))
+
+        return bounds
+
+    @staticmethod
+    def _slopes(segments):
+        # Profit by cost of hull segments, free segments have an infinite slope
+        slopes = np.full(segments.shape[0], np.inf)
+        np.divide(segments[:, 1], segments[:, 0], out=slopes, where=segments[:, 0] > 0)
+        return slopes
+
+    def _options(self):
+        scores = self.scores()
+        options = []
+        for i in range(0, len(self._lines)):
+            line_options = []
+            for j in range(0, len(self._models)):
+                if scores["profit"][i, j] <= 0:
+                    continue
+                for k in range(1, scores["count"][i, j] + 1):
+                    cost = scores["acq"][i, j] + k * scores["price"][i, j]
+                    line_options.append((cost, k * scores["profit"][i, j], self._models[j], k))
+
+            # Keeps options that are not dominated by a cheaper option
+            pareto = []
+            for option in sorted(line_options, key=lambda x: (x[0], -x[1])):
+                if len(pareto) == 0 or option[1] > pareto[-1][1]:
+                    pareto.append(option)
+            options.append(pareto)
+
+        return options
 
 
 class Plot(GenericPlot):
@@ -61,9 +433,6 @@ class Plot(GenericPlot):
         sorted_plans = data.sorted()
         size = min(max_plans, len(sorted_plans))
 
-        bar_width = 0.2
-        opacity = 0.4
-
         profits_by_line = []
         profitability_by_line = []
         price_by_lines = []
@@ -73,6 +442,7 @@ class Plot(GenericPlot):
             profitability_by_line.append(plan.by_lines(plan.profitability()))
             price_by_lines.append(plan.price_by_lines())
 
+        jobs = []
         for hub_iata, lines in data.plannings[0].lines.items():
             for dst_iata, line in lines.items():
                 profits, initial_costs, profitability, names = [], [], [], []
@@ -83,83 +453,109 @@ class Plot(GenericPlot):
                     profitability.append(profitability_by_line[k][hub_iata][dst_iata])
                     names.append("Planning {:d}".format(k + 1))
 
-                index = np.arange(size)
+                jobs.append(((profits, initial_costs, profitability, names),
+                             {"xl": "Planes", "title": "Profits vs initial cost " + hub_iata + "-" + dst_iata}))
 
-                plt.bar(index, profits, bar_width,
-                        alpha=opacity,
-                        color="b",
-                        label="Profits (Millions $)")
+        cls.batch(_draw_sorted, jobs)
 
-                plt.bar(index + bar_width, initial_costs, bar_width,
-                        alpha=opacity,
-                        color="r",
-                        label="Initial cost (100M$)")
+    @classmethod
+    def heatmap(cls, data, max_labels=400):
+        """
+        Plots a heatmap of profitability over the lines covered and the plannings contained in data
 
-                plt.bar(index + 2 * bar_width, profitability, bar_width,
-                        alpha=opacity,
-                        color="g",
-                        label="Profitability")
+        When there are too many cells, annotations and lines ticks are only drawn for one line over n so that
+        there is at most max_labels annotations.
+        """
+        values = data.heatmap()
+        plannings_ticks = ["Planning {:d}".format(k + 1) for k in range(0, len(data.plannings))]
+        lines_ticks = ["-".join(line) for line in data.lines()]
 
-                plt.xticks(index + bar_width / 3, names)
-                cls.render(xl="Planes", title="Profits vs initial cost " + hub_iata + "-" + dst_iata)
+        cls.batch(_draw_heatmap, [((values, plannings_ticks, lines_ticks, max_labels),
+                                   {"title": "Profitability comparison", "legend": False})])
 
     @classmethod
-    def heatmap(cls, data):
-        """Plots a heatmap of profitability over the lines covered and the plannings contained in data"""
-        heatmap_planes = data.heatmap()
-        size = len(data.plannings)
+    def pareto(cls, data):
+        """Plots the initial cost and weekly profit of each planning of data, Pareto-optimal ones are colored by margin"""
+        frontier, summaries = data.pareto()
+        points = np.array([[x["cost"] / 1.e6, x["profits"] / 1.e6] for x in summaries]).reshape(-1, 2)
+        optimal = np.array([[x["cost"] / 1.e6, x["profits"] / 1.e6, x["margin"]] for x in frontier]).reshape(-1, 3)
 
-        plannings_ticks = ["Planning {:d}".format(k + 1) for k in range(0, size)]
+        cls.batch(_draw_pareto, [((points, optimal),
+                                  {"xl": "Initial cost (Millions $)", "yl": "Weekly profits (Millions $)",
+                                   "title": "Pareto frontier"})])
 
-        lines_ticks = []
-        for hub_iata, lines in data.plannings[0].lines.items():
-            for dst_iata, line in lines.items():
-                lines_ticks.append(hub_iata + "-" + dst_iata)
 
-        values = []
-        for i in range(0, len(lines_ticks)):
-            hub_iata, dst_iata = lines_ticks[i].split("-")
-            values.append([])
-            for j in range(0, len(plannings_ticks)):
-                values[i].append(heatmap_planes[j][hub_iata][dst_iata])
+def _draw_pareto(fig, points, optimal):
+    ax = fig.gca()
+    ax.scatter(points[:, 0], points[:, 1], s=8, color="0.7", alpha=0.5, label="Plannings")
+    ax.step(optimal[:, 0], optimal[:, 1], where="post", color="0.4", linewidth=0.8)
+    scatter = ax.scatter(optimal[:, 0], optimal[:, 1], s=24, c=optimal[:, 2], cmap="winter", label="Pareto-optimal")
+    fig.colorbar(scatter, ax=ax, label="Margin")
+
+
+def _draw_sorted(fig, profits, initial_costs, profitability, names):
+    bar_width = 0.2
+    opacity = 0.4
+
+    ax = fig.gca()
+    index = np.arange(len(names))
+
+    ax.bar(index, profits, bar_width,
+           alpha=opacity,
+           color="b",
+           label="Profits (Millions $)")
+
+    ax.bar(index + bar_width, initial_costs, bar_width,
+           alpha=opacity,
+           color="r",
+           label="Initial cost (100M$)")
+
+    ax.bar(index + 2 * bar_width, profitability, bar_width,
+           alpha=opacity,
+           color="g",
+           label="Profitability")
+
+    ax.set_xticks(index + bar_width / 3)
+    ax.set_xticklabels(names)
 
-        values = np.array(values)
 
-        # get the tick label font size
-        dpi = 72.27
+def _draw_heatmap(fig, values, plannings_ticks, lines_ticks, max_labels):
+    # get the tick label font size
+    dpi = 72.27
 
-        # compute the matrix height in points and inches
-        matrix_height_pt = 40 * values.shape[0]
-        matrix_height_in = matrix_height_pt / dpi
+    # compute the matrix height in points and inches, rows are shrunk when there are a lot of lines
+    matrix_height_pt = 40 * min(values.shape[0], 50) + 4 * max(values.shape[0] - 50, 0)
+    matrix_height_in = matrix_height_pt / dpi
 
-        # compute the required figure height
-        top_margin = 0.07  # in percentage of the figure height
-        bottom_margin = 0.07  # in percentage of the figure height
-        figure_height = matrix_height_in / (1 - top_margin - bottom_margin)
+    # compute the required figure height
+    top_margin = 0.07  # in percentage of the figure height
+    bottom_margin = 0.07  # in percentage of the figure height
+    figure_height = matrix_height_in / (1 - top_margin - bottom_margin)
 
-        # build the figure instance with the desired height
-        fig, ax = plt.subplots(
-            figsize=(7, figure_height),
-            gridspec_kw=dict(top=1 - top_margin, bottom=bottom_margin))
+    # build the figure instance with the desired height
+    fig.set_size_inches(7, figure_height)
+    ax = fig.subplots(gridspec_kw=dict(top=1 - top_margin, bottom=bottom_margin))
 
-        ax = sns.heatmap(values, ax=ax, cbar=False, cmap="winter")
+    ax = sns.heatmap(values, ax=ax, cbar=False, cmap="winter")
 
-        # We want to show all ticks...
-        ax.set_xticks(np.arange(len(plannings_ticks)))
-        ax.set_yticks(np.arange(len(lines_ticks)))
-        # ... and label them with the respective list entries
-        ax.set_xticklabels(plannings_ticks)
-        ax.set_yticklabels(lines_ticks)
+    # Only one line over step is labelled
+    step = int(np.ceil(values.size / max_labels)) if values.size > 0 else 1
+    rows = np.arange(0, values.shape[0], step)
 
-        # Rotate the tick labels and set their alignment.
-        plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    # We want to show all ticks...
+    ax.set_xticks(np.arange(len(plannings_ticks)) + 0.5)
+    ax.set_yticks(rows + 0.5)
+    # ... and label them with the respective list entries
+    ax.set_xticklabels(plannings_ticks)
+    ax.set_yticklabels([lines_ticks[i] for i in rows])
 
-        plt.setp(ax.get_yticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    # Rotate the tick labels and set their alignment.
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
 
-        # Loop over data dimensions and create text annotations.
-        for i in range(len(lines_ticks)):
-            for j in range(len(plannings_ticks)):
-                ax.text(j + 0.5, i + 0.5, "{:d} %".format(int(100 * values[i, j])), ha="center", va="center",
-                        color="w")
+    plt.setp(ax.get_yticklabels(), rotation=45, ha="right", rotation_mode="anchor")
 
-        cls.render(title="Profitability comparison", legend=False)
+    # Create text annotations of labelled lines.
+    percents = (100 * values[rows]).astype(int)
+    for i in range(0, len(rows)):
+        for j in range(0, len(plannings_ticks)):
+            ax.text(j + 0.5, rows[i] + 0.5, "{:d} %".format(percents[i, j]), ha="center", va="center", color="w")
@@ -0,0 +1,173 @@
+"""
+Tools for reconciliation of planning forecasts with financial records.
+
+Reconcile module compares the daily cash predicted by a Planning object with the actual financial records of a
+finance.Data object over the date base of the financial data. It measures how wrong the planning indicators are and
+fits correction factors of the planning parameters (fill ratio and fuel price) so the next plannings can be evaluated
+with realistic values.
+
+The planning days are aligned with the calendar assuming the first day of the planning week is a monday.
+"""
+
+import finance
+from finance import Key
+from finance import Field
+from utilities import *
+
+
+class Data:
+    """
+    Data class represents a planning and financial records aligned over the days of the financial date base.
+
+    Predicted values are computed once per planning week day and repeated over the effective range of the date base.
+
+    Attributes:
+        plan (Planning): Planning which is assumed to be followed during the covered period
+        data (finance.Data): Actual financial records
+        cost_keys (list): Keys of financial records containing operational costs ie. fuel and airport taxes
+        days (numpy.ndarray): datetime64 array of the reconciled days
+        predicted (dict): Daily predicted values indexed by "flight", "fuel", "tax" and "costs"
+        actual (dict): Daily actual values indexed by "flight" and "costs"
+    """
+
+    def __init__(self, plan, data, cost_keys=None):
+        """
+        Constructs a Data object and aligns planning predictions with actual records.
+
+        Parameters:
+            plan (Planning): Planning to reconcile
+            data (finance.Data): Actual financial records, only the effective range of the date base is reconciled
+            cost_keys (list): Keys of operational costs records, if None costs are not reconciled
+        """
+        self.plan = plan
+        self.data = data
+        self.cost_keys = [] if cost_keys is None else cost_keys
+
+        base = data.base
+        self.days = base.days[base.bounds[0]:base.bounds[-1]]
+        week_day = (self.days.astype(int) + 3) % 7
+
+        week = self.week()
+        self.predicted = {key: values[week_day] for key, values in week.items()}
+        self.actual = {Key.flight.value: self._actual([Key.flight.value])}
+        if len(self.cost_keys) > 0:
+            self.actual["costs"] = self._actual(self.cost_keys)
+
+    def week(self):
+        """
+        Computes predicted values for each week day of the planning.
+
+        Returns:
+            Dictionary of arrays of 7 values indexed by "flight" for turnovers in $, "fuel" for fuel consumption in L,
+            "tax" for airport taxes in $ and "costs" for operational costs in $
+        """
+        week = {Key.flight.value: np.zeros(7), "fuel": np.zeros(7), "tax": np.zeros(7)}
+        taxes = self.plan.context.line_taxes(self.plan.lines)
+        for day in range(0, 7):
+            flights = self.plan.flights(day)
+            week[Key.flight.value][day] = sum(self.plan.by_hubs(self.plan.turnovers(day), day).values())
+            week["fuel"][day] = sum(self.plan.by_hubs(self.plan.fuel_cons(day), day).values())
+            for hub_iata, hub in taxes.items():
+                for dst_iata, tax in hub.items():
+                    week["tax"][day] += tax * sum(flights[hub_iata][dst_iata].values())
+
+        week["costs"] = week["fuel"] * self.plan.context.fuel_price + week["tax"]
+        return week
+
+    def errors(self):
+        """
+        Computes prediction errors for each reconciled key.
+
+        Errors are computed as predicted minus actual daily values.
+
+        Returns:
+            Dictionary indexed by "flight" and "costs" of dictionaries containing "bias" mean error in $,
+            "mae" mean absolute error in $, "rmse" root mean square error in $ and "mape" mean absolute error
+            relative to actual values. Days with no actual value are excluded from "mape"
+        """
+        errors = {}
+        for key, actual in self.actual.items():
+            error = self.predicted[key] - actual
+            nonzero = actual != 0.
+            errors[key] = {
+                "bias": error.mean(),
+                "mae": np.abs(error).mean(),
+                "rmse": np.sqrt((error ** 2).mean()),
+                "mape": np.abs(error[nonzero] / actual[nonzero]).mean() if nonzero.any() else np.nan
+            }
+
+        return errors
+
+    def corrections(self):
+        """
+        Fits correction factors of planning parameters with least squares.
+
+        Turnovers and fuel consumption are proportional to the fill ratio so the corrected fill is the planning
+        fill scaled by the best factor between predicted and actual turnovers. The fuel price is then fitted so
+        that corrected fuel consumption and airport taxes match actual operational costs.
+
+        Returns:
+            Dictionary with corrected "fill" ratio and "fuel_price" in $/L. Price is None when costs are not
+            reconciled.
+        """
+        predicted, actual = self.predicted[Key.flight.value], self.actual[Key.flight.value]
+        scale = (predicted @ actual) / (predicted @ predicted) if predicted.any() else 1.
+        corrections = {"fill": self.plan.fill * scale, "fuel_price": None}
+
+        if "costs" in self.actual:
+            fuel = scale * self.predicted["fuel"]
+            fuel_costs = self.actual["costs"] - self.predicted["tax"]
+            corrections["fuel_price"] = (fuel @ fuel_costs) / (fuel @ fuel) if fuel.any() else None
+
+        return corrections
+
+    def reduce(self):
+        """
+        Reduces predicted and actual values according to the date base.
+
+        Returns:
+            Dictionary of reduced values indexed by "<key>" for actual values and "<key>.predicted" for predictions
+        """
+        base = self.data.base
+        y = {}
+        for key, actual in self.actual.items():
+            y[key] = base.reduce(self._covered(actual))
+            y[key + ".predicted"] = base.reduce(self._covered(self.predicted[key]))
+
+        return y
+
+    def _actual(self, keys):
+        values = np.zeros(self.data.base.covered)
+        for key in keys:
+            try:
+                values += np.abs(self.data.fields[key][Field.data.value])
+            except KeyError:
+                continue
+        return self.data.base.slice(values)
+
+    def _covered(self, values):
+        covered = np.zeros(self.data.base.covered)
+        covered[self.data.base.bounds[0]:self.data.base.bounds[-1]] = values
+        return covered
+
+
+class Plot(finance.Plot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for every result that can be computed with Data objects. Figures are drawn
+    using finance plotting functions and rendered along with finance figures.
+    """
+
+    @staticmethod
+    def compare(data):
+        """Plots predicted and actual values for each reconciled key"""
+        x = Plot.date_ticks(data.data)
+        y = Plot.scale(data.reduce())
+        label = {}
+        for key in data.actual.keys():
+            label[key] = data.data.fields[key][Field.name.value] if key in data.data.fields else "Costs"
+            label[key + ".predicted"] = label[key] + " predicted"
+
+        Plot.keys(x, y, "Date MM-DD", "Millions $", label,
+                  title="Planning reconciliation", date=data.data.base.end_date())
@@ -7,10 +7,56 @@ and lines to purchase and to find the most profitable planning.
 """
 
 from model import *
+from utilities import Labelled
+from utilities import profiled
+from concurrent.futures import ProcessPoolExecutor
 import copy
+import economics
+import functools
+import heapq
+import os
+from operator import itemgetter
 
-liters_barrel = 159.0  # L/barrel
-petrol_price = 53.53 / liters_barrel  # $/L
+
+def cached(contextual=True, terms=()):
+    """
+    Decorator caching an indicator of a planning by week day and economics context
+
+    Cached results are shared by every caller so they must not be modified, see Planning.clear.
+
+    Parameters:
+        contextual (bool): The indicator takes day and context arguments, the context of the planning being used when
+        context is None. If False the indicator only takes a day argument and is cached once for every context
+        terms (tuple): Names of context fields the indicator also accepts as arguments, after context or in place of
+        it as in the signatures before contexts. Given terms replace the ones of the context
+    """
+
+    def decorator(method):
+        if not contextual:
+            @functools.wraps(method)
+            def wrapper(self, day=None):
+                return self._cached((method.__name__, day), method, day)
+
+            return wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, day=None, context=None, *args, **kwargs):
+            if context is not None and not isinstance(context, economics.Context):
+                context, args = None, (context,) + args
+            if len(args) > len(terms) or any(key not in terms for key in kwargs.keys()):
+                names = ", ".join(("day", "context") + terms)
+                raise TypeError("{}() takes {} arguments".format(method.__name__, names))
+
+            context = self.context if context is None else context
+            overrides = dict(zip(terms, args), **kwargs)
+            overrides = {key: value for key, value in overrides.items() if value is not None}
+            if len(overrides) > 0:
+                context = economics.Context(**dict(context._asdict(), **overrides))
+            return self._cached((method.__name__, day, context), method, day, context)
+
+        return wrapper
+
+    return decorator
 
 
 class Planning:
@@ -25,6 +71,10 @@ class Planning:
 
     All the planning indicators are evaluated on the basis of this schedule.
 
+    Fuel price, loan terms, fill curve and taxes are given by an economics.Context. Indicators are computed in the
+    context of the planning by default and can be computed in any other context, they are cached for each week day and
+    context. Use evaluate to compare many contexts side by side.
+
     To manually specify a schedule you have to fill a schedule dictionary which is indexed by plane id and week day.
     Eg:
     ```python
@@ -36,7 +86,7 @@ class Planning:
     Also note that the schedule used does not mention any time data.
     It's assumed that all the flights in a daily schedule are contiguous and start
     at 00:00 UTC since Airlines-Manger 2 does not take in account planes filling differences due to disadvantages
-    schedules.
+    schedules. Use timeline.Timeline to give departure times to the flights and check them against curfews.
 
     Attributes:
         lines (dict): lines to deserve, indexed by hub and destination
@@ -44,19 +94,25 @@ class Planning:
         schedule (dict): dictionary giving weekly schedule for each plane
         fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
         add_time (float): additional time in hours for each flight
+        context (economics.Context): Economic conditions of the planning
 
     """
 
-    def __init__(self, lines, planes, schedule=None, fill=0.86, add_time=1.):
+    def __init__(self, lines, planes, schedule=None, fill=0.86, add_time=1., context=None):
 
         self.lines = lines
         self.planes = planes
         self.schedule = {} if schedule is None else schedule
         self.fill = fill
         self.add_time = add_time
+        self.context = economics.Context() if context is None else context
+        self._economics = {}
+        self._cache = {}
 
         self.generate_schedule()
 
+    @profiled()
+    @cached(contextual=False)
     def flights(self, day=None):
         """
         Counts number of flights
@@ -82,15 +138,19 @@ class Planning:
                         count[hub_iata][dst_iata][plane_id] += day_schedule.count(hub_iata + "-" + dst_iata)
         return count
 
-    def pax(self, day=None):
+    @profiled()
+    @cached()
+    def pax(self, day=None, context=None):
         """
         Counts PAX, ie. number of passengers
         Parameter:
             day (int): Week day to count, if None the count is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
         Returns:
             pax: Dictionary of PAX indexed by hub, line, plane and market
         """
         flights = self.flights(day)
+        fills = context.line_fills(self.lines, self.fill)
 
         pax = {}
         for hub_iata, lines in self.lines.items():
@@ -101,22 +161,25 @@ class Planning:
                     pax[hub_iata][dst_iata][plane_id] = {}
                     flights_count = flights[hub_iata][dst_iata][plane_id]
                     for m in Market:
-                        plane_fill = self.fill * self.planes[plane_id].pax[m.name]
+                        plane_fill = fills[hub_iata][dst_iata] * self.planes[plane_id].pax[m.name]
                         pax[hub_iata][dst_iata][plane_id][m.name] = 2 * plane_fill * flights_count
 
         return pax
 
-    def pax_delta(self, day=None):
+    @profiled()
+    @cached()
+    def pax_delta(self, day=None, context=None):
         """
         Counts PAX remaining with current schedule
 
         Parameter:
             day (int): Week day to count, if None the count is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
 
         Returns:
             delta: Dictionary of PAX remaining indexed by hub, line, plane and market
         """
-        pax = self.pax(day)
+        pax = self.pax(day, context)
 
         delta = {}
         for hub_iata, lines in self.lines.items():
@@ -130,6 +193,8 @@ class Planning:
 
         return delta
 
+    @profiled()
+    @cached(contextual=False)
     def flight_time(self, day=None):
         """
         Computes flight time in hours
@@ -141,18 +206,23 @@ class Planning:
             time: Dictionary of flight time indexed by hub, line and plane
         """
         flights = self.flights(day)
+        table = self.economics()
+        models = {plane_id: table.model_index[plane.name] for plane_id, plane in self.planes.items()}
+        flight_time = table.flight_time.tolist()
 
         time = {}
         for hub_iata, lines in self.lines.items():
             time[hub_iata] = {}
             for dst_iata, line in lines.items():
                 time[hub_iata][dst_iata] = {}
+                row = table.line_index[(hub_iata, dst_iata)]
                 for plane_id in self.planes.keys():
-                    flight_time = self.planes[plane_id].flight_time(line.distance, self.add_time)
-                    time[hub_iata][dst_iata][plane_id] = 2 * flight_time * flights[hub_iata][dst_iata][plane_id]
+                    plane_time = flight_time[row][models[plane_id]]
+                    time[hub_iata][dst_iata][plane_id] = 2 * plane_time * flights[hub_iata][dst_iata][plane_id]
 
         return time
 
+    @profiled()
     def use_rate(self, day=None):
         flight_time = self.flight_time(day)
 
@@ -166,41 +236,50 @@ class Planning:
 
         return percent
 
-    def fuel_cons(self, day=None):
+    @profiled()
+    @cached()
+    def fuel_cons(self, day=None, context=None):
         """
         Computes fuel consumption in liters
 
         Parameter:
             day (int): Week day to compute, if None computing is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
 
         Returns:
             fuel: Dictionary of fuel consumption indexed by hub, line and plane
         """
-        pax = self.pax(day)
+        pax = self.pax(day, context)
+        table = self.economics()
+        models = {plane_id: table.model_index[plane.name] for plane_id, plane in self.planes.items()}
+        fuel_per_pax = table.fuel_per_pax.tolist()
 
         fuel = {}
         for hub_iata, lines in self.lines.items():
             fuel[hub_iata] = {}
             for dst_iata, line in lines.items():
                 fuel[hub_iata][dst_iata] = {}
+                row = table.line_index[(hub_iata, dst_iata)]
                 for plane_id in self.planes.keys():
                     total_pax = sum(pax[hub_iata][dst_iata][plane_id].values())
-                    cons_per_pax = 0.01 * line.distance * self.planes[plane_id].cons
-                    fuel[hub_iata][dst_iata][plane_id] = total_pax * cons_per_pax
+                    fuel[hub_iata][dst_iata][plane_id] = total_pax * fuel_per_pax[row][models[plane_id]]
 
         return fuel
 
-    def turnovers(self, day=None):
+    @profiled()
+    @cached()
+    def turnovers(self, day=None, context=None):
         """
         Computes operational turnover in dollars $
 
         Parameter:
             day (int): Week day to compute, if None computing is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
 
         Returns:
             cash: Dictionary of turnovers indexed by hub, line, plane and market
         """
-        pax = self.pax(day)
+        pax = self.pax(day, context)
 
         cash = {}
         for hub_iata, lines in self.lines.items():
@@ -215,18 +294,22 @@ class Planning:
 
         return cash
 
-    def costs(self, day=None):
+    @profiled()
+    @cached()
+    def costs(self, day=None, context=None):
         """
         Computes operational cost in dollars $
 
         Parameter:
             day (int): Week day to compute, if None computing is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
 
         Returns:
             cash: Dictionary of costs indexed by hub, line, plane and market
         """
-        fuel = self.fuel_cons(day)
+        fuel = self.fuel_cons(day, context)
         flights = self.flights(day)
+        taxes = context.line_taxes(self.lines)
 
         cash = {}
         for hub_iata, lines in self.lines.items():
@@ -236,26 +319,29 @@ class Planning:
                 for plane_id in self.planes.keys():
                     cash[hub_iata][dst_iata][plane_id] = {}
                     fuel_cons = fuel[hub_iata][dst_iata][plane_id]
-                    tax = flights[hub_iata][dst_iata][plane_id] * line.tax
+                    tax = flights[hub_iata][dst_iata][plane_id] * taxes[hub_iata][dst_iata]
                     pax = sum(self.planes[plane_id].pax.values())
                     for m in Market:
                         pax_ratio = self.planes[plane_id].pax[m.name] / float(pax)
-                        cash[hub_iata][dst_iata][plane_id][m.name] = (fuel_cons * petrol_price + tax) * pax_ratio
+                        cash[hub_iata][dst_iata][plane_id][m.name] = (fuel_cons * context.fuel_price + tax) * pax_ratio
 
         return cash
 
-    def profits(self, day=None):
+    @profiled()
+    @cached()
+    def profits(self, day=None, context=None):
         """
         Computes operational profit dollars $
 
         Parameter:
             day (int): Week day to compute, if None computing is performed over the week
+            context (economics.Context): Economic context, if None the context of the planning is used
 
         Returns:
             cash: Dictionary of profits indexed by hub, line, plane and market
         """
-        turnover = self.turnovers(day)
-        cost = self.costs(day)
+        turnover = self.turnovers(day, context)
+        cost = self.costs(day, context)
 
         cash = {}
         for hub_iata, lines in self.lines.items():
@@ -271,7 +357,9 @@ class Planning:
 
         return cash
 
-    def profitability(self, day=None, loan_rate=0.01):
+    @profiled()
+    @cached(terms=("loan_rate",))
+    def profitability(self, day=None, context=None, loan_rate=None):
         """
         Computes profitability in percent %
 
@@ -283,13 +371,15 @@ class Planning:
 
         Parameters:
             day (int): Week day to compute, if None computing is performed over the week
-            loan_rate (float): Loan rate applied when purchasing lines and hubs
+            context (economics.Context): Economic context giving the loan rate, if None the context of the planning is
+            used
+            loan_rate (float): Loan rate applied when purchasing lines and hubs, if None the one of the context
 
         Returns:
             percent: Dictionary of profitability indexed by hub, line, plane and market
         """
         flight_time = self.flight_time(day)
-        profits = self.profits(day)
+        profits = self.profits(day, context)
         price_by_line = self.price_by_lines()
 
         percent = {}
@@ -300,7 +390,8 @@ class Planning:
                 for plane_id, plane in self.planes.items():
                     percent[hub_iata][dst_iata][plane_id] = {}
                     wear_ratio = plane.wear_rate * flight_time[hub_iata][dst_iata][plane_id] / 100.
-                    plane_cost = plane.price * (wear_ratio + loan_rate) + price_by_line[hub_iata][dst_iata][plane.name]
+                    line_price = price_by_line[hub_iata][dst_iata].get(plane.name, 0.)
+                    plane_cost = plane.price * (wear_ratio + context.loan_rate) + line_price
                     pax = sum(self.planes[plane_id].pax.values())
                     for m in Market:
                         pax_ratio = self.planes[plane_id].pax[m.name] / float(pax)
@@ -313,7 +404,9 @@ class Planning:
 
         return percent
 
-    def margin(self, day=None, loan_rate=0.01, loan_period=30):
+    @profiled()
+    @cached(terms=("loan_rate", "loan_period"))
+    def margin(self, day=None, context=None, loan_rate=None, loan_period=None):
         """
         Computes margin in percent %
 
@@ -326,15 +419,18 @@ class Planning:
 
         Parameters:
             day (int): Week day to compute, if None computing is performed over the week
-            loan_rate (float): Loan rate applied when purchasing lines and hubs
-            loan_period (int): Duration of repayment in weeks
+            context (economics.Context): Economic context giving the loan rate and the duration of repayment, if None
+            the context of the planning is used
+            loan_rate (float): Loan rate applied when purchasing lines and hubs, if None the one of the context
+            loan_period (int): Duration of repayment in weeks, if None the one of the context
 
         Returns:
             percent: Dictionary of margin indexed by hub, line, plane and market
         """
         flight_time = self.flight_time(day)
-        profits = self.profits(day)
-        costs = self.costs(day)
+        profits = self.profits(day, context)
+        costs = self.costs(day, context)
+        loan_rate, loan_period = context.loan_rate, context.loan_period
 
         percent = {}
         for hub_iata, lines in self.lines.items():
@@ -386,6 +482,7 @@ class Planning:
 
         return cash
 
+    @profiled()
     def price_by_lines(self):
         """
         Computes total fleet price by line in dollars $
@@ -411,6 +508,42 @@ class Planning:
 
         return cash
 
+    @profiled()
+    def labelled(self, data, day=None, by_market=False, present=True):
+        """
+        Converts data to a labelled array with axes "line", "plane" and eventually "market"
+
+        Labels of line axis are (hub, destination) IATA couples, labels of plane axis are plane ids. The planes present
+        on a line are the ones deserving it, so reductions of the array only account for them.
+
+        Parameters:
+            data (dict): Data to convert. A dictionary generated by the methods above
+            day (int): Week day to compute, must be the same as precised when computing data
+            by_market (bool): Keep market axis. Data without markets are equally shared between markets
+            present (bool): If False, every plane is present on every line
+
+        Returns:
+            Labelled array of data
+        """
+        line_keys = [(hub_iata, dst_iata) for hub_iata, lines in self.lines.items() for dst_iata in lines.keys()]
+        plane_ids = list(self.planes.keys())
+        markets = [m.name for m in Market]
+
+        rows = [[data[hub_iata][dst_iata][plane_id] for plane_id in plane_ids] for hub_iata, dst_iata in line_keys]
+        if len(rows) > 0 and len(rows[0]) > 0 and isinstance(rows[0][0], dict):
+            getter = itemgetter(*markets)
+            values = np.array([getter(cell) for row in rows for cell in row], dtype=float)
+            values = values.reshape(len(line_keys), len(plane_ids), len(markets))
+            values = values if by_market else values.sum(axis=2)
+        else:
+            values = np.array(rows, dtype=float).reshape(len(line_keys), len(plane_ids))
+            values = np.repeat(values[:, :, np.newaxis] / 3., len(markets), axis=2) if by_market else values
+
+        mask = self._deserve_matrix(day) if present else None
+        axes = [("line", line_keys), ("plane", plane_ids)] + ([("market", markets)] if by_market else [])
+        return Labelled(values, axes, mask if mask is None or not by_market else mask[:, :, np.newaxis])
+
+    @profiled()
     def reduce_by_planes(self, data, by_market=False, avg=False):
         """
         Indexes data by plane model
@@ -418,37 +551,16 @@ class Planning:
         Parameters:
             data (dict): Data to re-index. A dictionary generated by the methods above
             by_market (bool): Index by market
-            avg (bool): Average when re-indexing, if False a sum is performed
+            avg (bool): Average over the planes of each model, if False a sum is performed
 
         Returns:
             new_data: Re-indexed data by plane model and eventually market
         """
-        plane_data = self.reduce_by_plane_id(data, by_market)
-        count_planes = self.count_planes_by_name()
-
-        new_data = {}
-        for plane_id, base_data in plane_data.items():
-            if not by_market:
-
-                data_by_plane = base_data if avg else base_data / count_planes[self.planes[plane_id].name]
-
-                try:
-                    new_data[self.planes[plane_id].name] += data_by_plane
-                except KeyError:
-                    new_data[self.planes[plane_id].name] = data_by_plane
-                continue
-
-            for m in Market:
-                data_by_class = plane_data[plane_id][m.name]
-                if avg:
-                    data_by_class /= count_planes[self.planes[plane_id].name]
-                try:
-                    new_data[self.planes[plane_id].name] += data_by_class
-                except KeyError:
-                    new_data[self.planes[plane_id].name] = data_by_class
-
-        return new_data
+        models = [plane.name for plane in self.planes.values()]
+        array = self.labelled(data, by_market=by_market, present=False).reduce("line")
+        return array.reduce("plane", models, "model", mean=avg).to_dict()
 
+    @profiled()
     def reduce_by_plane_id(self, data, by_market=False):
         """
         Indexes data by plane id
@@ -460,29 +572,9 @@ class Planning:
         Returns:
             new_data: Re-indexed plane id and eventually market
         """
-        plane_data = self.by_plane_id(data, by_market)
-        new_data = {}
-        for plane_id in self.planes.keys():
-            for hub_iata, lines in self.lines.items():
-                for dst_iata, line, in lines.items():
-                    if not by_market:
-                        data_by_line = plane_data[hub_iata][dst_iata][plane_id]
-                        try:
-                            new_data[plane_id] += data_by_line
-                        except KeyError:
-                            new_data[plane_id] = data_by_line
-                        continue
-
-                    new_data[plane_id] = {}
-                    for m in Market:
-                        data_by_class = plane_data[hub_iata][dst_iata][plane_id][m.name]
-                        try:
-                            new_data[plane_id][m.name] += data_by_class
-                        except KeyError:
-                            new_data[plane_id][m.name] = data_by_class
-
-        return new_data
+        return self.labelled(data, by_market=by_market, present=False).reduce("line").to_dict()
 
+    @profiled()
     def by_hubs(self, data, day=None, by_market=False, avg=False):
         """
         Indexes data by hubs
@@ -491,36 +583,19 @@ class Planning:
             day (int): Week day to compute, must be the same as precised when computing data
             data (dict): Data to re-index. A dictionary generated by the methods above
             by_market (bool): Index by market
-            avg (bool): Average when re-indexing, if False a sum is performed
+            avg (bool): Average over the deserved lines of the averages over the planes of each line, if False a sum is
+            performed
 
         Returns:
             new_data: Re-indexed data by hub
         """
-        line_data = self.by_lines(data, day, by_market, avg)
-        count_lines = self.count_lines_by_hub()
-
-        new_data = {}
-        for hub_iata, lines in self.lines.items():
-            if not by_market:
-                new_data[hub_iata] = sum(line_data[hub_iata].values())
-                if avg:
-                    new_data[hub_iata] /= count_lines[hub_iata]
-
-                continue
-
-            new_data[hub_iata] = {}
-            for dst_iata, line in lines.items():
-                for m in Market:
-                    data_by_class = line_data[hub_iata][dst_iata][m.name]
-                    if avg:
-                        data_by_class /= count_lines[hub_iata]
-                    try:
-                        new_data[hub_iata][m.name] += data_by_class
-                    except KeyError:
-                        new_data[hub_iata][m.name] = data_by_class
-
+        hubs = [hub_iata for hub_iata, lines in self.lines.items() for _ in lines.keys()]
+        array = self.labelled(data, day, by_market).reduce("plane", mean=avg).reduce("line", hubs, "hub", mean=avg)
+        new_data = {hub_iata: {m.name: 0. for m in Market} if by_market else 0. for hub_iata in self.lines.keys()}
+        new_data.update(array.to_dict())
         return new_data
 
+    @profiled()
     def by_lines(self, data, day=None, by_market=False, avg=False):
         """
         Indexes data by lines
@@ -529,37 +604,17 @@ class Planning:
             day (int): Week day to compute, must be the same as precised when computing data
             data (dict): Data to re-index. A dictionary generated by the methods above
             by_market (bool): Index by market
-            avg (bool): Average when re-indexing, if False a sum is performed
+            avg (bool): Average over the planes deserving each line, if False a sum is performed
 
         Returns:
             new_data: Re-indexed data by hub, line and eventually market
         """
-        plane_data = self.by_plane_id(data, by_market)
-        count_planes = self.count_planes_by_line(day)
-
-        new_data = {}
-        for hub_iata, lines in self.lines.items():
-            new_data[hub_iata] = {}
-            for dst_iata, line in lines.items():
-                if not by_market:
-                    new_data[hub_iata][dst_iata] = sum(plane_data[hub_iata][dst_iata].values())
-                    if avg:
-                        new_data[hub_iata][dst_iata] /= count_planes[hub_iata][dst_iata]
-                    continue
-
-                new_data[hub_iata][dst_iata] = {}
-                for plane_id in self.planes.keys():
-                    for m in Market:
-                        data_by_class = plane_data[hub_iata][dst_iata][plane_id][m.name]
-                        if avg:
-                            data_by_class /= count_planes[hub_iata][dst_iata]
-                        try:
-                            new_data[hub_iata][dst_iata][m.name] += data_by_class
-                        except KeyError:
-                            new_data[hub_iata][dst_iata][m.name] = data_by_class
-
+        array = self.labelled(data, day, by_market).reduce("plane", mean=avg)
+        new_data = {hub_iata: {} for hub_iata in self.lines.keys()}
+        new_data.update(array.to_dict())
         return new_data
 
+    @profiled()
     def by_planes(self, data, day=None, by_market=False, avg=False):
         """
         Indexes data by planes model
@@ -568,46 +623,18 @@ class Planning:
             day (int): Week day to compute, must be the same as precised when computing data
             data (dict): Data to re-index. A dictionary generated by the methods above
             by_market (bool): Index by market
-            avg (bool): Average when re-indexing, if False a sum is performed
+            avg (bool): Average over the planes of each model deserving each line, if False a sum is performed
 
         Returns:
             new_data: Re-indexed data by hub, line, plane model and eventually market
         """
-        plane_data = self.by_plane_id(data, by_market)
-        count_planes = self.count_planes_by_line(day)
-        deserve_dst = self.deserve_dst(day)
-
-        new_data = {}
-        for hub_iata, lines in self.lines.items():
-            new_data[hub_iata] = {}
-            for dst_iata, line in lines.items():
-                new_data[hub_iata][dst_iata] = {}
-                for plane_id, week_schedule in self.schedule.items():
-                    if not deserve_dst[hub_iata][dst_iata][plane_id]:
-                        continue
-
-                    if not by_market:
-                        data_by_plane = plane_data[hub_iata][dst_iata][plane_id]
-                        if avg:
-                            data_by_plane /= count_planes[hub_iata][dst_iata]
-                        try:
-                            new_data[hub_iata][dst_iata][self.planes[plane_id].name] += data_by_plane
-                        except KeyError:
-                            new_data[hub_iata][dst_iata][self.planes[plane_id].name] = data_by_plane
-                        continue
-
-                    new_data[hub_iata][dst_iata][self.planes[plane_id].name] = {}
-                    for m in Market:
-                        data_by_class = plane_data[hub_iata][dst_iata][plane_id][m.name]
-                        if avg:
-                            data_by_class /= count_planes[hub_iata][dst_iata]
-                        try:
-                            new_data[hub_iata][dst_iata][self.planes[plane_id].name][m.name] += data_by_class
-                        except KeyError:
-                            new_data[hub_iata][dst_iata][self.planes[plane_id].name][m.name] = data_by_class
-
+        models = [plane.name for plane in self.planes.values()]
+        array = self.labelled(data, day, by_market).reduce("plane", models, "model", mean=avg)
+        new_data = {hub_iata: {} for hub_iata in self.lines.keys()}
+        new_data.update(array.to_dict(sparse=("model",)))
         return new_data
 
+    @profiled()
     def by_plane_id(self, data, by_market=False):
         """
         Indexes data by plane id
@@ -622,26 +649,9 @@ class Planning:
         Returns:
             new_data: Re-indexed data hub, line, plane id and eventually market
         """
-        new_data = {}
-        for hub_iata, lines in self.lines.items():
-            new_data[hub_iata] = {}
-            for dst_iata, line in lines.items():
-                new_data[hub_iata][dst_iata] = {}
-                for plane_id in self.planes.keys():
-                    if not by_market:
-                        try:
-                            new_data[hub_iata][dst_iata][plane_id] = sum(data[hub_iata][dst_iata][plane_id].values())
-                        except AttributeError:
-                            new_data[hub_iata][dst_iata][plane_id] = data[hub_iata][dst_iata][plane_id]
-                        continue
-
-                    try:
-                        new_data[hub_iata][dst_iata][plane_id] = data[hub_iata][dst_iata][plane_id].copy()
-                    except AttributeError:
-                        new_data[hub_iata][dst_iata][plane_id] = {}
-                        for m in Market:
-                            new_data[hub_iata][dst_iata][plane_id][m.name] = data[hub_iata][dst_iata][plane_id] / 3.
-
+        array = self.labelled(data, by_market=by_market, present=False)
+        new_data = {hub_iata: {} for hub_iata in self.lines.keys()}
+        new_data.update(array.to_dict())
         return new_data
 
     def count_planes_by_name(self):
@@ -675,6 +685,7 @@ class Planning:
 
         return count_by_hub
 
+    @profiled()
     def count_planes_by_line(self, day=None):
         """
         Counts of planes used by line
@@ -703,6 +714,7 @@ class Planning:
 
         return count_by_lines
 
+    @profiled()
     def deserve_dst(self, day=None):
         """
         Verifies if plane deserve a destination
@@ -733,6 +745,58 @@ class Planning:
 
         return deserve_dst
 
+    def economics(self, context=None):
+        """
+        Loads the unit economics table of the lines and the plane models of the planning, see economics.Table
+
+        The table is loaded once for each context, fill ratio and additional time. If context is None the context of
+        the planning is used. Planes of the same model are assumed to share speed, consumption and range, the seats of
+        the table are the ones of the last plane of each model.
+        """
+        key = (self.context if context is None else context, self.fill, self.add_time)
+        try:
+            return self._economics[key]
+        except KeyError:
+            models = {plane.name: plane for plane in self.planes.values()}
+            self._economics[key] = economics.Table.load(key[0], self.lines, models, self.fill, self.add_time)
+            return self._economics[key]
+
+    @profiled()
+    def evaluate(self, contexts, key="profits", day=None, workers=None):
+        """
+        Evaluates an indicator of the planning in many contexts side by side
+
+        Contexts are shared in chunks between worker processes. Each context gets its own cached indicators so the
+        evaluations do not interfere, the planning can also be evaluated from several threads.
+
+        Parameters:
+            contexts (list): Contexts to evaluate, see economics.Context
+            key (str): Indicator to evaluate eg. "profits", "profitability" or "margin"
+            day (int): Week day to compute, if None computing is performed over the week
+            workers (int): Number of worker processes, if None the number of CPUs is used
+
+        Returns:
+            List of the indicator indexed by hub, see by_hubs, for each context
+        """
+        contexts = list(contexts)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(contexts) < 2:
+            return [self.by_hubs(getattr(self, key)(day, context), day) for context in contexts]
+
+        size = int(np.ceil(len(contexts) / workers))
+        tasks = [(self, contexts[k:k + size], key, day) for k in range(0, len(contexts), size)]
+        with ProcessPoolExecutor(workers) as executor:
+            return [result for results in executor.map(_evaluate_task, tasks) for result in results]
+
+    def clear(self):
+        """
+        Clears cached indicators and unit economics tables. Must be called when the schedule, the planes or the lines
+        are modified in place
+        """
+        self._cache = {}
+        self._economics = {}
+
+    @profiled()
     def generate_schedule(self):
         """
         Generates a schedule
@@ -742,13 +806,84 @@ class Planning:
         override the method generate_schedule to generate the schedule with your method and call
         super().generate_schedule at the end of the overridden method.
         """
+        self.clear()
         assert self.schedule_is_valid()
 
+    def _cached(self, key, compute, *args):
+        try:
+            return self._cache[key]
+        except KeyError:
+            self._cache[key] = compute(self, *args)
+            return self._cache[key]
+
+    def _deserve_matrix(self, day=None):
+        # True for each (line, plane) couple when the plane deserves the line on day, or during the week if None
+        line_index = {}
+        for hub_iata, lines in self.lines.items():
+            for dst_iata in lines.keys():
+                line_index[hub_iata + "-" + dst_iata] = len(line_index)
+
+        plane_ids = list(self.planes.keys())
+        rows, cols = [], []
+        for col in range(0, len(plane_ids)):
+            week_schedule = self.schedule.get(plane_ids[col], [])
+            line_keys = set().union(*(week_schedule if day is None else week_schedule[day:day + 1]))
+            indices = [line_index[line_key] for line_key in line_keys if line_key in line_index]
+            rows.extend(indices)
+            cols.extend([col] * len(indices))
+
+        deserve = np.zeros((len(line_index), len(plane_ids)), dtype=bool)
+        deserve[rows, cols] = True
+        return deserve
+
+    @profiled()
+    def use_rate_matrix(self):
+        """
+        Computes use rate of each plane for each week day in a single pass over the schedule
+
+        Returns:
+            plane_ids: List of plane ids giving the order of the rows
+            use_rate: Array of use rates with shape (planes, 7)
+        """
+        plane_ids = list(self.planes.keys())
+        line_keys = [hub_iata + "-" + dst_iata for hub_iata, lines in self.lines.items() for dst_iata in lines.keys()]
+        line_index = {line_keys[k]: k for k in range(0, len(line_keys))}
+        table = self.economics()
+        models = table.cols([self.planes[plane_id].name for plane_id in plane_ids])
+
+        # Flat index (plane, day, line) of each scheduled flight, flights of lines out of the planning are ignored
+        flat = []
+        for row in range(0, len(plane_ids)):
+            week_schedule = self.schedule.get(plane_ids[row], [])
+            for day in range(0, len(week_schedule)):
+                offset = (7 * row + day) * len(line_keys)
+                flat.extend([offset + line_index[key] for key in week_schedule[day] if key in line_index])
+
+        keys, count = np.unique(np.array(flat, dtype=int), return_counts=True)
+        cell, col = np.divmod(keys, max(len(line_keys), 1))
+        flight_time = table.flight_time[col, models[cell // 7]]
+        use_rate = np.bincount(cell, weights=2 * flight_time * count / 24., minlength=7 * len(plane_ids))
+        return plane_ids, use_rate.reshape(len(plane_ids), 7)
+
+    @profiled()
+    def violations(self):
+        """
+        Finds the planes exceeding a use rate of 1
+
+        Returns:
+            List of (plane id, week day, use rate) tuples
+        """
+        plane_ids, use_rate = self.use_rate_matrix()
+        rows, days = np.nonzero(use_rate > 1.)
+        return [(plane_ids[row], int(day), float(use_rate[row, day])) for row, day in zip(rows, days)]
+
+    @profiled()
     def schedule_is_valid(self):
         """
         Check if a planning is consistent by looking up to use rates
 
-        If a plane has a use rate which exceeds 1 the plane is considered inconsistent.
+        If a plane has a use rate which exceeds 1 the plane is considered inconsistent. Use violations to know which
+        planes and days are inconsistent.
 
         Returns:
             True if the planning is valid
@@ -756,13 +891,12 @@ class Planning:
         if self.schedule == {}:
             return True
 
-        for day in range(0, 7):
-            use_rate = self.reduce_by_plane_id(self.use_rate(day))
-            for plane_id in self.planes.keys():
-                if use_rate[plane_id] > 1.:
-                    return False
+        return len(self.violations()) == 0
 
-        return True
+
+def _evaluate_task(task):
+    plan, contexts, key, day = task
+    return plan.evaluate(contexts, key, day, workers=1)
 
 
 class FlatPlanning(Planning):
@@ -781,13 +915,15 @@ class FlatPlanning(Planning):
         fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
         add_time (float): additional time in hours for each flight
         target (model.Market): Market to target to generate planning
+        context (economics.Context): Economic conditions of the planning
 
     """
 
-    def __init__(self, lines, planes, fill=0.86, add_time=1., target=Market.eco):
+    def __init__(self, lines, planes, fill=0.86, add_time=1., target=Market.eco, context=None):
         self.target = target
-        super().__init__(lines, planes, fill, add_time)
+        super().__init__(lines, planes, fill=fill, add_time=add_time, context=context)
 
+    @profiled()
     def generate_schedule(self):
         """
         Generates a Planning by filling weekly plannings for each plane according to it's ID (see ID format above)
@@ -817,7 +953,8 @@ class FlatPlanning(Planning):
         super().generate_schedule()
 
     @classmethod
-    def match(cls, target_lines, included_planes, fill=0.86, add_time=1., target=Market.eco):
+    @profiled()
+    def match(cls, target_lines, included_planes, fill=0.86, add_time=1., target=Market.eco, context=None):
         """
         Generates a fleet and a flat planning using given planes models and target lines
 
@@ -833,16 +970,172 @@ class FlatPlanning(Planning):
             fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
             add_time (float): additional time in hours for each flight
             target (model.Market): Market to target to generate planning
+            context (economics.Context): Economic conditions of the planning, if None the default context is used
         """
         lines_to_delete = []
         planes = {}
+        models = {plane.name: plane for plane in included_planes}
+        table = economics.Table.load(context, target_lines, models, fill, add_time)
         for hub_iata, lines in target_lines.items():
             for dst_iata, line in lines.items():
                 bench_plan = []
+                row = table.line_index[(hub_iata, dst_iata)]
                 for plane in included_planes:
+                    if not table.in_range[row, table.model_index[plane.name]]:
+                        continue
+
                     planes_list = [copy.copy(plane) for _ in range(0, plane.match_demand(line, add_time)[target.name])]
                     planes_dict = Plane.id_with(hub_iata + "-" + dst_iata, planes_list)
-                    plan = FlatPlanning({hub_iata: {dst_iata: line}}, planes_dict, fill, add_time, target)
+                    plan = FlatPlanning({hub_iata: {dst_iata: line}}, planes_dict, fill, add_time, target, context)
+                    if plan.schedule != {}:
+                        bench_plan.append(plan)
+
+                if len(bench_plan) == 0:
+                    lines_to_delete.append(hub_iata + "-" + dst_iata)
+                    continue
+
+                bench_plan = sorted(bench_plan,
+                                    key=lambda x: x.by_lines(x.profitability(0), 0)[hub_iata][dst_iata],
+                                    reverse=True)
+
+                for plane in bench_plan[0].planes.values():
+                    planes[plane.id] = plane
+
+        for line_id in lines_to_delete:
+            [hub_iata, dst_iata] = line_id.split("-")
+            del target_lines[hub_iata][dst_iata]
+
+        return FlatPlanning(target_lines, planes, fill, add_time, target, context)
+
+
+class MarketPlanning(FlatPlanning):
+    """
+    Flat planning with cabin configuration of the planes
+
+    Planes are bought with an economy only cabin. Each seat of business or premium class takes the space of several
+    economy seats, given by seat_space. For each line, the cabin configuration of the planes dedicated to the line is
+    chosen to maximize the revenue over all the markets, the PAX of each market being limited by its demand. Every
+    configuration of the plane capacity is evaluated at once for each line.
+
+    Then the planning is generated as a flat planning, the planes being scheduled until the demand of every market
+    is matched. Planes left without schedule are removed from the fleet of the planning. Note that the pax attribute of
+    the planes is replaced by the chosen configuration.
+
+    Attributes:
+        lines (dict): lines to deserve, indexed by hub and destination
+        planes (dict): fleet to use, indexed by plane id eg. HYD-ISB-1
+        fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+        add_time (float): additional time in hours for each flight
+        step (int): Step in number of seats between two evaluated configurations of business and premium classes
+        seat_space (dict): Space taken by a seat in number of economy seats, indexed by market
+        context (economics.Context): Economic conditions of the planning
+    """
+
+    seat_space = {Market.eco.name: 1., Market.biz.name: 1.8, Market.pre.name: 4.2}
+
+    def __init__(self, lines, planes, fill=0.86, add_time=1., step=1, context=None):
+        self.step = step
+        super().__init__(lines, planes, fill=fill, add_time=add_time, context=context)
+
+    @profiled()
+    def generate_schedule(self):
+        """
+        Generates a Planning by configuring the planes of each line and filling their weekly plannings
+
+        Planes of the same model dedicated to a line share the same configuration. Models are configured one after
+        another, each one for the demand remaining after the previous ones.
+        """
+        self.schedule = {}
+        for hub_iata, lines in self.lines.items():
+            for dst_iata, line in lines.items():
+                pax_rem = line.demand.copy()
+                planes = list(filter(lambda x: x.range > line.distance and hub_iata + "-" + dst_iata in x.id,
+                                     self.planes.values()))
+
+                for name in dict.fromkeys(map(lambda x: x.name, planes)):
+                    fleet = list(filter(lambda x: x.name == name, planes))
+                    pax = self.configuration(line, fleet[0], len(fleet), pax_rem)
+                    for plane in fleet:
+                        plane.pax = pax.copy()
+                        if all(map(lambda m: pax_rem[m.name] <= 0 or pax[m.name] == 0, Market)):
+                            break
+
+                        flights = plane.flights_per_day(line.distance, self.add_time)
+                        self.schedule[plane.id] = [[hub_iata + "-" + dst_iata] * flights] * 7
+                        for m in Market:
+                            pax_rem[m.name] -= 2 * flights * pax[m.name]
+
+        self.planes = {plane_id: plane for plane_id, plane in self.planes.items() if plane_id in self.schedule}
+        Planning.generate_schedule(self)
+
+    @profiled()
+    def configuration(self, line, plane, count=1, demand=None):
+        """
+        Chooses the cabin configuration which maximizes the revenue of a fleet over a line
+
+        Parameters:
+            line (Line): Line to deserve
+            plane (Plane): Plane model, its capacity is computed from its current configuration
+            count (int): Number of planes dedicated to the line
+            demand (dict): Daily demand indexed by market, if None the demand of the line is used
+
+        Returns:
+            pax: Dictionary of number of seats indexed by market
+        """
+        markets = [m.name for m in Market]
+        demand = np.array([(line.demand if demand is None else demand)[m] for m in markets], dtype=float)
+        ticket_price = np.array([line.ticket_price[m] for m in markets], dtype=float)
+        space = np.array([self.seat_space[m] for m in markets])
+        capacity = sum(plane.pax[m] * self.seat_space[m] for m in markets)
+
+        biz, pre = np.meshgrid(np.arange(0, capacity / space[1] + 1, self.step),
+                               np.arange(0, capacity / space[2] + 1, self.step))
+        eco = np.floor(capacity - space[1] * biz - space[2] * pre + 1e-9)
+        seats = np.stack([eco.ravel(), biz.ravel(), pre.ravel()], axis=1)[eco.ravel() >= 0]
+
+        flights = plane.flights_per_day(line.distance, self.add_time)
+        fill = self.context.fills(line.distance, self.fill)
+        pax = np.minimum(2 * fill * flights * count * seats, np.maximum(demand, 0.))
+        best = seats[np.argmax(pax @ ticket_price)]
+        return dict(zip(markets, best.tolist()))
+
+    @classmethod
+    @profiled()
+    def match(cls, target_lines, included_planes, fill=0.86, add_time=1., step=1, context=None):
+        """
+        Generates a fleet and a market planning using given planes models and target lines
+
+        The number of planes dedicated to a line is computed so that the space of the planes matches the demand of
+        every market. For each hub and line, the most profitable plane is selected and the fleet dedicated to this
+        line is generated using only this plane.
+
+        Attributes:
+            target_lines (dict): lines to deserve, indexed by hub and destination
+            included_planes (dict): planes model to use, indexed by model eg. included_plane["737-700"]
+            fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+            add_time (float): additional time in hours for each flight
+            step (int): Step in number of seats between two evaluated configurations
+            context (economics.Context): Economic conditions of the planning, if None the default context is used
+        """
+        lines_to_delete = []
+        planes = {}
+        models = {plane.name: plane for plane in included_planes}
+        table = economics.Table.load(context, target_lines, models, fill, add_time)
+        for hub_iata, lines in target_lines.items():
+            for dst_iata, line in lines.items():
+                demand = sum(line.demand[m.name] * cls.seat_space[m.name] for m in Market)
+                bench_plan = []
+                row = table.line_index[(hub_iata, dst_iata)]
+                for plane in included_planes:
+                    col = table.model_index[plane.name]
+                    capacity = sum(plane.pax[m.name] * cls.seat_space[m.name] for m in Market)
+                    if not table.in_range[row, col] or capacity * table.flights[row, col] == 0:
+                        continue
+
+                    count = int(np.round(demand / (2 * capacity * table.flights[row, col])))
+                    planes_list = [copy.copy(plane) for _ in range(0, count)]
+                    planes_dict = Plane.id_with(hub_iata + "-" + dst_iata, planes_list)
+                    plan = MarketPlanning({hub_iata: {dst_iata: line}}, planes_dict, fill, add_time, step, context)
                     if plan.schedule != {}:
                         bench_plan.append(plan)
 
@@ -861,4 +1154,183 @@ class FlatPlanning(Planning):
             [hub_iata, dst_iata] = line_id.split("-")
             del target_lines[hub_iata][dst_iata]
 
-        return FlatPlanning(target_lines, planes, fill, add_time, target)
+        return MarketPlanning(target_lines, planes, fill, add_time, step, context)
+
+
+class RebalancedPlanning(Planning):
+    """
+    Planning generated by moving the airframes of an existing schedule from over-served to under-served lines
+
+    Only the planes dedicated to a single line and the planes without schedule can be moved, other planes keep their
+    schedule. A moved plane flies its destination line as much as it can every day, like in a flat planning. Planes
+    only move within the hub of their line, planes without schedule can join any hub. Destinations must be within range.
+
+    The daily profit of a line only counts the passengers within its demand, so the gain of a move is the revenue won
+    on the destination line minus the revenue lost on the source line, minus the change of fuel and tax costs. Moves
+    are applied greedily by decreasing gain from a priority queue. Planes of the same line with the same characteristics
+    are queued once. A queued gain is recomputed when one of its lines changed since it was evaluated, and the queue is
+    rebuilt until no move has a gain above min_gain.
+
+    Attributes:
+        lines (dict): lines to deserve, indexed by hub and destination
+        planes (dict): fleet to use, indexed by plane id eg. HYD-ISB-1
+        schedule (dict): dictionary giving weekly schedule for each plane, the given schedule is not modified
+        fill (float): fill ratio, between 0 and 1, 1 means each flight entirely fills the plane
+        add_time (float): additional time in hours for each flight
+        context (economics.Context): Economic conditions of the planning, the gains are computed in this context
+        moves (list): (plane id, source line id or None, destination line id, daily gain in $) tuples in move order
+        min_gain (float): Minimum daily profit gain in $ of a move
+    """
+
+    min_gain = 1.
+
+    def __init__(self, lines, planes, schedule=None, fill=0.86, add_time=1., context=None):
+        self.moves = []
+        super().__init__(lines, planes, schedule=schedule, fill=fill, add_time=add_time, context=context)
+
+    @classmethod
+    def rebalance(cls, plan, context=None):
+        """Generates the rebalanced planning of plan in context, the context of plan if None. plan is not modified"""
+        return cls(plan.lines, plan.planes, plan.schedule, plan.fill, plan.add_time,
+                   plan.context if context is None else context)
+
+    @profiled()
+    def generate_schedule(self):
+        """
+        Generates a Planning by moving planes of the given schedule while the daily profit increases
+
+        Daily flights of the given schedule are averaged over the week.
+        """
+        self.schedule = {plane_id: [list(day) for day in week] for plane_id, week in self.schedule.items()}
+        line_keys = [hub_iata + "-" + dst_iata for hub_iata, lines in self.lines.items() for dst_iata in lines.keys()]
+        line_index = {line_keys[k]: k for k in range(0, len(line_keys))}
+        hubs = np.unique([line_key.split("-")[0] for line_key in line_keys], return_inverse=True)[1]
+        plane_ids = list(self.planes.keys())
+        planes = list(self.planes.values())
+        markets = [m.name for m in Market]
+
+        table = self.economics()
+        models = table.cols([plane.name for plane in planes])
+        demand, price = table.demand, table.ticket_price
+        pax = np.array([[plane.pax[m] for m in markets] for plane in planes], dtype=float).reshape(-1, len(markets))
+
+        # Seats filled by a flight of plane p on line l are fills[l] * pax[p], the fill ratio depending on the line
+        fills = 2 * table.fills
+
+        # Daily flights each plane can do on each line and their cost, forbidden destinations fly 0 flights
+        flights = np.where(table.in_range, table.flights, 0.)[:, models].T
+        fuel = fills[None, :] * pax.sum(axis=1)[:, None] * table.fuel_per_pax[:, models].T
+        unit = self.context.fuel_price * fuel + table.tax[None, :]
+        cost = flights * unit
+
+        # Source line and daily flights of movable planes, seats of fixed planes are served once and for all
+        source = np.full(len(planes), -1)
+        current = np.zeros(len(planes))
+        served = np.zeros(demand.shape)
+        movable = []
+        for p in range(0, len(planes)):
+            line_count, fixed = {}, False
+            for day_schedule in self.schedule.get(plane_ids[p], []):
+                for line_key in day_schedule:
+                    if line_key in line_index:
+                        line_count[line_index[line_key]] = line_count.get(line_index[line_key], 0) + 1
+                    else:
+                        fixed = True
+            for line, count in line_count.items():
+                served[line] += fills[line] * pax[p] * count / 7.
+            if len(line_count) <= 1 and not fixed:
+                movable.append(p)
+                for line, count in line_count.items():
+                    source[p], current[p] = line, count / 7.
+
+        def destinations(p):
+            # Lines of the hub of plane p within range, or every line within range if p has no line, with the seats
+            # offered, the ticket prices and the costs of plane p on these lines
+            allowed = flights[p] > 0
+            if source[p] >= 0:
+                allowed &= hubs == hubs[source[p]]
+                allowed[source[p]] = False
+            cols = np.nonzero(allowed)[0]
+            return cols, flights[p, cols, None] * fills[cols, None] * pax[p], price[cols], cost[p, cols]
+
+        # Planes with the same line and characteristics have the same gains, they are queued once as a group
+        groups, members, candidates = {}, [], []
+
+        def join(p):
+            key = (source[p], current[p], models[p]) + tuple(pax[p])
+            if key not in groups:
+                groups[key] = len(members)
+                members.append([])
+                candidates.append(destinations(p))
+            members[groups[key]].append(p)
+            return groups[key]
+
+        for p in movable:
+            join(p)
+
+        # Unmet demand of each line, the vectorized counterpart of pax_delta
+        free = np.maximum(demand - served, 0.)
+        version = np.zeros(len(line_keys), dtype=int)
+
+        def best(g):
+            # Best destination and daily profit gain of moving a plane of group g
+            p = members[g][-1]
+            a = source[p]
+            cols, offer, ticket_price, line_cost = candidates[g]
+            if len(cols) == 0:
+                return 0, -np.inf
+
+            gain = np.einsum("ij,ij->i", np.minimum(offer, free[cols]), ticket_price) - line_cost
+            k = int(np.argmax(gain))
+            if a < 0:
+                return int(cols[k]), float(gain[k])
+
+            left = np.minimum(demand[a], served[a] - current[p] * fills[a] * pax[p]) - np.minimum(demand[a], served[a])
+            return int(cols[k]), float(gain[k] + left @ price[a] + unit[p, a] * current[p])
+
+        def push(heap, g, b, gain):
+            a = source[members[g][-1]]
+            if gain > self.min_gain:
+                heapq.heappush(heap, (-gain, g, b, version[a] if a >= 0 else 0, version[b]))
+
+        while True:
+            heap = []
+            for g in range(0, len(members)):
+                if len(members[g]) > 0:
+                    push(heap, g, *best(g))
+
+            moved = 0
+            while len(heap) > 0:
+                gain, g, b, a_version, b_version = heapq.heappop(heap)
+                if len(members[g]) == 0:
+                    continue
+
+                p = members[g][-1]
+                a = source[p]
+                if version[b] != b_version or (a >= 0 and version[a] != a_version):
+                    push(heap, g, *best(g))
+                    continue
+
+                if a >= 0:
+                    served[a] -= current[p] * fills[a] * pax[p]
+                    free[a] = np.maximum(demand[a] - served[a], 0.)
+                    version[a] += 1
+                served[b] += flights[p, b] * fills[b] * pax[p]
+                free[b] = np.maximum(demand[b] - served[b], 0.)
+                version[b] += 1
+                members[g].pop()
+                source[p], current[p] = b, flights[p, b]
+                self.schedule[plane_ids[p]] = [[line_keys[b]] * int(flights[p, b])] * 7
+                self.moves.append((plane_ids[p], line_keys[a] if a >= 0 else None, line_keys[b], float(-gain)))
+                moved += 1
+
+                # Queued groups are refreshed when popped, only the source group and groups which were empty are pushed
+                h = join(p)
+                for k in [g] + ([h] if len(members[h]) == 1 else []):
+                    if len(members[k]) > 0:
+                        push(heap, k, *best(k))
+
+            if moved == 0:
+                break
+
+        Planning.generate_schedule(self)
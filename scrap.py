@@ -8,6 +8,7 @@ from numpy import concatenate
 from numpy import linspace
 from scipy.interpolate import interp1d
 from model import *
+from utilities import profiled
 
 parser = AdvancedHTMLParser.AdvancedHTMLParser()
 
@@ -32,6 +33,7 @@ class HTML:
     price_per_km = None
 
     @classmethod
+    @profiled()
     def read(cls):
         cls._read_planes()
         cls._read_hubs()
@@ -39,6 +41,7 @@ class HTML:
         cls._read_newlines()
 
     @classmethod
+    @profiled()
     def write(cls):
         if cls.planes == {} or cls.airports == {}:
             cls.read()
@@ -55,6 +58,7 @@ class HTML:
         JSON.write()
 
     @classmethod
+    @profiled()
     def _read_hubs(cls):
         hub_filenames = ["hub.html"]
         for filename in hub_filenames:
@@ -70,6 +74,7 @@ class HTML:
             cls.airports[hub.iata] = hub
 
     @classmethod
+    @profiled()
     def _read_lines(cls):
         plane_page_attributes = cls._lines_attributes_from_planes_page()
 
@@ -96,6 +101,7 @@ class HTML:
         cls.price_per_km = cls._base_price_function()
 
     @classmethod
+    @profiled()
     def _read_newlines(cls):
         cls.newlines.clear()
         for filename in NEWLINES:
@@ -120,6 +126,7 @@ class HTML:
                     cls.newlines[hub_iata] = {dst_iata: line}
 
     @classmethod
+    @profiled()
     def _read_planes(cls):
         filenames = [PLANES_PATH + "short_range.html", PLANES_PATH + "middle_range.html",
                      PLANES_PATH + "long_range.html"]
@@ -133,9 +140,9 @@ class HTML:
                 cls.planes[name] = Plane(name, pax_dict, speed, cons, year, max_range, price, wear_rate)
 
     @classmethod
-    def _base_price_function(cls, plot_interpolation_data=False):
+    def _base_price_function(cls, plot_interpolation_data=False, lines=None):
         sorted_lines = []
-        for h in cls.lines.values():
+        for h in (cls.lines if lines is None else lines).values():
             sorted_lines.extend(h.values())
 
         sorted_lines = sorted(sorted_lines, key=lambda x: x.distance)
@@ -273,39 +280,44 @@ class JSON:
     lines = {}
 
     @classmethod
-    def read(cls):
-        cls._read_planes()
-        cls._read_airports()
-        cls._read_lines()
+    @profiled()
+    def read(cls, path=JSON_PATH):
+        cls._read_planes(path=path)
+        cls._read_airports(path=path)
+        cls._read_lines(path=path)
 
     @classmethod
-    def write(cls):
-        cls._write_planes()
-        cls._write_airports()
-        cls._write_lines()
+    @profiled()
+    def write(cls, path=JSON_PATH):
+        cls._write_planes(path=path)
+        cls._write_airports(path=path)
+        cls._write_lines(path=path)
 
     @classmethod
-    def _read_planes(cls, filename="planes.json"):
+    @profiled()
+    def _read_planes(cls, filename="planes.json", path=JSON_PATH):
         cls.planes.clear()
-        with open(JSON_PATH + filename, "r") as json_file:
+        with open(path + filename, "r") as json_file:
             planes_json = json.load(json_file)
 
         for plane_json in planes_json:
             cls.planes[plane_json["name"]] = Plane.from_dict(plane_json)
 
     @classmethod
-    def _read_airports(cls, filename="airports.json"):
+    @profiled()
+    def _read_airports(cls, filename="airports.json", path=JSON_PATH):
         cls.airports.clear()
-        with open(JSON_PATH + filename, "r") as json_file:
+        with open(path + filename, "r") as json_file:
             airports_json = json.load(json_file)
 
         for airport_json in airports_json:
             cls.airports[airport_json["iata"]] = Airport.from_dict(airport_json)
 
     @classmethod
-    def _read_lines(cls, filename="lines.json"):
+    @profiled()
+    def _read_lines(cls, filename="lines.json", path=JSON_PATH):
         cls.lines.clear()
-        with open(JSON_PATH + filename, "r") as json_file:
+        with open(path + filename, "r") as json_file:
             lines_json = json.load(json_file)
 
         for line_json in lines_json:
@@ -316,31 +328,34 @@ class JSON:
                 cls.lines[line_json["hub"]] = {line_json["dst"]: line}
 
     @classmethod
-    def _write_planes(cls, filename="planes.json"):
+    @profiled()
+    def _write_planes(cls, filename="planes.json", path=JSON_PATH):
         planes_json = []
         for plane in cls.planes.values():
             planes_json.append(plane.__dict__)
 
-        with open(JSON_PATH + filename, "w") as json_file:
+        with open(path + filename, "w") as json_file:
             json.dump(planes_json, json_file, indent=4)
 
     @classmethod
-    def _write_airports(cls, filename="airports.json"):
+    @profiled()
+    def _write_airports(cls, filename="airports.json", path=JSON_PATH):
         airports_json = []
         for airport in cls.airports.values():
             airports_json.append(airport.__dict__)
 
-        with open(JSON_PATH + filename, "w") as json_file:
+        with open(path + filename, "w") as json_file:
             json.dump(airports_json, json_file, indent=4)
 
     @classmethod
-    def _write_lines(cls, filename="lines.json"):
+    @profiled()
+    def _write_lines(cls, filename="lines.json", path=JSON_PATH):
         lines_json = []
         for hub in cls.lines.values():
             for line in hub.values():
                 lines_json.append(line.__dict__())
 
-        with open(JSON_PATH + filename, "w") as json_file:
+        with open(path + filename, "w") as json_file:
             json.dump(lines_json, json_file, indent=4)
 
 
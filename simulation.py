@@ -0,0 +1,254 @@
+"""
+Tools for multi-week growth simulation.
+
+Simulation module projects the airline week after week starting from the current fleet and cash. Each week the profits
+of the fleet are earned and a purchase policy buys the most interesting lines and planes while the cash allows it.
+Planes wear according to their use so the projection also tells when the fleet will need maintenance.
+
+The weekly profit of a plane only depends on its line and model, so the scores of every (line, model) pair are
+computed once with purchase.Planner and each purchase only updates the fleet profit and the remaining demand of its
+line. A year of simulation only costs a few numpy passes per purchase and many policies can be compared in parallel.
+"""
+
+from utilities import GenericPlot
+from model import *
+from finance import Key
+from finance import Field
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import purchase
+import numpy as np
+
+
+class Simulation:
+    """
+    Simulation class represents the initial state of the airline and the candidate purchases.
+
+    The initial profit is evaluated with the indicators of the current planning. Purchased planes are dedicated to a
+    single line, as in flat plannings, and a plane can be purchased on a line only while the demand of the target
+    market is not matched.
+
+    A purchase policy is a dictionary with the following keys, missing keys take the value of Simulation.policy :
+
+    - "reserve": Cash kept after each purchase in $
+    - "payback": Maximum number of weeks of profits to repay a purchase
+    - "purchases": Maximum number of purchases per week
+    - "criterion": "ratio" buys the purchase with the best profit/cost ratio, "profit" the one with the best profit
+    - "new": If False, new lines are never purchased
+
+    Attributes:
+        plan (Planning): Current planning, its fleet and lines are owned
+        lines (dict): Candidate lines indexed by hub and destination, including the lines of the planning
+        planes (dict): Catalogue of plane models indexed by model, including the models of the fleet
+        cash (float): Initial cash in $
+        wear (dict): Initial wear of the fleet planes in %, indexed by plane id
+        profit (numpy.ndarray): Weekly profit in $ of a purchased plane with shape (lines, models)
+        seats (numpy.ndarray): Daily seats of a purchased plane in the target market with shape (lines, models)
+        week_wear (numpy.ndarray): Weekly wear in % of a purchased plane with shape (lines, models)
+        demand (numpy.ndarray): Daily demand of each line in the target market
+        owned (numpy.ndarray): True for each line already acquired
+        supply (numpy.ndarray): Daily seats of the current fleet on each line in the target market
+        week_profit (float): Weekly profit of the current planning in $
+        workers (int): Number of processes used to simulate policies, if None the number of CPUs is used
+    """
+
+    policy = {"reserve": 0., "payback": 52., "purchases": 4, "criterion": "ratio", "new": True}
+    workers = None
+
+    def __init__(self, plan, lines, planes, cash=0., data=None, wear=None, target=Market.eco):
+        """
+        Constructs a Simulation from the current planning and the candidate purchases.
+
+        Parameters:
+            plan (Planning): Current planning
+            lines (dict): Candidate lines, owned lines are the ones of the planning and lines without new flag
+            planes (dict): Catalogue of plane models
+            cash (float): Initial cash in $, ignored when data is given
+            data (finance.Data): Financial records, the initial cash is the sum of all the recorded flows
+            wear (dict): Initial wear of the planes in %, indexed by plane id. Missing planes are new
+            target (model.Market): Market to target to size the fleets
+        """
+        self.plan = plan
+        self.lines = {hub_iata: dict(hub) for hub_iata, hub in lines.items()}
+        for hub_iata, hub in plan.lines.items():
+            self.lines.setdefault(hub_iata, {}).update(hub)
+        self.planes = dict(planes)
+        for plane in plan.planes.values():
+            self.planes.setdefault(plane.name, plane)
+        self.cash = cash if data is None else Simulation.cash_of(data)
+        self.wear = {} if wear is None else wear
+
+        planner = purchase.Planner(0., self.lines, self.planes, plan.fill, plan.add_time, target, plan.context)
+        scores = planner.scores()
+        self._lines = planner._lines
+        self._models = planner._models
+
+        wear_rate = np.array([self.planes[name].wear_rate for name in self._models])
+        self.profit = scores["profit"]
+        self.price = scores["price"][0] if len(self._lines) > 0 else np.zeros(len(self._models))
+        self.acq = scores["acq"][:, 0] if len(self._models) > 0 else np.zeros(len(self._lines))
+        self.seats = scores["seats"]
+        self.week_wear = wear_rate * 7 * 2 * scores["flights"] * scores["time"]
+        self.demand = np.array([self.lines[hub_iata][dst_iata].demand[target.name]
+                                for hub_iata, dst_iata in self._lines], dtype=float)
+        self.owned = np.array([(hub_iata in plan.lines and dst_iata in plan.lines[hub_iata]) or
+                               not self.lines[hub_iata][dst_iata].new for hub_iata, dst_iata in self._lines])
+        self._init_fleet(target)
+
+    @staticmethod
+    def cash_of(data):
+        """
+        Computes cash from financial records.
+
+        Parameters:
+            data (finance.Data): Financial records
+
+        Returns:
+            Sum of all the recorded daily flows in $, debit and credit sums excepted
+        """
+        excluded_keys = [Key.__date__, Key.debit.value, Key.credit.value]
+        return float(sum(np.sum(field[Field.data.value]) for key, field in data.fields.items()
+                         if key not in excluded_keys))
+
+    def run(self, weeks=52, policy=None):
+        """
+        Simulates the airline over weeks.
+
+        Each week, the policy purchases planes then the profits of the week are added to cash.
+
+        Parameters:
+            weeks (int): Number of simulated weeks
+            policy (dict): Purchase policy, see class documentation. If None, Simulation.policy is used
+
+        Returns:
+            Dictionary indexed by "cash" cash in $ at the beginning of each week and at the end of the simulation,
+            "profit" weekly profits in $, "fleet" number of planes each week, "wear" wear in % of each plane at the
+            end of the simulation indexed by plane id, and "purchases" list of (week, hub, destination, model) tuples
+        """
+        policy = dict(Simulation.policy, **({} if policy is None else policy))
+
+        owned = self.owned.copy()
+        supply = self.supply.copy()
+        allowed = (self.profit > 0) & (self.seats > 0)
+        if not policy["new"]:
+            allowed &= owned[:, np.newaxis]
+
+        cash = np.zeros(weeks + 1)
+        profit = np.zeros(weeks)
+        fleet = np.zeros(weeks, dtype=int)
+        balance = self.cash
+        week_profit = self.week_profit
+        purchases = []
+
+        for week in range(0, weeks):
+            cash[week] = balance
+            for _ in range(0, policy["purchases"]):
+                cost = self.price + np.where(owned, 0., self.acq)[:, np.newaxis]
+                valid = allowed & (2 * (self.demand - supply)[:, np.newaxis] >= self.seats)
+                valid &= (cost <= balance - policy["reserve"]) & (cost <= policy["payback"] * self.profit)
+                if not valid.any():
+                    break
+
+                score = self.profit / cost if policy["criterion"] == "ratio" else self.profit
+                i, j = np.unravel_index(np.argmax(np.where(valid, score, -np.inf)), score.shape)
+                balance -= cost[i, j]
+                week_profit += self.profit[i, j]
+                supply[i] += self.seats[i, j]
+                owned[i] = True
+                purchases.append((week,) + self._lines[i] + (self._models[j],))
+
+            profit[week] = week_profit
+            fleet[week] = len(self.plane_ids) + len(purchases)
+            balance += week_profit
+
+        cash[weeks] = balance
+
+        return {
+            "cash": cash,
+            "profit": profit,
+            "fleet": fleet,
+            "wear": self._wear(weeks, purchases),
+            "purchases": purchases
+        }
+
+    def variations(self, policies, weeks=52):
+        """
+        Simulates the airline with several policies in parallel.
+
+        Parameters:
+            policies (list): List of purchase policies
+            weeks (int): Number of simulated weeks
+
+        Returns:
+            List of simulation results as returned by run, in the order of policies
+        """
+        workers = self.workers or os.cpu_count() or 1
+        if workers == 1 or len(policies) < 2:
+            return [self.run(weeks, policy) for policy in policies]
+
+        size = int(np.ceil(len(policies) / workers))
+        tasks = [(self, policies[k:k + size], weeks) for k in range(0, len(policies), size)]
+        with ProcessPoolExecutor(workers) as executor:
+            return [result for results in executor.map(_run_task, tasks) for result in results]
+
+    def _init_fleet(self, target):
+        plan = self.plan
+        profits = plan.by_lines(plan.profits())
+        pax = plan.by_lines(plan.pax(), by_market=True)
+        hours = plan.reduce_by_plane_id(plan.flight_time())
+
+        self.week_profit = 0.
+        self.supply = np.zeros(len(self._lines))
+        for i in range(0, len(self._lines)):
+            hub_iata, dst_iata = self._lines[i]
+            try:
+                self.week_profit += profits[hub_iata][dst_iata]
+                fill = plan.context.fills(self.lines[hub_iata][dst_iata].distance, plan.fill)
+                self.supply[i] = pax[hub_iata][dst_iata][target.name] / (7 * fill)
+            except KeyError:
+                continue
+
+        self.plane_ids = list(plan.planes.keys())
+        self.plane_wear = np.array([self.wear.get(plane_id, 0.) for plane_id in self.plane_ids], dtype=float)
+        self.plane_week_wear = np.array([plan.planes[plane_id].wear_rate * hours.get(plane_id, 0.)
+                                         for plane_id in self.plane_ids], dtype=float)
+
+    def _wear(self, weeks, purchases):
+        wear = dict(zip(self.plane_ids, self.plane_wear + weeks * self.plane_week_wear))
+        count = {}
+        for week, hub_iata, dst_iata, name in purchases:
+            i, j = self._lines.index((hub_iata, dst_iata)), self._models.index(name)
+            count[(hub_iata, dst_iata)] = count.get((hub_iata, dst_iata), 0) + 1
+            plane_id = "{}-{}-S{:d}".format(hub_iata, dst_iata, count[(hub_iata, dst_iata)])
+            wear[plane_id] = (weeks - week) * self.week_wear[i, j]
+
+        return wear
+
+
+def _run_task(task):
+    simulation, policies, weeks = task
+    return [simulation.run(weeks, policy) for policy in policies]
+
+
+class Plot(GenericPlot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for every result that can be computed with Simulation objects.
+    """
+
+    RENDER_ROOT = GenericPlot.RENDER_ROOT + "simulation/"
+
+    @classmethod
+    def cash(cls, results, labels=None, title="Cash projection"):
+        """Plots the cash projection of each simulation result, results are labelled with labels"""
+        labels = ["Policy {:d}".format(k + 1) for k in range(0, len(results))] if labels is None else labels
+        cash = [result["cash"] / 1.e6 for result in results]
+        cls.batch(_draw_cash, [((cash, labels), {"xl": "Week", "yl": "Millions $", "title": title})])
+
+
+def _draw_cash(fig, cash, labels):
+    ax = fig.gca()
+    for k in range(0, len(cash)):
+        ax.plot(np.arange(0, len(cash[k])), cash[k], label=labels[k])
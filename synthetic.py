@@ -0,0 +1,226 @@
+"""
+Tools for generation of synthetic airlines.
+
+The data scrapped from AM2 only describes a small network, too small to know how plannings and purchase helpers behave
+at the scale of a large airline. Synthetic module generates realistic networks of any size from real airports of
+openflights database and real planes models of scrap/json/planes.json.
+
+Demands, ticket prices and taxes of the generated lines follow the scrapped lines, prices being computed with the same
+price per km curve than scrap.HTML. Datasets are written in scrap.JSON format and financial records in AM2+ CSV export
+format, so they can be loaded by the usual interfaces. Every generation is deterministic given the seed.
+
+Eg:
+```
+python synthetic.py synthetic/ --hubs 4 --lines 2000 --days 365
+```
+"""
+
+from datetime import datetime
+from finance import Key
+from model import *
+
+import argparse
+import copy
+import csv
+import os
+import openflights
+import scrap
+import numpy as np
+
+EARTH_RADIUS = 6371.
+
+
+class Generator:
+    """
+    Generator class represents the reference data used to generate synthetic airlines
+
+    Hubs are drawn among the airports of the reference, destinations of each hub are drawn among the airports located
+    between min_distance and max_distance from the hub. A generated line copies the demand and the tax of a random
+    reference line, scaled by log-normal factors, and its ticket prices are the price per km of the reference lines at
+    the line distance. Outside of the distances of the reference lines, the price per km is held constant.
+
+    Attributes:
+        seed (int): Seed of the random generator
+        airports (dict): Candidate airports indexed by IATA code
+        reference (list): Reference lines
+        catalogue (dict): Candidate plane models indexed by model
+        price_per_km (dict): Price per km function of distance indexed by market
+        min_distance (float): Minimum distance of a line in km
+        max_distance (float): Maximum distance of a line in km
+        demand_cv (float): Coefficient of variation of the demands of the lines
+        price_cv (float): Coefficient of variation of the ticket prices of the lines
+        new (float): Share of the lines not yet acquired
+    """
+
+    min_distance = 300.
+    max_distance = 8000.
+    demand_cv = 0.2
+    price_cv = 0.05
+    new = 0.5
+
+    def __init__(self, seed=0, airports=None, reference=None, catalogue=None):
+        """
+        Constructs a Generator from reference data
+
+        Parameters:
+            seed (int): Seed of the random generator
+            airports (dict): Candidate airports indexed by IATA code, if None openflights airports are used
+            reference (dict): Reference lines indexed by hub and destination, if None scrapped lines are used
+            catalogue (dict): Candidate plane models indexed by model, if None scrapped planes are used
+        """
+        airports = openflights.airports if airports is None else airports
+        reference = scrap.JSON.lines if reference is None else reference
+
+        self.seed = seed
+        self.airports = {iata: airport for iata, airport in airports.items() if len(iata) == 3 and iata.isalpha()}
+        self.reference = [line for hub in reference.values() for line in hub.values()]
+        self.catalogue = scrap.JSON.planes if catalogue is None else catalogue
+        self.price_per_km = scrap.HTML._base_price_function(lines=reference)
+
+        distances = [line.distance for line in self.reference]
+        self._distance_range = (min(distances), max(distances))
+        self._iata = sorted(self.airports.keys())
+        self._coordinates = np.radians([[self.airports[iata].lat, self.airports[iata].lon] for iata in self._iata])
+
+    @staticmethod
+    def distance(lat, lon, other_lat, other_lon):
+        """Computes great-circle distances in km between points given in radians using the haversine formula"""
+        a = np.sin((other_lat - lat) / 2) ** 2 + np.cos(lat) * np.cos(other_lat) * np.sin((other_lon - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.)))
+
+    def lines(self, hubs=1, count=100):
+        """
+        Generates lines
+
+        Parameters:
+            hubs (int): Number of hubs
+            count (int): Number of lines, shared equally by the hubs. Hubs may have less lines when not enough
+            airports are in range
+
+        Returns:
+            Lines dictionary indexed by hub and destination
+        """
+        random = np.random.RandomState(self.seed)
+        hub_indices = random.choice(len(self._iata), hubs, replace=False)
+        lines = {}
+        for k in range(0, hubs):
+            hub = copy.copy(self.airports[self._iata[hub_indices[k]]])
+            lat, lon = self._coordinates[hub_indices[k]]
+            distance = self.distance(lat, lon, self._coordinates[:, 0], self._coordinates[:, 1])
+            candidates = np.nonzero((distance >= self.min_distance) & (distance <= self.max_distance))[0]
+            size = min(count // hubs + (k < count % hubs), len(candidates))
+            dst_indices = random.choice(candidates, size, replace=False)
+            references = random.randint(0, len(self.reference), size)
+            factors = random.lognormal(0., np.sqrt(np.log(1. + self.demand_cv ** 2)), (size, 2))
+            noises = random.lognormal(0., np.sqrt(np.log(1. + self.price_cv ** 2)), size)
+            new = random.uniform(size=size) < self.new
+            hub.tax = self.reference[references[0]].hub.tax if size > 0 else 0.
+            lines[hub.iata] = {}
+            for n in range(0, size):
+                dst = copy.copy(self.airports[self._iata[dst_indices[n]]])
+                line = self.reference[references[n]]
+                dst.tax = line.dst.tax
+                lines[hub.iata][dst.iata] = Line(hub, dst,
+                                                 demand={m: round(d * factors[n, 0]) for m, d in line.demand.items()},
+                                                 ticket_price=self.ticket_price(distance[dst_indices[n]], noises[n]),
+                                                 distance=round(float(distance[dst_indices[n]])),
+                                                 new=bool(new[n]),
+                                                 tax=round(float(line.tax * factors[n, 1])))
+
+        return lines
+
+    def ticket_price(self, distance, noise=1.):
+        """Computes ticket prices of a line in $ indexed by market, using the price per km of the reference lines"""
+        clipped = min(max(distance, self._distance_range[0]), self._distance_range[1])
+        return {m: float(noise * distance * self.price_per_km[m](clipped)) for m in self.price_per_km.keys()}
+
+    def planes(self, count=10):
+        """Draws count plane models from the catalogue. Returns planes dictionary indexed by model"""
+        random = np.random.RandomState(self.seed)
+        names = sorted(self.catalogue.keys())
+        indices = random.choice(len(names), min(count, len(names)), replace=False)
+        return {names[k]: self.catalogue[names[k]] for k in sorted(indices)}
+
+    def records(self, days=365, income=2.e6):
+        """
+        Generates daily financial records
+
+        Flights earn income every day, other keys are costs happening a random share of the days. Debit and credit sums
+        are the sums of the negative and positive flows of each day.
+
+        Parameters:
+            days (int): Number of days of records
+            income (float): Mean daily income of flights in $
+
+        Returns:
+            Dictionary of daily flows in $ indexed by finance.Key values
+        """
+        random = np.random.RandomState(self.seed)
+        sigma = np.sqrt(np.log(2.))
+        records = {Key.flight.value: income * random.lognormal(-sigma ** 2 / 2, sigma, days)}
+        for key in Key:
+            if key.value in [Key.__date__, Key.flight.value, Key.debit.value, Key.credit.value]:
+                continue
+            happens = random.uniform(size=days) < random.uniform(0.05, 0.5)
+            records[key.value] = -np.where(happens, 0.1 * income * random.lognormal(0., 1., days), 0.).round(2)
+
+        flows = np.array(list(records.values()))
+        records[Key.debit.value] = np.where(flows < 0, flows, 0.).sum(axis=0).round(2)
+        records[Key.credit.value] = np.where(flows > 0, flows, 0.).sum(axis=0).round(2)
+        return records
+
+    def write(self, path, hubs=1, count=100, planes=10):
+        """
+        Writes a dataset in scrap.JSON format
+
+        Parameters:
+            path (str): Directory of the dataset, ended by "/"
+            hubs (int): Number of hubs
+            count (int): Number of lines
+            planes (int): Number of plane models
+        """
+        lines = self.lines(hubs, count)
+        airports = {line.hub.iata: line.hub for hub in lines.values() for line in hub.values()}
+        airports.update({line.dst.iata: line.dst for hub in lines.values() for line in hub.values()})
+
+        state = scrap.JSON.planes, scrap.JSON.airports, scrap.JSON.lines
+        scrap.JSON.planes, scrap.JSON.airports, scrap.JSON.lines = self.planes(planes), airports, lines
+        try:
+            os.makedirs(path, exist_ok=True)
+            scrap.JSON.write(path)
+        finally:
+            scrap.JSON.planes, scrap.JSON.airports, scrap.JSON.lines = state
+
+    def export(self, filename, days=365, income=2.e6, date=None):
+        """
+        Writes financial records in AM2+ CSV export format
+
+        Parameters:
+            filename (str): Path of the CSV file
+            days (int): Number of days of records
+            income (float): Mean daily income of flights in $
+            date (datetime): Date of the export, if None 2020-01-01 is used
+        """
+        date = datetime(2020, 1, 1) if date is None else date
+        records = self.records(days, income)
+        with open(filename, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file, delimiter=";")
+            writer.writerow(["#" + date.strftime("%Y-%m-%d %H:%M:%S")])
+            writer.writerow(["key", "verbose"] + ["d{:d}".format(k) for k in range(0, days)])
+            for key, flows in records.items():
+                writer.writerow([key, key + " name"] + flows.tolist())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic airline datasets and financial exports")
+    parser.add_argument("path", help="Directory of the generated files")
+    parser.add_argument("--hubs", type=int, default=1, help="Number of hubs")
+    parser.add_argument("--lines", type=int, default=100, help="Number of lines")
+    parser.add_argument("--planes", type=int, default=10, help="Number of plane models")
+    parser.add_argument("--days", type=int, default=365, help="Number of days of financial records")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    args = parser.parse_args()
+
+    generator = Generator(args.seed)
+    generator.write(os.path.join(args.path, ""), args.hubs, args.lines, args.planes)
+    generator.export(os.path.join(args.path, "export.csv"), args.days)
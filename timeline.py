@@ -0,0 +1,397 @@
+"""
+Tools for time of day aware scheduling.
+
+Planning schedules only give the number of flights of each plane each week day, flights being assumed contiguous from
+00:00 UTC. Timeline module gives a departure time to every rotation of a schedule so the rotations of an airframe can be
+checked against each other and against the curfews of the airports, in local time of the airports.
+
+A rotation is a flight from the hub to the destination and back to the hub. It starts with the take-off at the hub and
+lasts twice the flight time of the plane, turnaround additional time included, as in Planning.flight_time. Times are
+given in hours from Monday 00:00 UTC and the week repeats, so a rotation ending after the end of the week overlaps the
+first rotations of the week.
+"""
+
+from utilities import GenericPlot
+from model import *
+
+import bisect
+import numpy as np
+
+WEEK = 168.
+
+
+class Timeline:
+    """
+    Timeline class represents the departure times of the rotations of a planning
+
+    The rotations of each airframe are stored sorted by departure time. Since the rotations of a valid airframe never
+    overlap, the sorted departures act as an interval tree: a rotation only has to be checked against its neighbours,
+    so adding, moving or removing a rotation costs a binary search. Whole timelines are checked at once with numpy.
+
+    Curfews are indexed by airport IATA code and give the (start, end) local hours during which no take-off or landing is
+    allowed eg. {"BOM": (23.5, 6.)}. A curfew ending before it starts spans midnight.
+
+    Attributes:
+        plan (Planning): Planning giving lines, fleet and turnaround additional time
+        curfews (dict): Curfews of the airports in local hours, indexed by IATA code
+        rotations (dict): Rotations of each airframe indexed by plane id. Each value is a dictionary with sorted
+        "start" departure times in hours and "line" the line of each rotation eg. "HYD-ISB"
+    """
+
+    def __init__(self, plan, rotations=None, curfews=None):
+        """
+        Constructs a Timeline from a planning
+
+        Parameters:
+            plan (Planning): Planning giving lines, fleet and turnaround additional time
+            rotations (dict): Departure times of the rotations of each plane indexed by plane id and line eg.
+            {"HYD-ISB-1": {"HYD-ISB": [0., 8.5, 24.]}}. If None, the rotations are built from the planning schedule
+            curfews (dict): Curfews of the airports in local hours, indexed by IATA code
+        """
+        self.plan = plan
+        self.curfews = {} if curfews is None else curfews
+        self.rotations = {plane_id: {"start": [], "line": []} for plane_id in plan.planes.keys()}
+        if rotations is None:
+            self.pack()
+        else:
+            for plane_id, lines in rotations.items():
+                for line_key, starts in lines.items():
+                    for start in starts:
+                        self._insert(plane_id, line_key, start)
+
+    @staticmethod
+    def tmz(airport):
+        """Gives the offset from UTC of an airport in hours, 0 when unknown"""
+        try:
+            return float(airport.loc["tmz"] or 0.)
+        except (TypeError, KeyError):
+            return 0.
+
+    def line(self, line_key):
+        """Gives the line object of a line identifier eg. "HYD-ISB" """
+        hub_iata, dst_iata = line_key.split("-")
+        return self.plan.lines[hub_iata][dst_iata]
+
+    def duration(self, plane_id, line_key):
+        """Computes duration of a rotation in hours"""
+        return 2 * self.plan.planes[plane_id].flight_time(self.line(line_key).distance, self.plan.add_time)
+
+    def movements(self, plane_id, line_key, start):
+        """
+        Computes the take-offs and landings of a rotation
+
+        Parameters:
+            plane_id (str): Plane flying the rotation
+            line_key (str): Line of the rotation eg. "HYD-ISB"
+            start (float): Departure time in hours from Monday 00:00 UTC
+
+        Returns:
+            List of (IATA code, local hour) couples of the take-off at hub, landing at destination, take-off at
+            destination and landing at hub
+        """
+        line = self.line(line_key)
+        leg = line.distance / self.plan.planes[plane_id].speed
+        times = [start, start + leg, start + leg + self.plan.add_time, start + 2 * leg + self.plan.add_time]
+        airports = [line.hub, line.dst, line.dst, line.hub]
+        return [(airport.iata, (time + Timeline.tmz(airport)) % 24.) for airport, time in zip(airports, times)]
+
+    def in_curfew(self, iata, hour):
+        """Checks if a local hour at an airport is during its curfew"""
+        try:
+            begin, end = self.curfews[iata]
+        except KeyError:
+            return False
+
+        return begin <= hour < end if begin <= end else hour >= begin or hour < end
+
+    def allowed(self, plane_id, line_key, start):
+        """Checks that no take-off or landing of a rotation happens during a curfew"""
+        return not any(self.in_curfew(iata, hour) for iata, hour in self.movements(plane_id, line_key, start))
+
+    def fits(self, plane_id, line_key, start, ignore=None):
+        """
+        Checks if a rotation fits in the timeline of an airframe without overlapping its other rotations
+
+        Parameters:
+            plane_id (str): Plane flying the rotation
+            line_key (str): Line of the rotation eg. "HYD-ISB"
+            start (float): Departure time in hours from Monday 00:00 UTC
+            ignore (int): Index of a rotation of the airframe to ignore, used when moving a rotation
+
+        Returns:
+            True if the rotation does not overlap any other rotation of the airframe
+        """
+        start = start % WEEK
+        previous_end, following_start = self._neighbours(plane_id, start, ignore)
+        return previous_end <= start and start + self.duration(plane_id, line_key) <= following_start
+
+    def add(self, plane_id, line_key, start):
+        """
+        Adds a rotation to the timeline if it fits and respects the curfews
+
+        Parameters:
+            plane_id (str): Plane flying the rotation
+            line_key (str): Line of the rotation eg. "HYD-ISB"
+            start (float): Departure time in hours from Monday 00:00 UTC
+
+        Returns:
+            True if the rotation has been added
+        """
+        if not (self.fits(plane_id, line_key, start) and self.allowed(plane_id, line_key, start)):
+            return False
+
+        self._insert(plane_id, line_key, start)
+        return True
+
+    def remove(self, plane_id, start):
+        """Removes the rotation of a plane departing at start. Returns the line of the removed rotation"""
+        starts = self.rotations[plane_id]["start"]
+        k = bisect.bisect_left(starts, start % WEEK)
+        assert k < len(starts) and starts[k] == start % WEEK
+        starts.pop(k)
+        return self.rotations[plane_id]["line"].pop(k)
+
+    def move(self, plane_id, start, new_start):
+        """
+        Moves the departure of a rotation if the new departure fits and respects the curfews
+
+        Returns:
+            True if the rotation has been moved
+        """
+        starts = self.rotations[plane_id]["start"]
+        k = bisect.bisect_left(starts, start % WEEK)
+        assert k < len(starts) and starts[k] == start % WEEK
+        line_key = self.rotations[plane_id]["line"][k]
+        if not (self.fits(plane_id, line_key, new_start, ignore=k) and self.allowed(plane_id, line_key, new_start)):
+            return False
+
+        self.remove(plane_id, start)
+        self._insert(plane_id, line_key, new_start)
+        return True
+
+    def earliest(self, plane_id, line_key, after=0., step=0.25):
+        """
+        Finds the earliest departure of a rotation that fits and respects the curfews
+
+        Parameters:
+            plane_id (str): Plane flying the rotation
+            line_key (str): Line of the rotation eg. "HYD-ISB"
+            after (float): Earliest departure time to consider in hours
+            step (float): Delay in hours between two tried departures during curfews
+
+        Returns:
+            Departure time in hours, None if the rotation fits nowhere in the week
+        """
+        starts, lines = self.rotations[plane_id]["start"], self.rotations[plane_id]["line"]
+        gaps = [after % WEEK] + [(starts[k] + self.duration(plane_id, lines[k])) % WEEK for k in range(0, len(starts))]
+        for gap in sorted(set(gaps), key=lambda x: (x - after) % WEEK):
+            # Departures are delayed along the gap until the rotation does not fit anymore
+            start = gap
+            while self.fits(plane_id, line_key, start):
+                if self.allowed(plane_id, line_key, start):
+                    return start % WEEK
+                start += step
+
+        return None
+
+    def pack(self):
+        """
+        Builds rotations from the planning schedule
+
+        The rotations of each day are contiguous and start at the first hour of the day, 00:00 UTC, when the movements
+        respect the curfews. Otherwise each rotation is delayed until its movements are allowed. Rotations delayed past
+        the end of the week are kept so they are reported as conflicts.
+        """
+        for plane_id in self.rotations.keys():
+            self.rotations[plane_id] = {"start": [], "line": []}
+
+        for plane_id, week_schedule in self.plan.schedule.items():
+            start = 0.
+            for day in range(0, len(week_schedule)):
+                start = max(start, 24. * day)
+                for line_key in week_schedule[day]:
+                    delay = 0.
+                    while not self.allowed(plane_id, line_key, start + delay) and delay < 24.:
+                        delay += 0.25
+                    start += delay if delay < 24. else 0.
+                    self.rotations[plane_id]["start"].append(start % WEEK)
+                    self.rotations[plane_id]["line"].append(line_key)
+                    start += self.duration(plane_id, line_key)
+
+            order = np.argsort(self.rotations[plane_id]["start"], kind="stable").tolist()
+            self.rotations[plane_id] = {key: [values[k] for k in order]
+                                        for key, values in self.rotations[plane_id].items()}
+
+    def schedule(self):
+        """
+        Converts the timeline to a planning schedule, each rotation counting on its departure UTC week day
+
+        Returns:
+            Weekly schedule of each plane indexed by plane id, see Planning
+        """
+        schedule = {}
+        for plane_id, rotations in self.rotations.items():
+            if len(rotations["start"]) == 0:
+                continue
+
+            schedule[plane_id] = [[] for _ in range(0, 7)]
+            for start, line_key in zip(rotations["start"], rotations["line"]):
+                schedule[plane_id][int(start // 24.)].append(line_key)
+
+        return schedule
+
+    def arrays(self):
+        """
+        Gathers rotations of all the airframes in arrays sorted by airframe and departure
+
+        Returns:
+            Dictionary of arrays indexed by "plane" plane index in plane_ids order, "start" and "end" times in hours,
+            "leg" flight time of a leg in hours, "hub" and "dst" airport index in airports order, with "plane_ids"
+            and "airports" lists
+        """
+        plane_ids = list(self.rotations.keys())
+        durations = {}
+        airports = {}
+        plane, start, leg, hub, dst = [], [], [], [], []
+        for k in range(0, len(plane_ids)):
+            rotations = self.rotations[plane_ids[k]]
+            speed = self.plan.planes[plane_ids[k]].speed
+            for line_key in rotations["line"]:
+                if (k, line_key) not in durations:
+                    line = self.line(line_key)
+                    durations[(k, line_key)] = line.distance / speed
+                    airports.setdefault(line.hub.iata, (len(airports), line.hub))
+                    airports.setdefault(line.dst.iata, (len(airports), line.dst))
+                hub_iata, dst_iata = line_key.split("-")
+                leg.append(durations[(k, line_key)])
+                hub.append(airports[hub_iata][0])
+                dst.append(airports[dst_iata][0])
+            plane.extend([k] * len(rotations["start"]))
+            start.extend(rotations["start"])
+
+        leg = np.array(leg, dtype=float)
+        start = np.array(start, dtype=float)
+        return {
+            "plane": np.array(plane, dtype=int),
+            "start": start,
+            "end": start + 2 * (leg + self.plan.add_time),
+            "leg": leg,
+            "hub": np.array(hub, dtype=int),
+            "dst": np.array(dst, dtype=int),
+            "plane_ids": plane_ids,
+            "airports": [airport for _, airport in sorted(airports.values(), key=lambda x: x[0])]
+        }
+
+    def conflicts(self, arrays=None):
+        """
+        Finds rotations overlapping the previous rotation of their airframe
+
+        Parameters:
+            arrays (dict): Arrays returned by arrays, computed if None
+
+        Returns:
+            List of (plane id, departure) couples of the overlapping rotations
+        """
+        arrays = self.arrays() if arrays is None else arrays
+        plane, start, end = arrays["plane"], arrays["start"], arrays["end"]
+        if len(plane) == 0:
+            return []
+
+        # Rotations of each airframe are contiguous and sorted, offsetting airframes allows a single running maximum
+        # of the ends. The first rotation of an airframe is compared with the last one of previous week
+        offset = 4 * WEEK * plane
+        reach = np.maximum.accumulate(end + offset) - offset
+        first = np.r_[True, plane[1:] != plane[:-1]]
+        last = np.r_[first[1:], True]
+        previous_end = np.r_[0., reach[:-1]]
+        previous_end[first] = reach[last] - WEEK
+        overlap = start < previous_end - 1.e-9
+        return [(arrays["plane_ids"][plane[k]], float(start[k])) for k in np.nonzero(overlap)[0]]
+
+    def curfew_violations(self, arrays=None):
+        """
+        Finds take-offs and landings happening during curfews
+
+        Parameters:
+            arrays (dict): Arrays returned by arrays, computed if None
+
+        Returns:
+            List of (plane id, departure, IATA code) of the rotations with a movement during a curfew
+        """
+        arrays = self.arrays() if arrays is None else arrays
+        airports = arrays["airports"]
+        tmz = np.array([Timeline.tmz(airport) for airport in airports], dtype=float)
+        curfews = np.array([self.curfews.get(airport.iata, (np.nan, np.nan)) for airport in airports], dtype=float)
+        curfews = curfews.reshape(-1, 2)
+
+        start, leg = arrays["start"], arrays["leg"]
+        times = [start, start + leg, start + leg + self.plan.add_time, start + 2 * leg + self.plan.add_time]
+        places = [arrays["hub"], arrays["dst"], arrays["dst"], arrays["hub"]]
+        violations = []
+        for time, place in zip(times, places):
+            hour = (time + tmz[place]) % 24.
+            begin, end = curfews[place, 0], curfews[place, 1]
+            with np.errstate(invalid="ignore"):
+                inside = np.where(begin <= end, (hour >= begin) & (hour < end), (hour >= begin) | (hour < end))
+            for k in np.nonzero(inside)[0]:
+                violations.append((arrays["plane_ids"][arrays["plane"][k]], float(start[k]), airports[place[k]].iata))
+
+        return violations
+
+    def is_valid(self):
+        """Checks that no rotations overlap and no movement happens during curfews"""
+        arrays = self.arrays()
+        return len(self.conflicts(arrays)) == 0 and len(self.curfew_violations(arrays)) == 0
+
+    def _neighbours(self, plane_id, start, ignore=None):
+        # End of the rotation preceding start and departure of the rotation following start, wrapping over the week
+        starts, lines = self.rotations[plane_id]["start"], self.rotations[plane_id]["line"]
+        indices = [k for k in range(0, len(starts)) if k != ignore]
+        if len(indices) == 0:
+            return -np.inf, np.inf
+
+        k = bisect.bisect_left(starts, start)
+        previous = k - 1 if k - 1 != ignore else k - 2
+        following = k if k != ignore else k + 1
+        previous_end = -WEEK if previous < 0 else 0.
+        following_start = WEEK if following >= len(starts) else 0.
+        previous = indices[-1] if previous < 0 else previous
+        following = indices[0] if following >= len(starts) else following
+        previous_end += starts[previous] + self.duration(plane_id, lines[previous])
+        return previous_end, following_start + starts[following]
+
+    def _insert(self, plane_id, line_key, start):
+        starts = self.rotations[plane_id]["start"]
+        k = bisect.bisect_right(starts, start % WEEK)
+        starts.insert(k, start % WEEK)
+        self.rotations[plane_id]["line"].insert(k, line_key)
+
+
+class Plot(GenericPlot):
+    """
+    Plotting static interface class
+
+    Used as interface with matplotlib for every result that can be computed with Timeline objects.
+    """
+
+    RENDER_ROOT = GenericPlot.RENDER_ROOT + "timeline/"
+
+    @classmethod
+    def gantt(cls, timeline, plane_ids=None, title="Rotations timeline"):
+        """Plots the rotations of the airframes plane_ids, all the airframes if None"""
+        plane_ids = list(timeline.rotations.keys()) if plane_ids is None else plane_ids
+        bars = [[(start, timeline.duration(plane_id, line_key)) for start, line_key in
+                 zip(timeline.rotations[plane_id]["start"], timeline.rotations[plane_id]["line"])]
+                for plane_id in plane_ids]
+        cls.batch(_draw_gantt, [((bars, plane_ids), {"xl": "Hours from Monday 00:00 UTC", "title": title,
+                                                     "legend": False})])
+
+
+def _draw_gantt(fig, bars, plane_ids):
+    ax = fig.gca()
+    for k in range(0, len(bars)):
+        ax.broken_barh(bars[k], (k - 0.4, 0.8))
+    ax.set_yticks(np.arange(0, len(plane_ids)))
+    ax.set_yticklabels(plane_ids)
+    ax.set_xlim(0, WEEK)
+    ax.set_xticks(np.arange(0, WEEK + 1, 24))
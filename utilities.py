@@ -2,9 +2,21 @@
 Various tools classes for the project
 """
 
+import functools
+import hashlib
+import json
+import os
+import pickle
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import timedelta
 from datetime import datetime
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 class DateBase:
@@ -13,6 +25,14 @@ class DateBase:
 
     Provides a structure to represent data daily gathered at periodic date interval.
 
+    The calendar of the covered days is computed once as a numpy datetime64 array when the base is reset and the period
+    boundaries are computed once when the base is set. Reduction, slicing and date ticks all share theses arrays so
+    converting a date to a day or period index is O(1).
+
+    Periods can either be a fixed number of days (period=12, period="week", ...) or calendar aware periods which are
+    ISO weeks starting on mondays (period="isoweek") and true calendar months and years (period="calmonth",
+    period="calyear").
+
     Attributes:
         covered (int): Number of days covered by data
         raw_start: Real start date. Start of data
@@ -22,9 +42,15 @@ class DateBase:
         start (datetime): Effective Start date. Must be coherent with data to represent
         end (datetime): Effective end date. Must be coherent with data to represent
         range (int): Number of periods to cover according to other attributes
+        days (numpy.ndarray): Covered days as datetime64[D] array
+        bounds (numpy.ndarray): Index of the first day of each period relative to raw start. The last value is the
+        index following the effective end day
+        labels (numpy.ndarray): Period index of each covered day, -1 when the day is out of the effective range
+        version (int): Incremented each time the base is set. Used to invalidate data computed on the base
     """
 
     day = {"day": 1, "week": 7, "month": 30, "year": 365}
+    calendar = {"isoweek": "W", "calmonth": "M", "calyear": "Y"}
 
     def __init__(self, covered=0, date=None, period=None, offset=None, start=None, end=None):
         self.covered = None
@@ -35,6 +61,10 @@ class DateBase:
         self.start = None
         self.end = None
         self.range = None
+        self.days = None
+        self.bounds = None
+        self.labels = None
+        self.version = 0
 
         if date is not None and covered > 0:
             self.reset(date, covered)
@@ -51,6 +81,8 @@ class DateBase:
         self.date = self.date if date is None else date
         self.covered = self.covered if covered is None else covered
         self.raw_start = self.date - timedelta(days=self.covered - 1)
+        first_day = np.datetime64(self.raw_start.date(), "D")
+        self.days = first_day + np.arange(self.covered)
         self.set()
 
     def set(self, period=None, offset=None, start=None, end=None):
@@ -60,16 +92,17 @@ class DateBase:
         self.start = start
         self.end = end
         (self.period, self.offset, self.start, self.end) = self._unwrap()
-        self.range = int((self.end - self.start) / self.period - self.offset) + 1
+        self.bounds, self.labels = self._unwrap_bounds()
+        self.range = len(self.bounds) - 1
+        self.version += 1
 
     def list(self):
         """Returns a list of datetime objects representing the current DateBase state"""
-        day = timedelta(days=1)
-        x = [0] * self.range
-        for k in range(0, self.range):
-            shift = (k + self.offset) * self.period - self.covered + 1 + self.start
-            x[k] = (self.date + shift * day)
-        return x
+        return list(self.ticks().astype("datetime64[s]").astype(datetime))
+
+    def ticks(self):
+        """Returns a datetime64 array of the first day of each period"""
+        return self.days[self.bounds[:-1]]
 
     def start_date(self):
         """Returns effective datetime start"""
@@ -79,6 +112,54 @@ class DateBase:
         """Return effective datetime end"""
         return self.end * timedelta(days=1) + self.raw_start
 
+    def lengths(self):
+        """Returns an array of the number of days contained in each period"""
+        return np.diff(self.bounds)
+
+    def day_index(self, date):
+        """Returns index of the day containing the given date relative to raw start"""
+        return int((np.datetime64(date, "D") - self.days[0]).astype(int))
+
+    def period_index(self, date):
+        """Returns index of the period containing the given date, -1 if the date is out of the effective range"""
+        index = self.day_index(date)
+        return int(self.labels[index]) if 0 <= index < self.covered else -1
+
+    def period_date(self, k):
+        """Returns datetime64 of first day of the k-th period"""
+        return self.days[self.bounds[k]]
+
+    def slice(self, y):
+        """
+        Slices daily data according to the current effective range.
+
+        Parameter:
+            y (array like): Daily data covering the whole data base. Last axis must be the days axis
+
+        Returns:
+            Array of daily data from the effective start to the effective end. Missing days are filled with zeros
+        """
+        y = np.asarray(y, dtype=float)
+        y_slice = y[..., self.bounds[0]:self.bounds[-1]]
+        missing = self.bounds[-1] - self.bounds[0] - y_slice.shape[-1]
+        if missing > 0:
+            y_slice = np.concatenate([y_slice, np.zeros(y_slice.shape[:-1] + (missing,))], axis=-1)
+        return y_slice
+
+    def reduce(self, y, avg=False):
+        """
+        Reduces daily data over the periods of the current date base.
+
+        Parameters:
+            y (array like): Daily data covering the whole data base. Last axis must be the days axis
+            avg (bool): Average over each period, if False a sum is performed
+
+        Returns:
+            Array of reduced data with range elements along the last axis
+        """
+        y_reduced = np.add.reduceat(self.slice(y), self.bounds[:-1] - self.bounds[0], axis=-1)
+        return y_reduced / self.lengths() if avg else y_reduced
+
     def _unwrap(self):
         assert self.date is not None and self.covered > 0
 
@@ -90,12 +171,37 @@ class DateBase:
         assert end - start <= self.covered
         return period, offset, start, end
 
+    def _unwrap_bounds(self):
+        index = np.arange(self.start, self.end + 1)
+        if type(self.period) is int:
+            groups = (index - self.start) // self.period
+        else:
+            if self.period == "isoweek":
+                # numpy weeks starts on thursdays since 1970-01-01 was a thursday, so weeks are shifted to mondays
+                units = (self.days[index].astype(int) + 3) // 7
+            else:
+                units = self.days[index].astype("datetime64[" + DateBase.calendar[self.period] + "]").astype(int)
+            groups = units - units[0]
+
+        groups = groups - self.offset
+        assert groups[-1] >= 0
+
+        labels = np.full(self.covered, -1)
+        labels[index] = np.where(groups >= 0, groups, -1)
+
+        first = np.flatnonzero(np.diff(groups, prepend=groups[0] - 1))
+        first = first[groups[first] >= 0]
+        bounds = np.append(index[first], self.end + 1)
+        return bounds, labels
+
     def _unwrap_period(self):
         if self.period is None:
             return 1
         elif type(self.period) is int:
             return self.period
         elif type(self.period) is str:
+            if self.period in DateBase.calendar:
+                return self.period
             try:
                 return DateBase.day[self.period]
             except KeyError:
@@ -113,14 +219,258 @@ class DateBase:
             delta = self.start - self.raw_start
             add_day = 1 if ((delta - timedelta(days=delta.days)) + self.raw_start).day != self.raw_start.day else 0
             return int(delta.days + add_day)
+        else:
+            return self.day_index(self.start)
 
     def _unwrap_end(self):
         if self.end is None:
             return self.covered - 1
         elif type(self.end) is int:
             return self.end
-        elif type(self.end) is datetime:
-            return (self.date - self.raw_start).days + 1
+        else:
+            return min(self.day_index(self.end), self.covered - 1)
+
+
+class Profiler:
+    """
+    Instrumentation of the evaluation chain
+
+    Functions decorated with profiled record their calls in the active profiler. A profiler is activated using it as a
+    context manager, when no profiler is active decorated functions are directly called so the instrumentation costs
+    a single attribute lookup per call.
+
+    For each instrumented function or section, the profiler records the number of calls, the cumulative wall time,
+    the wall time spent outside other instrumented functions and optionally the memory allocated by the calls.
+
+    Eg:
+    ```python
+    with Profiler(allocations=True) as profiler:
+        purchase.Plot.sorted(data)
+
+    print(profiler.summary())
+    profiler.dump("profile.json")
+    ```
+
+    Note that figures rendered in a process pool are only recorded as a whole by the batch stage.
+
+    Attributes:
+        allocations (bool): If true, memory allocations are traced using tracemalloc which slows down the calls
+        records (dict): Records indexed by function or section name. Each record is a dictionary with number of
+        "calls", cumulative "time" in seconds, "self" time in seconds and net "memory" allocated in bytes
+        active (Profiler): Profiler recording the calls, None if profiling is disabled
+    """
+
+    active = None
+
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.records = {}
+        self._stack = []
+        self._previous = None
+        self._tracing = False
+
+    def __enter__(self):
+        self._previous = Profiler.active
+        Profiler.active = self
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Profiler.active = self._previous
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def call(self, name, function, *args, **kwargs):
+        """Calls function with given arguments and records the call under name. Returns the result of the call"""
+        with self._record(name):
+            return function(*args, **kwargs)
+
+    @staticmethod
+    @contextmanager
+    def section(name):
+        """Context manager recording a section of code under name in the active profiler, if any"""
+        if Profiler.active is None:
+            yield
+        else:
+            with Profiler.active._record(name):
+                yield
+
+    @contextmanager
+    def _record(self, name):
+        self._stack.append(0.)
+        memory = tracemalloc.get_traced_memory()[0] if self.allocations else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if len(self._stack) > 0:
+                self._stack[-1] += elapsed
+
+            record = self.records.setdefault(name, {"calls": 0, "time": 0., "self": 0., "memory": 0})
+            record["calls"] += 1
+            record["time"] += elapsed
+            record["self"] += elapsed - children
+            if self.allocations:
+                record["memory"] += tracemalloc.get_traced_memory()[0] - memory
+
+    def summary(self, sort="time"):
+        """
+        Formats records as a table
+
+        Parameters:
+            sort (str): Record key used to sort the table by decreasing value
+
+        Returns:
+            Table with one line per record giving calls, cumulative and self time in ms, time per call in us and
+            allocated memory in MB
+        """
+        lines = ["{:<40}{:>10}{:>14}{:>14}{:>14}{:>12}".format("Name", "Calls", "Total (ms)", "Self (ms)",
+                                                              "Call (us)", "Memory (MB)")]
+        for name, record in sorted(self.records.items(), key=lambda x: -x[1][sort]):
+            lines.append("{:<40}{:>10d}{:>14.2f}{:>14.2f}{:>14.2f}{:>12.2f}".format(
+                name, record["calls"], 1.e3 * record["time"], 1.e3 * record["self"],
+                1.e6 * record["time"] / max(record["calls"], 1), record["memory"] / 1.e6))
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        """Writes records to filename as JSON"""
+        with open(filename, "w") as json_file:
+            json.dump(self.records, json_file, indent=4)
+
+
+def profiled(name=None):
+    """
+    Decorator recording the calls of a function in the active profiler
+
+    Parameters:
+        name (str): Name of the record, if None the qualified name of the function is used eg. "Planning.pax"
+    """
+
+    def decorator(function):
+        label = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = Profiler.active
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.call(label, function, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Labelled:
+    """
+    Array with labelled axes supporting group-by reductions
+
+    Each axis has a name and a list of labels. Labels can be tuples eg. (hub, destination) couples, which are expanded
+    as nested levels when converting to dictionaries. A boolean mask tells which cells are present: reductions only sum
+    the present cells and means divide by the number of present cells of each group.
+
+    Eg:
+    ```python
+    array = Labelled(values, [("line", [("HYD", "BLR"), ("HYD", "DEL")]), ("plane", ["HYD-BLR-1", "HYD-DEL-1"])])
+    array.reduce("line", keys=["HYD", "HYD"], name="hub").to_dict()  # {"HYD": {"HYD-BLR-1": .., "HYD-DEL-1": ..}}
+    ```
+
+    Attributes:
+        values (numpy.ndarray): Values of the cells
+        axes (list): Names of the axes
+        labels (dict): Labels of each axis indexed by axis name
+        mask (numpy.ndarray): True for the present cells
+    """
+
+    def __init__(self, values, axes, mask=None):
+        """
+        Constructs a Labelled array
+
+        Parameters:
+            values (array like): Values of the cells
+            axes (list): (name, labels) couples of each axis
+            mask (array like): Present cells, broadcast to the values shape. If None all the cells are present
+        """
+        self.axes = [name for name, _ in axes]
+        self.labels = {name: list(labels) for name, labels in axes}
+        shape = tuple(len(self.labels[name]) for name in self.axes)
+        self.values = np.asarray(values, dtype=float).reshape(shape)
+        self.mask = np.ones(shape, dtype=bool) if mask is None else np.broadcast_to(mask, shape)
+
+    @classmethod
+    def stack(cls, arrays, name, labels):
+        """Stacks arrays with the same axes along a new first axis, eg. the daily data of a week along "day" axis"""
+        axes = [(name, labels)] + [(axis, arrays[0].labels[axis]) for axis in arrays[0].axes]
+        return cls(np.stack([array.values for array in arrays]), axes, np.stack([array.mask for array in arrays]))
+
+    def reduce(self, axis, keys=None, name=None, mean=False):
+        """
+        Sums or averages the present cells along axes, eventually by groups
+
+        Parameters:
+            axis (str): Name of the axis to reduce, a list of names reduces several axes at once
+            keys (list): Group of each label of the axis eg. the model of each plane id. If None the axis is removed
+            name (str): Name of the axis of the groups. If None the name of the reduced axis is kept
+            mean (bool): Average over the present cells of each group, if False a sum is performed
+
+        Returns:
+            Reduced Labelled array, a group is present when one of its cells is present
+        """
+        reduced = [axis] if isinstance(axis, str) else list(axis)
+        indices = tuple(self.axes.index(name) for name in reduced)
+        values = np.where(self.mask, self.values, 0.)
+        if keys is None:
+            axes = [(name, self.labels[name]) for name in self.axes if name not in reduced]
+            values, count = values.sum(axis=indices), self.mask.sum(axis=indices)
+        else:
+            groups = list(dict.fromkeys(keys))
+            group_index = {groups[k]: k for k in range(0, len(groups))}
+            assign = np.zeros((len(groups), len(keys)))
+            assign[[group_index[key] for key in keys], np.arange(0, len(keys))] = 1.
+            k = indices[0]
+            axes = [(name, self.labels[name]) for name in self.axes]
+            axes[k] = (reduced[0] if name is None else name, groups)
+            values = np.moveaxis(np.tensordot(assign, values, axes=(1, k)), 0, k)
+            count = np.moveaxis(np.tensordot(assign, self.mask, axes=(1, k)), 0, k)
+
+        if mean:
+            values = np.divide(values, count, out=np.zeros(np.shape(values)), where=count > 0)
+        return Labelled(values, axes, np.asarray(count) > 0)
+
+    def to_dict(self, sparse=()):
+        """
+        Converts the array to nested dictionaries indexed by the labels of each axis
+
+        Parameters:
+            sparse (tuple): Names of the axes whose labels without any present cell are skipped
+
+        Returns:
+            Nested dictionaries of floats, a float when the array has no axis
+        """
+        return self._nest(0, self.values.tolist(), self.mask, sparse)
+
+    def _nest(self, level, values, mask, sparse):
+        if level == len(self.axes):
+            return values
+
+        axis = self.axes[level]
+        new_data = {}
+        for k in range(0, len(values)):
+            if axis in sparse and not mask[k].any():
+                continue
+
+            label = self.labels[axis][k]
+            nested = new_data
+            for key in (label[:-1] if isinstance(label, tuple) else ()):
+                nested = nested.setdefault(key, {})
+            nested[label[-1] if isinstance(label, tuple) else label] = self._nest(level + 1, values[k], mask[k], sparse)
+
+        return new_data
 
 
 class GenericPlot:
@@ -130,17 +480,34 @@ class GenericPlot:
     Used as interface with matplotlib for every result that can be computed with Data objects. Provides displays and
     save functions for any plot of the project.
 
+    Figures are described as jobs made of a drawing function and its arguments. When plots are not shown, jobs are
+    rendered headless on explicit Agg figures and batched across a pool of processes. When plots are shown, jobs are
+    rendered one after another using pyplot figures. The drawing functions must be defined at module level so they can
+    be sent to the processes of the pool.
+
+    Each batch of saved figures is recorded in the manifest file located at render/<plot_dir>/manifest.json along with
+    a hash of the drawing function, its arguments and the rendering options. When plots are saved but not shown,
+    figures whose hash matches the manifest and whose file exists are not rendered again.
+
     Attributes:
         save (bool): If true, aves the plots onto render/<plot_dir> when render() is called
         show (bool): If true, shows the plots when render() is called
+        workers (int): Number of processes used to render a batch of figures, if None the number of CPUs is used
+        refresh (bool): If true, renders every figure even if it is up to date
+        session (datetime): Start of the current session. Figures not requested since are considered stale
     """
 
     RENDER_ROOT = "render/"
+    MANIFEST = "manifest.json"
     save = True
     show = True
+    workers = None
+    refresh = False
+    session = datetime.now()
 
     @classmethod
-    def render(cls, xl=None, yl=None, title=None, date=None, legend=True):
+    @profiled()
+    def render(cls, xl=None, yl=None, title=None, date=None, legend=True, fig=None):
         """
         Generic plotting
 
@@ -152,30 +519,184 @@ class GenericPlot:
             title (str): Title of the plot
             date (datetime): Date of the plot. Used for file naming
             legend (bool): If true prints legend
+            fig (Figure): Figure to render, if None the current pyplot figure is rendered
+
+        Returns:
+            Path of the saved file, None if the plot is not saved
         """
-        dated_title = None
+        fig = plt.gcf() if fig is None else fig
+        ax = fig.gca()
+        filename = None
 
         if legend is True:
-            plt.legend()
+            ax.legend()
 
         if title is not None:
-            dated_title = title + "" if date is None else date.strftime("%m-%d-%y") + " " + title
-            plt.title(dated_title)
+            ax.set_title(cls.dated_title(title, date))
 
         if xl is not None:
-            plt.xlabel(xl)
+            ax.set_xlabel(xl)
 
         if yl is not None:
-            plt.ylabel(yl)
+            ax.set_ylabel(yl)
 
         if cls.save:
-            filename = "untitled" if title is None else dated_title.replace(" ", "_").lower()
-            plt.savefig(cls.RENDER_ROOT + filename)
+            filename = cls.filename(title, date)
+            os.makedirs(cls.RENDER_ROOT, exist_ok=True)
+            with Profiler.section("GenericPlot.savefig"):
+                fig.savefig(filename)
 
         if cls.show:
             plt.show()
 
-        plt.clf()
+        if plt.fignum_exists(getattr(fig, "number", None)):
+            plt.close(fig)
+
+        return filename
+
+    @classmethod
+    @profiled()
+    def batch(cls, draw, jobs):
+        """
+        Renders a batch of figures
+
+        Up to date figures are skipped, see class documentation.
+
+        Parameters:
+            draw (function): Module level function drawing a figure. Called as draw(fig, *args) where fig is the
+            Figure to draw on
+            jobs (list): List of (args, options) tuples. args is the tuple of arguments passed to draw and options is
+            the dictionary of keyword arguments passed to render eg. {"title": "Cash flow", "legend": False}
+
+        Returns:
+            filenames: List of the paths of saved files, including skipped ones
+        """
+        manifest = cls.manifest() if cls.save else {}
+        digests = {}
+        tasks = []
+        for args, options in jobs:
+            filename = cls.filename(options.get("title"), options.get("date"))
+            digest = cls.digest(draw, args, options)
+            digests[filename] = digest
+            if cls.save and not (cls.show or cls.refresh):
+                if manifest.get(filename, {}).get("hash") == digest and os.path.exists(filename):
+                    continue
+            tasks.append((cls, cls.save, cls.show, draw, args, options))
+
+        if cls.show or len(tasks) < 2:
+            list(map(_render_task, tasks))
+        else:
+            with ProcessPoolExecutor(cls.workers) as executor:
+                chunksize = max(1, len(tasks) // (4 * (cls.workers or os.cpu_count() or 1)))
+                list(executor.map(_render_task, tasks, chunksize=chunksize))
+
+        if not cls.save:
+            return []
+
+        cls.update_manifest(digests)
+        return list(digests.keys())
+
+    @classmethod
+    def clean(cls, before=None):
+        """
+        Removes stale figures
+
+        Stale figures are images located in render/<plot_dir> which are not recorded in the manifest or which have
+        not been requested since a given date. Their manifest entries are removed too.
+
+        Parameter:
+            before (datetime): Figures requested before this date are removed, if None session start date is used
+
+        Returns:
+            removed: List of the paths of removed files
+        """
+        before = (cls.session if before is None else before).isoformat()
+        manifest = cls.manifest()
+        removed = []
+        for filename in list(manifest.keys()):
+            if manifest[filename]["time"] < before:
+                del manifest[filename]
+
+        if not os.path.isdir(cls.RENDER_ROOT):
+            return removed
+
+        for name in os.listdir(cls.RENDER_ROOT):
+            filename = cls.RENDER_ROOT + name
+            if name.endswith(".png") and filename not in manifest:
+                os.remove(filename)
+                removed.append(filename)
+
+        with open(cls.RENDER_ROOT + cls.MANIFEST, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+
+        return removed
+
+    @staticmethod
+    def digest(draw, args, options):
+        """Returns an hexadecimal hash of a rendering job. See batch function for parameters"""
+        content = (draw.__module__, draw.__qualname__, args, sorted(options.items()))
+        return hashlib.sha1(pickle.dumps(content, protocol=4)).hexdigest()
+
+    @classmethod
+    def figure(cls):
+        """Creates a pyplot figure when showing plots, else creates an explicit figure on an Agg canvas"""
+        if cls.show:
+            return plt.figure()
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig
+
+    @classmethod
+    def filename(cls, title=None, date=None):
+        """Returns the path of the file where a plot with given title and date is saved"""
+        name = "untitled" if title is None else cls.dated_title(title, date).replace(" ", "_").lower()
+        return cls.RENDER_ROOT + name + ".png"
+
+    @classmethod
+    def update_manifest(cls, digests):
+        """
+        Records requested files in manifest
+
+        The manifest is a JSON dictionary indexed by the path of rendered files, each entry stores the hash of the
+        rendering job and the time of the last request.
+
+        Parameter:
+            digests (dict): Hash of the rendering jobs indexed by path of the requested files
+        """
+        manifest = cls.manifest()
+        now = datetime.now().isoformat()
+        for filename, digest in digests.items():
+            manifest[filename] = {"hash": digest, "time": now}
+
+        os.makedirs(cls.RENDER_ROOT, exist_ok=True)
+        with open(cls.RENDER_ROOT + cls.MANIFEST, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+
+    @classmethod
+    def manifest(cls):
+        """Returns the content of the manifest, an empty dictionary if there is no manifest"""
+        try:
+            with open(cls.RENDER_ROOT + cls.MANIFEST, "r") as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def dated_title(title, date=None):
+        """Returns title prefixed by the date formatted as MM-DD-YY"""
+        return title + "" if date is None else date.strftime("%m-%d-%y") + " " + title
+
+
+def _render_task(task):
+    cls, save, show, draw, args, options = task
+    if (cls.save, cls.show) != (save, show):
+        # Processes of the pool may not inherit class settings modified at runtime
+        cls.save, cls.show = save, show
+    fig = cls.figure()
+    with Profiler.section(draw.__name__):
+        draw(fig, *args)
+    return cls.render(fig=fig, **options)
 
 
 def get_enum_value():